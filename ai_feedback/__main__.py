@@ -1,14 +1,34 @@
 import argparse
+import contextlib
+import contextvars
+import functools
 import json
 import os
 import os.path
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-
-from . import code_processing, image_processing, text_processing
-from .helpers import arg_options
+from typing import ContextManager, FrozenSet, List, Optional, Tuple
+
+from .helpers import (
+    arg_options,
+    client_pool,
+    metrics,
+    pdf_cache,
+    pdf_text,
+    rate_limit,
+    response_cache,
+    template_registry,
+)
 from .helpers.constants import HELP_MESSAGES
+from .helpers.provider_batch import DeferredRequest
+from .helpers.run_stats import current_run, start_run
+from .helpers.streaming import StreamSink, current_sink, output_stream, streaming
+from .helpers.token_budget import PromptTooLargeError
+
+# Separates the requests and responses of the questions graded in one run, like in the image scope
+QUESTION_SEPARATOR = "\n\n---\n\n"
 
 _TYPE_BY_EXTENSION = {
     '.c': 'C',
@@ -40,6 +60,12 @@ def detect_submission_type(filename: str) -> str:
         sys.exit(1)
 
 
+@functools.lru_cache(maxsize=None)
+def _predefined_names(enum_class: type) -> FrozenSet[str]:
+    """Returns the values of an enum of pre-defined names, computed once per enum."""
+    return frozenset(arg_options.get_enum_values(enum_class))
+
+
 def load_markdown_template(template: str) -> str:
     """
     Loads the markdown template used for formatting output.
@@ -53,23 +79,21 @@ def load_markdown_template(template: str) -> str:
     Raises:
         SystemExit: If the template file is not found, the program will print an error and exit.
     """
-    try:
-        template_file = os.path.join(os.path.dirname(__file__), f"data/output/{template}.md")
-        with open(template_file, "r") as file:
-            return file.read()
-    except FileNotFoundError:
+    registered = template_registry.bundled("output", template)
+    if registered is None:
         print(f"Error: Markdown template file '{template}.md' not found.")
         sys.exit(1)
+    return registered.content
 
 
 def _load_content_with_fallback(
-    content_arg: str, predefined_values: list[str], predefined_subdir: str, content_type: str
+    content_arg: str, predefined_values: FrozenSet[str], predefined_subdir: str, content_type: str
 ) -> str:
     """Generic function to load content by trying pre-defined names first, then treating as file path.
 
     Args:
         content_arg (str): Either a pre-defined name or a file path
-        predefined_values (list[str]): List of valid pre-defined names
+        predefined_values (FrozenSet[str]): Valid pre-defined names
         predefined_subdir (str): Subdirectory for pre-defined files (e.g., "user", "system")
         content_type (str): Type of content for error messages (e.g., "prompt", "system prompt")
 
@@ -81,20 +105,17 @@ def _load_content_with_fallback(
     """
     # First, check if it's a pre-defined name
     if content_arg in predefined_values:
-        try:
-            file_path = os.path.join(os.path.dirname(__file__), f"data/prompts/{predefined_subdir}/{content_arg}.md")
-            with open(file_path, "r", encoding='utf-8') as file:
-                return file.read()
-        except FileNotFoundError:
+        registered = template_registry.bundled(predefined_subdir, content_arg)
+        if registered is None:
             print(
                 f"Error: Pre-defined {content_type} file '{content_arg}.md' not found in {predefined_subdir} subfolder."
             )
             sys.exit(1)
+        return registered.content
     else:
-        # Treat as a file path
+        # Treat as a file path, read again only if it changed since it was last loaded
         try:
-            with open(content_arg, "r", encoding='utf-8') as file:
-                return file.read()
+            return template_registry.load_file(content_arg).content
         except FileNotFoundError:
             print(f"Error: {content_type.title()} file '{content_arg}' not found.")
             sys.exit(1)
@@ -115,7 +136,7 @@ def load_prompt_content(prompt_arg: str) -> str:
     Raises:
         SystemExit: If the prompt cannot be loaded
     """
-    return _load_content_with_fallback(prompt_arg, arg_options.get_enum_values(arg_options.Prompt), "user", "prompt")
+    return _load_content_with_fallback(prompt_arg, _predefined_names(arg_options.Prompt), "user", "prompt")
 
 
 def load_system_prompt_content(system_prompt_arg: str) -> str:
@@ -131,7 +152,7 @@ def load_system_prompt_content(system_prompt_arg: str) -> str:
         SystemExit: If the system prompt cannot be loaded
     """
     return _load_content_with_fallback(
-        system_prompt_arg, arg_options.get_enum_values(arg_options.SystemPrompt), "system", "system prompt"
+        system_prompt_arg, _predefined_names(arg_options.SystemPrompt), "system", "system prompt"
     )
 
 
@@ -148,24 +169,17 @@ def load_marking_instructions_content(marking_instructions_path: str) -> str:
         SystemExit: If the file cannot be loaded
     """
     try:
-        with open(marking_instructions_path, "r", encoding='utf-8') as file:
-            return file.read()
+        return template_registry.load_file(marking_instructions_path, template=False).content
     except Exception:
         sys.exit(1)
 
 
-def main() -> int:
-    """
-    Parses command-line arguments to determine the type of submission, scope,
-    model, and output format. It loads prompts, delegates the processing to specialized
-    modules (image, text, or code), and handles output generation as markdown
-    or standard output.
+def add_common_arguments(parser: argparse.ArgumentParser) -> None:
+    """Adds the options shared by single-submission and batch runs to a parser.
 
-    Returns:
-        int: Exit status code (0 for success).
+    Args:
+        parser (argparse.ArgumentParser): The parser to add the options to.
     """
-    parser = argparse.ArgumentParser()
-
     parser.add_argument(
         "--submission_type",
         type=str,
@@ -188,7 +202,6 @@ def main() -> int:
         required=True,
         help=HELP_MESSAGES["scope"],
     )
-    parser.add_argument("--submission", type=str, required=True, help=HELP_MESSAGES["submission"])
     parser.add_argument("--solution", type=str, required=False, default="", help=HELP_MESSAGES["solution"])
     parser.add_argument("--question", type=str, required=False, help=HELP_MESSAGES["question"])
     parser.add_argument(
@@ -204,16 +217,16 @@ def main() -> int:
         required=False,
         help=HELP_MESSAGES["remote_model"],
     )
+    parser.add_argument("--test_output", type=str, required=False, default=None, help=HELP_MESSAGES["test_output"])
+    parser.add_argument("--submission_image", type=str, required=False, help=HELP_MESSAGES["submission_image"])
+    parser.add_argument("--solution_image", type=str, required=False, help=HELP_MESSAGES["solution_image"])
     parser.add_argument(
-        "--output",
+        "--image_output_dir",
         type=str,
         required=False,
-        default='',
-        help=HELP_MESSAGES["output"],
+        default="output_images",
+        help=HELP_MESSAGES["image_output_dir"],
     )
-    parser.add_argument("--test_output", type=str, required=False, default=None, help=HELP_MESSAGES["test_output"])
-    parser.add_argument("--submission_image", type=str, required=False, help=HELP_MESSAGES["submission_image"])
-    parser.add_argument("--solution_image", type=str, required=False, help=HELP_MESSAGES["solution_image"])
     parser.add_argument(
         "--output_template",
         required=False,
@@ -256,18 +269,242 @@ def main() -> int:
         default="",
         help=HELP_MESSAGES["model_options"],
     )
+    add_process_arguments(parser)
+    parser.add_argument(
+        "--max_concurrency", type=int, required=False, default=None, help=HELP_MESSAGES["max_concurrency"]
+    )
+    parser.add_argument(
+        "--prompt_layout",
+        type=str,
+        choices=arg_options.get_enum_values(arg_options.PromptLayout),
+        required=False,
+        default="default",
+        help=HELP_MESSAGES["prompt_layout"],
+    )
+    parser.add_argument(
+        "--context_policy",
+        type=str,
+        choices=arg_options.get_enum_values(arg_options.ContextPolicy),
+        required=False,
+        default="shrink",
+        help=HELP_MESSAGES["context_policy"],
+    )
+    parser.add_argument(
+        "--max_file_lines", type=int, required=False, default=None, help=HELP_MESSAGES["max_file_lines"]
+    )
+    parser.add_argument(
+        "--max_file_bytes", type=int, required=False, default=None, help=HELP_MESSAGES["max_file_bytes"]
+    )
+    parser.add_argument("--chunk_lines", type=int, required=False, default=None, help=HELP_MESSAGES["chunk_lines"])
+    parser.add_argument(
+        "--submission_view",
+        type=str,
+        choices=arg_options.get_enum_values(arg_options.SubmissionView),
+        required=False,
+        default="full",
+        help=HELP_MESSAGES["submission_view"],
+    )
+    parser.add_argument("--starter", type=str, required=False, default=None, help=HELP_MESSAGES["starter"])
+    parser.add_argument(
+        "--diff_context",
+        type=int,
+        required=False,
+        default=None,
+        help=HELP_MESSAGES["diff_context"],
+    )
+    parser.add_argument("--stream", action="store_true", help=HELP_MESSAGES["stream"])
+    parser.add_argument("--rate_limit", type=str, required=False, default="", help=HELP_MESSAGES["rate_limit"])
+    parser.add_argument("--profile", type=str, required=False, default=None, help=HELP_MESSAGES["profile"])
+    parser.add_argument("--metrics", type=str, required=False, default=None, help=HELP_MESSAGES["metrics"])
+    parser.add_argument(
+        "--metrics_format",
+        type=str,
+        choices=metrics.METRICS_FORMATS,
+        required=False,
+        default="jsonl",
+        help=HELP_MESSAGES["metrics_format"],
+    )
 
-    args = parser.parse_args()
 
-    if args.model_options:
-        args.model_options = dict(pair.split('=') for pair in args.model_options.split(','))
-    else:
-        args.model_options = {}
+def add_process_arguments(parser: argparse.ArgumentParser) -> None:
+    """Adds the options of state shared by the whole process (caches, PDF extraction, connection pools) to a parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser to add the options to.
+    """
+    parser.add_argument(
+        "--cache",
+        type=str,
+        choices=response_cache.CACHE_MODES,
+        required=False,
+        default="use",
+        help=HELP_MESSAGES["cache"],
+    )
+    parser.add_argument("--cache_dir", type=str, required=False, default=None, help=HELP_MESSAGES["cache_dir"])
+    parser.add_argument("--cache_max_size", type=int, required=False, default=512, help=HELP_MESSAGES["cache_max_size"])
+    parser.add_argument("--cache_ttl", type=float, required=False, default=168, help=HELP_MESSAGES["cache_ttl"])
+    parser.add_argument("--pdf_cache_dir", type=str, required=False, default=None, help=HELP_MESSAGES["pdf_cache_dir"])
+    parser.add_argument(
+        "--pdf_cache_max_size", type=int, required=False, default=256, help=HELP_MESSAGES["pdf_cache_max_size"]
+    )
+    parser.add_argument(
+        "--pdf_backend",
+        type=str,
+        choices=pdf_text.PDF_BACKENDS,
+        required=False,
+        default=None,
+        help=HELP_MESSAGES["pdf_backend"],
+    )
+    parser.add_argument("--pdf_workers", type=int, required=False, default=None, help=HELP_MESSAGES["pdf_workers"])
+    parser.add_argument(
+        "--max_connections", type=int, required=False, default=None, help=HELP_MESSAGES["max_connections"]
+    )
+    parser.add_argument("--max_keepalive", type=int, required=False, default=None, help=HELP_MESSAGES["max_keepalive"])
+
+
+def parse_model_options(model_options: str) -> dict:
+    """Parses the comma-separated key=value pairs given to --model_options.
+
+    Args:
+        model_options (str): The raw option string, e.g. "max_tokens=1200,temperature=0.4".
+
+    Returns:
+        dict: The options keyed by name, with string values.
+    """
+    if model_options:
+        return dict(pair.split('=') for pair in model_options.split(','))
+    return {}
+
+
+# Options of state shared by the whole process, by name: see add_process_arguments(), and --rate_limit
+PROCESS_OPTIONS = (
+    "cache",
+    "cache_dir",
+    "cache_max_size",
+    "cache_ttl",
+    "pdf_cache_dir",
+    "pdf_cache_max_size",
+    "pdf_backend",
+    "pdf_workers",
+    "max_connections",
+    "max_keepalive",
+    "rate_limit",
+)
+# The process-wide options a daemon applied when it started, or None outside of a daemon
+_fixed_options: Optional[dict] = None
+
+
+def configure_process(args) -> None:
+    """Applies the options of state shared by the whole process: caches, PDF extraction, connection pools
+    and rate limits.
+
+    A daemon serves several runs at the same time, so it applies its own options once when it starts
+    (see fix_process_options()) and they are not changed by the runs it serves.
+
+    Args:
+        args: Parsed argument namespace.
+
+    Raises:
+        SystemExit: If --rate_limit is malformed.
+    """
+    if _fixed_options is None:
+        configure_caches(args)
+        configure_clients(args)
+
+
+def fix_process_options(args) -> None:
+    """Applies the process-wide options of a daemon, for every run it serves.
+
+    Args:
+        args: Namespace parsed by a parser with add_process_arguments(); rate limits cannot be set.
+    """
+    global _fixed_options
+    configure_caches(args)
+    client_pool.configure(max_connections=args.max_connections, max_keepalive_connections=args.max_keepalive)
+    _fixed_options = {name: getattr(args, name, "") for name in PROCESS_OPTIONS}
+
+
+def conflicting_process_options(argv: List[str]) -> List[str]:
+    """Returns the process-wide options that argv sets to other values than the daemon applied.
+
+    Args:
+        argv (List[str]): Arguments of a run, without the "batch" subcommand.
+
+    Returns:
+        List[str]: The options, e.g. ["--cache"]; always empty outside of a daemon.
+
+    Raises:
+        SystemExit: If one of the options has an invalid value.
+    """
+    if _fixed_options is None:
+        return []
+    parser = argparse.ArgumentParser(add_help=False)
+    add_process_arguments(parser)
+    parser.add_argument("--rate_limit", type=str)
+    # Only the options argv sets are parsed
+    for action in parser._actions:
+        action.default = argparse.SUPPRESS
+    given, _ = parser.parse_known_args(argv)
+    return [f"--{name}" for name, value in vars(given).items() if value != _fixed_options[name]]
+
+
+def configure_caches(args) -> None:
+    """Applies the cache options to the process-wide response cache and cache of parsed PDFs, and
+    the options of PDF text extraction.
+
+    Args:
+        args: Parsed argument namespace.
+    """
+    response_cache.configure(
+        mode=args.cache,
+        directory=args.cache_dir,
+        max_bytes=args.cache_max_size * 1024 * 1024,
+        ttl=args.cache_ttl * 3600,
+    )
+    pdf_cache.configure(
+        enabled=args.pdf_cache_max_size > 0,
+        directory=args.pdf_cache_dir,
+        max_bytes=args.pdf_cache_max_size * 1024 * 1024,
+    )
+    pdf_text.configure(backend=args.pdf_backend, workers=args.pdf_workers)
+
+
+def configure_clients(args) -> None:
+    """Applies the connection pool and rate limit options to the shared provider clients.
+
+    Args:
+        args: Parsed argument namespace.
+
+    Raises:
+        SystemExit: If --rate_limit is malformed.
+    """
+    client_pool.configure(max_connections=args.max_connections, max_keepalive_connections=args.max_keepalive)
+    if args.rate_limit:
+        try:
+            overrides = {name: float(value) for name, value in parse_model_options(args.rate_limit).items()}
+            for name in ("max_concurrency", "max_retries"):
+                if name in overrides:
+                    overrides[name] = int(overrides[name])
+            rate_limit.configure(args.model, **overrides)
+        except ValueError as e:
+            print(f"Error: invalid --rate_limit '{args.rate_limit}': {e}")
+            sys.exit(1)
+
 
-    # Auto-detect submission type if not provided
-    if args.submission_type is None:
-        args.submission_type = detect_submission_type(args.submission)
+def load_prompts(args) -> Tuple[str, str, Optional[str]]:
+    """Loads the user prompt, system prompt and marking instructions selected by the arguments.
 
+    These only depend on the assignment, so batch runs load them once and share them between submissions.
+
+    Args:
+        args: Parsed argument namespace.
+
+    Returns:
+        Tuple[str, str, Optional[str]]: The prompt content, the system instructions and the marking instructions.
+
+    Raises:
+        SystemExit: If a prompt cannot be loaded or does not match the selected scope.
+    """
     prompt_content = ""
     system_instructions = load_system_prompt_content(args.system_prompt)
 
@@ -277,8 +514,7 @@ def main() -> int:
 
     if args.prompt:
         # Only validate scope for pre-defined prompts (not for arbitrary file paths)
-        predefined_prompts = arg_options.get_enum_values(arg_options.Prompt)
-        if args.prompt in predefined_prompts:
+        if args.prompt in _predefined_names(arg_options.Prompt):
             if not args.prompt.startswith("image") and args.scope == "image":
                 print("Error: The prompt must start with 'image'. Please re-run the command with a valid prompt.")
                 sys.exit(1)
@@ -294,38 +530,359 @@ def main() -> int:
     if args.prompt_text:
         prompt_content += args.prompt_text
 
+    return prompt_content, system_instructions, marking_instructions
+
+
+def generate_feedback(
+    args, prompt_content: str, system_instructions: str, marking_instructions: Optional[str] = None
+) -> Tuple[str, str]:
+    """Delegates a single submission to the processing module for the selected scope.
+
+    When --question names several questions (a comma-separated list or "all"), the code and text
+    scopes prompt the model once per question, in order, and the requests and responses are
+    joined like those of the image scope's questions. Without a question, --chunk_lines has them
+    grade a long submission in parts, see _generate_chunked().
+
+    Args:
+        args: Parsed argument namespace for the submission.
+        prompt_content (str): The user prompt template.
+        system_instructions (str): Instructions for the model.
+        marking_instructions (str, optional): Marking instructions for the {marking_instructions} placeholder.
+
+    Returns:
+        Tuple[str, str]: The request sent to the model and the model's response.
+
+    Raises:
+        SystemExit: If --question is "all" and the files have no question headings, or names several
+            questions of a code scope submission that is not a notebook.
+    """
+    from .helpers.template_utils import resolve_questions
+
+    questions = None
+    if args.scope != "image" and args.question:
+        questions = resolve_questions(args.question, _question_files(args))
+    if questions is None:
+        if args.scope != "image" and not args.question and args.chunk_lines:
+            return _generate_chunked(args, prompt_content, system_instructions, marking_instructions)
+        return _generate_for_scope(args, prompt_content, system_instructions, marking_instructions)
+    if args.scope == "code" and args.submission_type != "jupyter":
+        # Python files have no question headings, so every question would send the whole file again
+        print("Error: several questions can only be selected for jupyter submissions in the code scope.")
+        sys.exit(1)
+    if not questions:
+        print("No question headings found in the assignment files.")
+        sys.exit(1)
+
+    requests = []
+    responses = []
+    deferred: Optional[DeferredRequest] = None
+    sink = current_sink()
+    for index, question in enumerate(questions):
+        if sink is not None and index > 0:
+            sink.write(QUESTION_SEPARATOR)
+        written = sink.written if sink is not None else 0
+        try:
+            request, response = _generate_for_scope(
+                argparse.Namespace(**{**vars(args), "question": question}),
+                prompt_content,
+                system_instructions,
+                marking_instructions,
+            )
+        except DeferredRequest as e:
+            # Record the requests of every question for the provider batch job before stopping
+            deferred = deferred or e
+            continue
+        if sink is not None and sink.written == written:
+            # Cached or non-streaming responses arrive all at once
+            sink.write(response)
+        requests.append(request)
+        responses.append(response)
+    if deferred is not None:
+        raise deferred
+    return QUESTION_SEPARATOR.join(requests), QUESTION_SEPARATOR.join(responses)
+
+
+def _generate_chunked(
+    args, prompt_content: str, system_instructions: str, marking_instructions: Optional[str] = None
+) -> Tuple[str, str]:
+    """Grades a submission longer than --chunk_lines lines in parts, then merges their feedback.
+
+    The submission is split at its natural boundaries (see helpers/chunking.py). Every chunk is
+    graded concurrently, at most --max_concurrency at a time, with the prompt rendering only its
+    lines, numbered as in the whole file, and the sections of the solution with the same titles
+    (or the whole solution if it has none). A final request combines the feedback on every chunk
+    into one response, which is the only one streamed.
+
+    Args:
+        args: Parsed argument namespace for the submission.
+        prompt_content (str): The user prompt template.
+        system_instructions (str): Instructions for the model.
+        marking_instructions (str, optional): Marking instructions for the {marking_instructions} placeholder.
+
+    Returns:
+        Tuple[str, str]: The requests for every chunk and the merge request, joined like those of
+            several questions, and the merged response.
+    """
+    from .helpers.chunking import (
+        matching_lines,
+        merge_prompt,
+        section_spans,
+        split_file,
+    )
+
+    solution, submission = _question_files(args)
+    if submission is None or not submission.is_file():
+        return _generate_for_scope(args, prompt_content, system_instructions, marking_instructions)
+    chunks = split_file(submission, args.chunk_lines)
+    if len(chunks) <= 1:
+        return _generate_for_scope(args, prompt_content, system_instructions, marking_instructions)
+    spans = section_spans(solution) if solution is not None and solution.is_file() else {}
+    current_run().set("chunks", len(chunks))
+
+    def grade(chunk) -> Tuple[str, str]:
+        line_ranges = {"submission": (chunk.first, chunk.last)}
+        solution_lines = matching_lines(spans, chunk.titles)
+        if solution_lines is not None:
+            line_ranges["solution"] = solution_lines
+        chunk_args = argparse.Namespace(**{**vars(args), "line_ranges": line_ranges})
+        # Only the merged response is streamed
+        with streaming(None):
+            return _generate_for_scope(chunk_args, prompt_content, system_instructions, marking_instructions)
+
+    workers = min(args.max_concurrency or len(chunks), len(chunks))
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, grade, chunk) for chunk in chunks]
+        results = []
+        deferred: Optional[DeferredRequest] = None
+        for future in futures:
+            try:
+                results.append(future.result())
+            except DeferredRequest as e:
+                # Record the requests of every chunk for the provider batch job before stopping
+                deferred = deferred or e
+    if deferred is not None:
+        raise deferred
+
+    merge_args = argparse.Namespace(**{**vars(args), "prompt_layout": "default", "line_ranges": None})
+    merge_request, response = _generate_for_scope(
+        merge_args,
+        merge_prompt(prompt_content, submission.name, chunks, [response for _, response in results]),
+        system_instructions,
+        marking_instructions,
+    )
+    return QUESTION_SEPARATOR.join([request for request, _ in results] + [merge_request]), response
+
+
+def _question_files(args) -> List[Optional[Path]]:
+    """Returns the solution and submission files whose headings --question refers to, as the scopes read them."""
+    files: List[Optional[Path]] = []
+    for path in (args.solution, args.submission):
+        if path and args.scope == "code" and args.submission_type == "jupyter" and path.endswith(".ipynb"):
+            from .code_processing import ensure_txt_file
+            from .helpers.file_converter import rename_files
+
+            ensure_txt_file(path, rename_files)
+            path = path.replace(".ipynb", ".txt")
+        files.append(Path(path) if path else None)
+    return files
+
+
+def _generate_for_scope(
+    args, prompt_content: str, system_instructions: str, marking_instructions: Optional[str] = None
+) -> Tuple[str, str]:
+    """Delegates a single submission (and question) to the processing module for the selected scope.
+
+    Args:
+        args: Parsed argument namespace for the submission.
+        prompt_content (str): The user prompt template.
+        system_instructions (str): Instructions for the model.
+        marking_instructions (str, optional): Marking instructions for the {marking_instructions} placeholder.
+
+    Returns:
+        Tuple[str, str]: The request sent to the model and the model's response.
+    """
+    # Scope modules are imported on demand so that a run only loads the libraries its scope needs
     if args.scope == "image":
+        from . import image_processing
+
         prompt = {"prompt_content": prompt_content}
-        request, response = image_processing.process_image(args, prompt, system_instructions, marking_instructions)
+        return image_processing.process_image(args, prompt, system_instructions, marking_instructions)
     elif args.scope == "text":
-        request, response = text_processing.process_text(
-            args, prompt_content, system_instructions, marking_instructions
-        )
+        from . import text_processing
+
+        return text_processing.process_text(args, prompt_content, system_instructions, marking_instructions)
     else:
-        request, response = code_processing.process_code(
-            args, prompt_content, system_instructions, marking_instructions
-        )
-
-    markdown_template = load_markdown_template(args.output_template)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_text = markdown_template.format(
-        question=args.question or "N/A",
-        model=args.model,
-        request=request,
-        response=response,
-        timestamp=timestamp,
-        submission=args.submission,
+        from . import code_processing
+
+        return code_processing.process_code(args, prompt_content, system_instructions, marking_instructions)
+
+
+def _template_fields(args) -> dict:
+    """Returns the values of the output template placeholders that do not depend on the response."""
+    return {
+        "question": args.question or "N/A",
+        "model": args.model,
+        "timestamp": datetime.now().strftime("%Y%m%d_%H%M%S"),
+        "submission": args.submission,
+    }
+
+
+def format_output(args, request: str, response: str, markdown_template: Optional[str] = None) -> str:
+    """Formats a request and response with the selected output template.
+
+    Args:
+        args: Parsed argument namespace for the submission.
+        request (str): The request sent to the model.
+        response (str): The model's response.
+        markdown_template (str, optional): An already loaded template; loaded from --output_template if omitted.
+
+    Returns:
+        str: The formatted output text.
+    """
+    from .helpers.template_utils import format_template
+
+    if markdown_template is None:
+        markdown_template = load_markdown_template(args.output_template)
+    return format_template(
+        markdown_template,
+        {**_template_fields(args), "request": request, "response": response, "metadata": current_run().format()},
     )
 
-    if args.output:
-        output_path = Path(args.output)
+
+def write_output(output_text: str, output: str) -> None:
+    """Writes formatted output to a file, or to stdout if no output path is given.
+
+    Args:
+        output_text (str): The formatted output text.
+        output (str): The file path to write to, or an empty string for stdout.
+    """
+    if output:
+        output_path = Path(output)
         output_path.parent.mkdir(parents=True, exist_ok=True)
         with open(output_path, "w", encoding="utf-8") as f:
             f.write(output_text)
     else:
         print(output_text)
+
+
+def run_feedback(
+    args,
+    prompt_content: str,
+    system_instructions: str,
+    marking_instructions: Optional[str] = None,
+    markdown_template: Optional[str] = None,
+) -> None:
+    """Generates feedback for one submission and writes it with the output template.
+
+    With --stream, the response is written to the output file (or stdout) as it is generated
+    instead of once it is complete.
+
+    Args:
+        args: Parsed argument namespace for the submission.
+        prompt_content (str): The user prompt template.
+        system_instructions (str): Instructions for the model.
+        marking_instructions (str, optional): Marking instructions for the {marking_instructions} placeholder.
+        markdown_template (str, optional): An already loaded template; loaded from --output_template if omitted.
+    """
+    if not args.stream:
+        request, response = generate_feedback(args, prompt_content, system_instructions, marking_instructions)
+        with metrics.stage("write_output"):
+            write_output(format_output(args, request, response, markdown_template), args.output)
+        return
+
+    if markdown_template is None:
+        markdown_template = load_markdown_template(args.output_template)
+    with contextlib.ExitStack() as stack:
+        if args.output:
+            output_path = Path(args.output)
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            stream = stack.enter_context(open(output_path, "w", encoding="utf-8"))
+        else:
+            # Bound to the run's context, since tokens are written from the shared event loop's thread
+            stream = output_stream()
+        sink = stack.enter_context(streaming(StreamSink(stream, markdown_template, **_template_fields(args))))
+        request, response = generate_feedback(args, prompt_content, system_instructions, marking_instructions)
+        sink.finish(request, response)
+    if not args.output:
+        # Match the trailing newline print() adds to non-streamed output
+        print()
+
+
+def profiled(args) -> ContextManager:
+    """Returns a context manager that profiles the run into the --profile directory, or does nothing without it.
+
+    Args:
+        args: Parsed argument namespace.
+    """
+    if not args.profile:
+        return contextlib.nullcontext()
+    from .helpers.profiling import profile_run
+
+    return profile_run(args.profile)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """
+    Parses command-line arguments to determine the type of submission, scope,
+    model, and output format. It loads prompts, delegates the processing to specialized
+    modules (image, text, or code), and handles output generation as markdown
+    or standard output.
+
+    Running `python -m ai_feedback batch ...` grades many submissions in one process instead,
+    see `ai_feedback.batch`, and `python -m ai_feedback serve` starts a long-running daemon,
+    see `ai_feedback.daemon`.
+
+    Args:
+        argv (list[str], optional): Command-line arguments; defaults to sys.argv[1:].
+
+    Returns:
+        int: Exit status code (0 for success).
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == "batch":
+        from . import batch
+
+        return batch.main(argv[1:])
+    if argv and argv[0] == "serve":
+        from . import daemon
+
+        return daemon.main(argv[1:])
+
+    parser = argparse.ArgumentParser()
+    add_common_arguments(parser)
+    parser.add_argument("--submission", type=str, required=True, help=HELP_MESSAGES["submission"])
+    parser.add_argument(
+        "--output",
+        type=str,
+        required=False,
+        default='',
+        help=HELP_MESSAGES["output"],
+    )
+
+    args = parser.parse_args(argv)
+    args.model_options = parse_model_options(args.model_options)
+
+    with profiled(args):
+        # Auto-detect submission type if not provided
+        if args.submission_type is None:
+            args.submission_type = detect_submission_type(args.submission)
+
+        configure_process(args)
+        prompt_content, system_instructions, marking_instructions = load_prompts(args)
+        if args.metrics:
+            metrics.start_metrics(args.metrics, args.metrics_format)
+        start_run()
+        try:
+            with metrics.submission_metrics(args):
+                run_feedback(args, prompt_content, system_instructions, marking_instructions)
+        except PromptTooLargeError as e:
+            print(f"Error: {e}")
+            return 1
+        finally:
+            metrics.finish_metrics()
     return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""
+Batch grading mode.
+
+Grades a whole directory, glob or JSONL manifest of submissions in one process. The prompt,
+system prompt, marking instructions and solution are loaded once per assignment and shared by
+every submission, and submissions are processed concurrently by a pool of worker threads
+(the work is dominated by waiting on the LLM provider).
+
+With --backend provider_batch, the requests are sent as one job through the provider's batch API
+instead (see ai_feedback.batch_api).
+
+Usage:
+    python -m ai_feedback batch --submissions submissions/ --output_dir feedback/ --workers 8 \\
+        --scope code --model openai --prompt code_table --solution solution.py
+"""
+
+import argparse
+import contextvars
+import copy
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from . import __main__ as cli
+from .code_processing import ensure_txt_file
+from .helpers import metrics
+from .helpers.constants import HELP_MESSAGES
+from .helpers.file_converter import rename_files
+from .helpers.provider_batch import DeferredRequest, active_batch
+from .helpers.run_stats import start_run
+
+# Keys a manifest line may set for its submission, overriding the batch-wide options
+MANIFEST_KEYS = ("submission", "output", "submission_type", "question", "test_output", "submission_image")
+
+
+class BatchResult(NamedTuple):
+    """The outcome of grading one submission in a batch."""
+
+    submission: str
+    output: str
+    status: str
+    error: Optional[str]
+    seconds: float
+    # The provider batch job a deferred submission's request belongs to, if it was submitted
+    batch_id: Optional[str] = None
+
+
+def collect_submissions(source: str, pattern: str = "*") -> List[Dict[str, Any]]:
+    """Expands a batch source into one entry per submission.
+
+    Args:
+        source (str): A directory (searched recursively), a glob pattern, a JSONL manifest
+            (one object per line with at least a "submission" key) or a single file.
+        pattern (str): Glob pattern for file names when source is a directory.
+
+    Returns:
+        List[Dict[str, Any]]: Entries with a "submission" path and any per-submission overrides.
+
+    Raises:
+        FileNotFoundError: If the source matches no submissions.
+        ValueError: If a manifest line is not a JSON object with a "submission" key.
+    """
+    entries: List[Dict[str, Any]] = []
+    if os.path.isdir(source):
+        known_extensions = set(cli._TYPE_BY_EXTENSION)
+        for path in sorted(Path(source).rglob(pattern)):
+            if path.is_file() and path.suffix.lower() in known_extensions:
+                entries.append({"submission": str(path)})
+    elif source.endswith(".jsonl") and os.path.isfile(source):
+        with open(source, "r", encoding="utf-8") as manifest:
+            for line_number, line in enumerate(manifest, start=1):
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if not isinstance(entry, dict) or "submission" not in entry:
+                    raise ValueError(f"Manifest line {line_number} must be an object with a 'submission' key.")
+                entries.append({key: entry[key] for key in MANIFEST_KEYS if key in entry})
+    elif os.path.isfile(source):
+        entries.append({"submission": source})
+    else:
+        entries.extend({"submission": path} for path in sorted(glob.glob(source, recursive=True)))
+
+    if not entries:
+        raise FileNotFoundError(f"No submissions found for '{source}'.")
+    return entries
+
+
+def assign_output_paths(entries: List[Dict[str, Any]], output_dir: str) -> None:
+    """Gives every entry without an explicit "output" a unique markdown file under output_dir.
+
+    Output paths mirror the submissions' paths relative to their common directory, so that
+    per-student folders containing identically named files do not overwrite each other.
+
+    Args:
+        entries (List[Dict[str, Any]]): Entries returned by collect_submissions, updated in place.
+        output_dir (str): The directory to write outputs to.
+    """
+    paths = [os.path.abspath(entry["submission"]) for entry in entries]
+    common = os.path.commonpath(paths) if len(paths) > 1 else os.path.dirname(paths[0])
+    if common in paths:
+        common = os.path.dirname(common)
+    for entry, path in zip(entries, paths):
+        if not entry.get("output"):
+            relative = Path(os.path.relpath(path, common))
+            entry["output"] = str(Path(output_dir, relative).with_suffix(".md"))
+
+
+def run_batch(args, entries: List[Dict[str, Any]], workers: int = 4) -> List[BatchResult]:
+    """Grades every entry concurrently, sharing the per-assignment setup.
+
+    Args:
+        args: Parsed batch argument namespace with the batch-wide options.
+        entries (List[Dict[str, Any]]): Entries with "submission" and "output" paths and optional overrides.
+        workers (int): Number of submissions graded at the same time.
+
+    Returns:
+        List[BatchResult]: One result per entry, in the same order as the entries.
+    """
+    cli.configure_process(args)
+    prompt_content, system_instructions, marking_instructions = cli.load_prompts(args)
+    markdown_template = cli.load_markdown_template(args.output_template)
+
+    # Convert the shared solution once up front rather than racing to do it in every worker
+    if args.solution and args.solution.endswith(".ipynb") and args.scope == "code":
+        ensure_txt_file(args.solution, rename_files)
+
+    def grade(entry: Dict[str, Any]) -> BatchResult:
+        start = time.perf_counter()
+        submission_args = copy.copy(args)
+        for key, value in entry.items():
+            setattr(submission_args, key, value)
+        if args.scope == "image":
+            # Each submission extracts its images into its own directory
+            submission_args.image_output_dir = str(Path(entry["output"]).with_suffix("")) + "_images"
+
+        start_run()
+        try:
+            if submission_args.submission_type is None:
+                submission_args.submission_type = cli.detect_submission_type(submission_args.submission)
+            cli.run_feedback(
+                submission_args, prompt_content, system_instructions, marking_instructions, markdown_template
+            )
+        except DeferredRequest:
+            seconds = time.perf_counter() - start
+            job = active_batch()
+            batch_id = job.batch_id if job is not None else None
+            return BatchResult(entry["submission"], entry["output"], "deferred", None, seconds, batch_id)
+        except (Exception, SystemExit) as e:
+            seconds = time.perf_counter() - start
+            metrics.record_submission(submission_args, "error", seconds)
+            return BatchResult(entry["submission"], entry["output"], "error", str(e) or type(e).__name__, seconds)
+        seconds = time.perf_counter() - start
+        metrics.record_submission(submission_args, "ok", seconds)
+        return BatchResult(entry["submission"], entry["output"], "ok", None, seconds)
+
+    # Each submission runs in a copy of the caller's context, so an active provider batch is seen by every worker
+    contexts = [contextvars.copy_context() for _ in entries]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(lambda context, entry: context.run(grade, entry), contexts, entries))
+
+
+def grade_submissions(
+    submissions: str, output_dir: str, scope: str, model: str, workers: int = 4, **options: Any
+) -> List[BatchResult]:
+    """Python entry point for batch grading.
+
+    Args:
+        submissions (str): Directory, glob pattern or JSONL manifest of submission files.
+        output_dir (str): Directory where one output file per submission is written.
+        scope (str): The processing scope (code, text or image).
+        model (str): The model to use.
+        workers (int): Number of submissions graded at the same time.
+        **options: Any other command-line option by name, e.g. prompt="code_table", solution="solution.py".
+
+    Returns:
+        List[BatchResult]: One result per submission.
+    """
+    argv = ["--submissions", submissions, "--output_dir", output_dir, "--scope", scope, "--model", model]
+    for name, value in options.items():
+        if value is not None:
+            argv += [f"--{name}", str(value)]
+    args = build_parser().parse_args(argv)
+    args.model_options = cli.parse_model_options(args.model_options)
+
+    entries = collect_submissions(args.submissions, args.pattern)
+    assign_output_paths(entries, args.output_dir)
+    if args.metrics:
+        metrics.start_metrics(args.metrics, args.metrics_format)
+    try:
+        if args.backend == "provider_batch":
+            from .batch_api import run_provider_batch
+
+            return run_provider_batch(args, entries, workers, args.poll_interval)
+        return run_batch(args, entries, workers)
+    finally:
+        metrics.finish_metrics()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Builds the argument parser for the batch subcommand."""
+    parser = argparse.ArgumentParser(prog="python -m ai_feedback batch")
+    cli.add_common_arguments(parser)
+    parser.add_argument("--submissions", type=str, required=True, help=HELP_MESSAGES["submissions"])
+    parser.add_argument("--output_dir", type=str, required=True, help=HELP_MESSAGES["output_dir"])
+    parser.add_argument("--workers", type=int, required=False, default=4, help=HELP_MESSAGES["workers"])
+    parser.add_argument("--pattern", type=str, required=False, default="*", help=HELP_MESSAGES["pattern"])
+    parser.add_argument(
+        "--backend",
+        type=str,
+        choices=["live", "provider_batch"],
+        required=False,
+        default="live",
+        help=HELP_MESSAGES["backend"],
+    )
+    parser.add_argument(
+        "--poll_interval", type=float, required=False, default=60.0, help=HELP_MESSAGES["poll_interval"]
+    )
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Parses batch arguments, grades every submission and prints a one-line summary per submission.
+
+    Args:
+        argv (List[str], optional): Command-line arguments after the "batch" subcommand.
+
+    Returns:
+        int: Exit status code (0 if every submission was graded or deferred to a provider batch, 1 otherwise).
+    """
+    args = build_parser().parse_args(argv)
+    args.model_options = cli.parse_model_options(args.model_options)
+
+    try:
+        entries = collect_submissions(args.submissions, args.pattern)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}")
+        return 1
+    assign_output_paths(entries, args.output_dir)
+
+    if args.metrics:
+        metrics.start_metrics(args.metrics, args.metrics_format)
+    start = time.perf_counter()
+    try:
+        with cli.profiled(args):
+            if args.backend == "provider_batch":
+                from .batch_api import run_provider_batch
+
+                try:
+                    results = run_provider_batch(args, entries, args.workers, args.poll_interval)
+                except ValueError as e:
+                    print(f"Error: {e}")
+                    return 1
+            else:
+                results = run_batch(args, entries, args.workers)
+    finally:
+        recorder = metrics.finish_metrics()
+    elapsed = time.perf_counter() - start
+
+    failures = deferred = 0
+    for result in results:
+        if result.status == "ok":
+            print(f"[ok] {result.submission} -> {result.output} ({result.seconds:.1f}s)")
+        elif result.status == "deferred":
+            # Waiting on a provider batch job, which a later run picks up; not a failure
+            deferred += 1
+            job = f" (batch id {result.batch_id})" if result.batch_id else ""
+            print(f"[deferred] {result.submission}{job}")
+        else:
+            failures += 1
+            print(f"[error] {result.submission}: {result.error}", file=sys.stderr)
+    graded = len(results) - failures - deferred
+    summary = f"Graded {graded}/{len(results)} submissions in {elapsed:.1f}s"
+    print(f"{summary}, {deferred} deferred to a provider batch." if deferred else f"{summary}.")
+    if recorder is not None and recorder.records:
+        print(f"Stage times (written to {recorder.path}):", file=sys.stderr)
+        print(metrics.format_summary(recorder.summary()), file=sys.stderr)
+    return 1 if failures else 0
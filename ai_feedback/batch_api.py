@@ -0,0 +1,273 @@
+"""
+Provider batch backend for batch grading.
+
+Grades the submissions of a batch run through the OpenAI Batch API or Anthropic Message Batches
+instead of sending one request per submission. Batch jobs cost less and have far higher
+throughput limits, in exchange for results that arrive within hours rather than seconds.
+
+A run has three steps:
+1. Every submission's prompt is rendered and its request recorded instead of sent (see
+   helpers/provider_batch.py). Submissions whose response is already cached are written straight away.
+2. The recorded requests are submitted as one job, which is polled at growing intervals until it ends.
+3. Every submission is rendered again and answered from the job's results, which are cached and
+   written with the output template like any other response.
+
+The submitted job is recorded in a state file in the output directory, so a run that is
+interrupted while waiting resumes the same job when it is started again instead of submitting a
+new one. The state file is removed once the results have been written.
+
+Usage:
+    python -m ai_feedback batch --backend provider_batch --submissions submissions/ --output_dir feedback/ \\
+        --scope code --model openai --prompt code_table
+
+Point OPENAI_BASE_URL (or ANTHROPIC_BASE_URL) at `python -m ai_feedback.mock_server` to run the
+whole flow without network access.
+"""
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import batch
+from .helpers import client_pool
+from .helpers.arg_options import Models
+from .helpers.provider_batch import BatchOutcome, BatchRequests, provider_batch
+from .helpers.rate_limit import get_limiter
+
+STATE_FILE = ".provider_batch.json"
+OPENAI_ENDPOINT = "/v1/chat/completions"
+
+
+class OpenAIBatchAPI:
+    """Submits chat completion requests through the OpenAI Batch API."""
+
+    provider = "openai"
+
+    def __init__(self) -> None:
+        self.client = client_pool.openai_client(os.getenv("OPENAI_API_KEY"))
+        self.limiter = get_limiter(Models.OPENAI.value)
+
+    def submit(self, requests: Dict[str, dict]) -> str:
+        """Uploads the requests as a JSONL file and creates a batch job from it.
+
+        Args:
+            requests (Dict[str, dict]): Chat completion request bodies by request id.
+
+        Returns:
+            str: The id of the batch job.
+        """
+        lines = [
+            json.dumps({"custom_id": custom_id, "method": "POST", "url": OPENAI_ENDPOINT, "body": body})
+            for custom_id, body in requests.items()
+        ]
+        content = ("\n".join(lines) + "\n").encode("utf-8")
+        uploaded = self.limiter.run(
+            lambda: self.client.files.create(file=("batch.jsonl", content, "application/jsonl"), purpose="batch")
+        )
+        job = self.limiter.run(
+            lambda: self.client.batches.create(
+                input_file_id=uploaded.id, endpoint=OPENAI_ENDPOINT, completion_window="24h"
+            )
+        )
+        return job.id
+
+    def status(self, batch_id: str) -> Tuple[bool, str]:
+        """Returns whether the job has ended and a description of its progress.
+
+        Raises:
+            RuntimeError: If the job failed as a whole, e.g. because its input was invalid.
+        """
+        job = self.limiter.run(lambda: self.client.batches.retrieve(batch_id))
+        if job.status == "failed":
+            errors = "; ".join(error.message or error.code or "" for error in (job.errors and job.errors.data) or [])
+            raise RuntimeError(f"OpenAI batch {batch_id} failed: {errors or 'no details given'}")
+        counts = job.request_counts
+        progress = job.status
+        if counts is not None:
+            progress += f", {counts.completed + counts.failed}/{counts.total} requests processed"
+        return job.status in ("completed", "expired", "cancelled"), progress
+
+    def results(self, batch_id: str) -> Dict[str, BatchOutcome]:
+        """Downloads the results of an ended job.
+
+        Returns:
+            Dict[str, BatchOutcome]: The response or error of every request that has a result.
+        """
+        job = self.limiter.run(lambda: self.client.batches.retrieve(batch_id))
+        outcomes = {}
+        for file_id in (job.output_file_id, job.error_file_id):
+            if not file_id:
+                continue
+            content = self.limiter.run(lambda: self.client.files.content(file_id))
+            for line in content.text.splitlines():
+                if line.strip():
+                    record = json.loads(line)
+                    outcomes[record["custom_id"]] = self._outcome(record)
+        return outcomes
+
+    @staticmethod
+    def _outcome(record: Dict[str, Any]) -> BatchOutcome:
+        """Extracts the response text or error of one line of a result file."""
+        if record.get("error"):
+            return BatchOutcome(None, record["error"].get("message") or str(record["error"]))
+        response = record.get("response") or {}
+        body = response.get("body") or {}
+        if response.get("status_code") != 200:
+            error = body.get("error") or {}
+            return BatchOutcome(None, f"HTTP {response.get('status_code')}: {error.get('message', body)}")
+        return BatchOutcome(body["choices"][0]["message"]["content"])
+
+
+class AnthropicBatchAPI:
+    """Submits message requests through Anthropic Message Batches."""
+
+    provider = "anthropic"
+
+    def __init__(self) -> None:
+        self.client = client_pool.anthropic_client(os.getenv("CLAUDE_API_KEY"))
+        self.limiter = get_limiter(Models.CLAUDE.value)
+
+    def submit(self, requests: Dict[str, dict]) -> str:
+        """Creates a message batch from the requests.
+
+        Args:
+            requests (Dict[str, dict]): Message request parameters by request id.
+
+        Returns:
+            str: The id of the message batch.
+        """
+        params = [{"custom_id": custom_id, "params": body} for custom_id, body in requests.items()]
+        return self.limiter.run(lambda: self.client.messages.batches.create(requests=params)).id
+
+    def status(self, batch_id: str) -> Tuple[bool, str]:
+        """Returns whether the message batch has ended and a description of its progress."""
+        job = self.limiter.run(lambda: self.client.messages.batches.retrieve(batch_id))
+        counts = job.request_counts
+        processed = counts.succeeded + counts.errored + counts.canceled + counts.expired
+        progress = f"{job.processing_status}, {processed}/{processed + counts.processing} requests processed"
+        return job.processing_status == "ended", progress
+
+    def results(self, batch_id: str) -> Dict[str, BatchOutcome]:
+        """Downloads the results of an ended message batch.
+
+        Returns:
+            Dict[str, BatchOutcome]: The response or error of every request in the batch.
+        """
+        entries = self.limiter.run(lambda: list(self.client.messages.batches.results(batch_id)))
+        outcomes = {}
+        for entry in entries:
+            result = entry.result
+            if result.type == "succeeded":
+                text = "".join(block.text for block in result.message.content if block.type == "text")
+                outcomes[entry.custom_id] = BatchOutcome(text)
+            else:
+                error = getattr(getattr(result, "error", None), "error", None)
+                outcomes[entry.custom_id] = BatchOutcome(None, getattr(error, "message", None) or result.type)
+        return outcomes
+
+
+# Models that can be graded through a provider batch API, and the API they use
+BATCH_APIS: Dict[str, Callable[[], Any]] = {
+    Models.OPENAI.value: OpenAIBatchAPI,
+    Models.CLAUDE.value: AnthropicBatchAPI,
+}
+
+
+def _load_state(path: str) -> Optional[Dict[str, Any]]:
+    """Returns the job recorded in the state file, or None if there is none."""
+    try:
+        with open(path, "r", encoding="utf-8") as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        return None
+
+
+def _save_state(path: str, state: Dict[str, Any]) -> None:
+    """Writes the state file atomically, so an interrupted write never loses the job id."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as state_file:
+        json.dump(state, state_file, indent=2)
+    os.replace(temporary, path)
+
+
+def wait_for_batch(api: Any, batch_id: str, max_poll_interval: float = 60.0) -> None:
+    """Polls a job until it ends, waiting a little longer between checks each time.
+
+    Args:
+        api: The batch API the job was submitted to.
+        batch_id (str): The id of the job.
+        max_poll_interval (float): Longest wait in seconds between two checks.
+    """
+    interval = min(2.0, max_poll_interval)
+    last_progress = None
+    while True:
+        ended, progress = api.status(batch_id)
+        if progress != last_progress:
+            print(f"Batch {batch_id}: {progress}", file=sys.stderr, flush=True)
+            last_progress = progress
+        if ended:
+            return
+        time.sleep(interval)
+        interval = min(interval * 1.5, max_poll_interval)
+
+
+def run_provider_batch(
+    args, entries: List[Dict[str, Any]], workers: int = 4, max_poll_interval: float = 60.0
+) -> List[batch.BatchResult]:
+    """Grades every entry through one provider batch job, resuming the job of an interrupted run.
+
+    Args:
+        args: Parsed batch argument namespace with the batch-wide options.
+        entries (List[Dict[str, Any]]): Entries with "submission" and "output" paths and optional overrides.
+        workers (int): Number of submissions whose prompts are rendered at the same time.
+        max_poll_interval (float): Longest wait in seconds between two checks of the job's status.
+
+    Returns:
+        List[BatchResult]: One result per entry, in the same order as the entries.
+
+    Raises:
+        ValueError: If the model or options cannot be used with a batch API, or the state file
+            belongs to a job of another provider.
+    """
+    if args.model not in BATCH_APIS:
+        raise ValueError(f"Provider batches are only available for the models: {', '.join(BATCH_APIS)}.")
+    if args.scope == "image":
+        raise ValueError("Provider batches are not available for the image scope.")
+    if args.stream:
+        raise ValueError("--stream cannot be used with provider batches.")
+    if args.chunk_lines:
+        # The merge request of a chunked submission depends on the responses to its chunks
+        raise ValueError("--chunk_lines cannot be used with provider batches.")
+
+    api = BATCH_APIS[args.model]()
+    state_path = os.path.join(args.output_dir, STATE_FILE)
+    state = _load_state(state_path)
+    if state is None:
+        collected = BatchRequests()
+        with provider_batch(collected):
+            results = batch.run_batch(args, entries, workers)
+        if not collected.requests:
+            return results
+        batch_id = api.submit({custom_id: body for custom_id, (_, body) in collected.requests.items()})
+        state = {"provider": api.provider, "batch_id": batch_id, "requests": sorted(collected.requests)}
+        _save_state(state_path, state)
+        print(f"Submitted {len(collected.requests)} requests as {api.provider} batch {batch_id}.", file=sys.stderr)
+    elif state["provider"] != api.provider:
+        raise ValueError(f"{state_path} records a {state['provider']} batch; remove it to start a new batch.")
+    else:
+        print(f"Resuming {state['provider']} batch {state['batch_id']} from {state_path}.", file=sys.stderr)
+
+    batch_id = state["batch_id"]
+    wait_for_batch(api, batch_id, max_poll_interval)
+    outcomes = api.results(batch_id)
+    for custom_id in state["requests"]:
+        outcomes.setdefault(custom_id, BatchOutcome(None, "the batch ended without a result for this request"))
+
+    with provider_batch(BatchRequests(outcomes, batch_id)):
+        results = batch.run_batch(args, entries, workers)
+    os.remove(state_path)
+    return results
@@ -5,7 +5,9 @@ from typing import Callable, Optional, Tuple
 
 from .helpers.arg_options import model_mapping
 from .helpers.file_converter import rename_files
-from .helpers.template_utils import render_prompt_template
+from .helpers.metrics import measure, stage
+from .helpers.template_utils import render_prompt_template, resolve_diff_base
+from .helpers.token_budget import fit_prompt_for_model
 
 EXPECTED_SUFFIXES = ["_solution", "test_output", "_submission"]
 
@@ -59,14 +61,31 @@ def process_code(
             ensure_txt_file(args.solution, rename_files)
             solution_file = Path(args.solution.replace(".ipynb", ".txt"))
 
-    prompt = render_prompt_template(
-        prompt,
-        submission=submission_file,
-        solution=solution_file,
-        test_output=test_output_file,
-        question_num=args.question,
-        marking_instructions=marking_instructions,
-    )
+    diff_base = resolve_diff_base(args.submission_view, args.starter, solution_file)
+    if args.submission_type == "jupyter" and diff_base is not None and diff_base.suffix == ".ipynb":
+        # convert starter notebooks to .txt if needed, to compare them with the converted submission
+        ensure_txt_file(args.starter, rename_files)
+        diff_base = Path(args.starter.replace(".ipynb", ".txt"))
+
+    # Questions are the sections under the headings of notebooks, which python files do not have
+    question = args.question if args.submission_type == "jupyter" else None
+    with stage("render_prompt"):
+        prompt = render_prompt_template(
+            prompt,
+            submission=submission_file,
+            solution=solution_file,
+            test_output=test_output_file,
+            question=question,
+            marking_instructions=marking_instructions,
+            layout=args.prompt_layout,
+            max_file_bytes=args.max_file_bytes,
+            max_file_lines=args.max_file_lines,
+            line_ranges=getattr(args, "line_ranges", None),
+            diff_base=diff_base,
+            diff_context=args.diff_context,
+        )
+        prompt = fit_prompt_for_model(prompt, system_instructions, args.model, args.model_options, args.context_policy)
+    measure("prompt_bytes", len(prompt.encode("utf-8")))
 
     if args.model in model_mapping:
         model_class = model_mapping[args.model]
@@ -78,30 +97,31 @@ def process_code(
         print("Invalid model selected for code scope.")
         sys.exit(1)
 
-    if args.scope == "code":
-        if args.question:
-            request, response = model.generate_response(
-                prompt=prompt,
-                submission_file=submission_file,
-                solution_file=solution_file,
-                test_output=test_output_file,
-                question=args.question,
-                system_instructions=system_instructions,
-                llama_mode=args.llama_mode,
-                json_schema=args.json_schema,
-                model_options=args.model_options,
-            )
-        else:
-            request, response = model.generate_response(
-                prompt=prompt,
-                submission_file=submission_file,
-                solution_file=solution_file,
-                test_output=test_output_file,
-                system_instructions=system_instructions,
-                llama_mode=args.llama_mode,
-                json_schema=args.json_schema,
-                model_options=args.model_options,
-            )
+    with stage("model_call"):
+        if args.scope == "code":
+            if args.question:
+                request, response = model.generate_response(
+                    prompt=prompt,
+                    submission_file=submission_file,
+                    solution_file=solution_file,
+                    test_output=test_output_file,
+                    question=args.question,
+                    system_instructions=system_instructions,
+                    llama_mode=args.llama_mode,
+                    json_schema=args.json_schema,
+                    model_options=args.model_options,
+                )
+            else:
+                request, response = model.generate_response(
+                    prompt=prompt,
+                    submission_file=submission_file,
+                    solution_file=solution_file,
+                    test_output=test_output_file,
+                    system_instructions=system_instructions,
+                    llama_mode=args.llama_mode,
+                    json_schema=args.json_schema,
+                    model_options=args.model_options,
+                )
 
     return request, response
 
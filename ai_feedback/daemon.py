@@ -0,0 +1,296 @@
+"""
+Long-running feedback daemon.
+
+Keeps the package, its provider SDKs and the bundled templates loaded in one process and serves
+feedback requests over localhost HTTP, so that callers such as the MarkUs tester scripts do not
+pay interpreter startup and imports for every request.
+
+A request is the same argument list that would be passed to `python -m ai_feedback`:
+
+    POST /run  {"argv": ["--submission", "/abs/path/submission.py", "--scope", "code", ...]}
+
+and the reply mirrors a finished subprocess:
+
+    {"returncode": 0, "stdout": "...", "stderr": "..."}
+
+Requests must send the daemon's token in the X-Daemon-Token header, since a request can read and
+write any file the daemon can. The token is AI_FEEDBACK_DAEMON_TOKEN if it is set; otherwise the
+daemon generates one when it starts and writes it to a file only its user can read (see
+token_file()), where run_via_daemon() finds it.
+
+Usage:
+    python -m ai_feedback serve --port 8765
+    AI_FEEDBACK_DAEMON_URL=http://127.0.0.1:8765 pytest python_tester_llm_code.py
+"""
+
+import argparse
+import hmac
+import io
+import json
+import os
+import secrets
+import subprocess
+import sys
+import traceback
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Seconds a client waits for the reply to a request, which includes the model's response and its retries
+DEFAULT_TIMEOUT = 600.0
+
+# Options whose values are file paths, resolved against the client's working directory
+_PATH_OPTIONS = (
+    "--submission",
+    "--solution",
+    "--starter",
+    "--test_output",
+    "--submission_image",
+    "--solution_image",
+    "--marking_instructions",
+    "--json_schema",
+    "--prompt",
+    "--system_prompt",
+)
+# Options that name files the daemon creates, so they are resolved even if they do not exist yet
+_OUTPUT_OPTIONS = ("--output", "--image_output_dir")
+
+
+def warm_up() -> None:
+    """Imports every scope module and provider SDK and loads the bundled templates."""
+    from . import __main__ as cli  # noqa: F401
+    from . import code_processing, image_processing, text_processing  # noqa: F401
+    from .helpers import arg_options, template_registry
+
+    # Model classes are imported on first lookup; resolve them all so their SDKs are loaded up front
+    dict(arg_options.model_mapping)
+    import httpx  # noqa: F401
+    import ollama  # noqa: F401
+
+    # Reads and parses every bundled prompt, output template and schema, which are not read again
+    template_registry.warm_up()
+
+
+def _run_argv(argv: List[str]) -> dict:
+    """Runs one request in-process and returns its return code and captured output.
+
+    The output is captured by the streams bound to the request's context (see
+    helpers/streaming.redirect_output), so it includes what the request writes from other
+    threads, such as streamed tokens written from the shared event loop.
+    """
+    from . import __main__ as cli  # noqa: F401
+    from .helpers.streaming import redirect_output
+
+    stdout, stderr = io.StringIO(), io.StringIO()
+    with redirect_output(stdout, stderr):
+        try:
+            conflicts = cli.conflicting_process_options(argv[1:] if argv[:1] == ["batch"] else argv)
+            if "--rate_limit" in conflicts:
+                print(
+                    "Error: --rate_limit cannot be used with the daemon, since it applies to every request.",
+                    file=sys.stderr,
+                )
+                returncode = 1
+            elif conflicts:
+                print(
+                    f"Error: {', '.join(conflicts)} must be set when the daemon is started, since they apply to "
+                    "every request it serves.",
+                    file=sys.stderr,
+                )
+                returncode = 1
+            else:
+                returncode = cli.main(argv)
+        except SystemExit as e:
+            returncode = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            if e.code is not None and not isinstance(e.code, int):
+                print(e.code, file=sys.stderr)
+        except Exception:
+            traceback.print_exc(file=sys.stderr)
+            returncode = 1
+    return {"returncode": returncode or 0, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+
+def token_file() -> str:
+    """Returns the file a daemon writes its generated token to: AI_FEEDBACK_DAEMON_TOKEN_FILE, or a file
+    in the user's cache directory."""
+    default = os.path.join(os.path.expanduser("~"), ".cache", "ai_feedback", "daemon_token")
+    return os.getenv("AI_FEEDBACK_DAEMON_TOKEN_FILE", default)
+
+
+def _write_token(path: str) -> str:
+    """Generates a token and writes it to a file only the current user can read or write."""
+    token = secrets.token_urlsafe(32)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        # The mode of os.open() only applies to new files
+        os.fchmod(f.fileno(), 0o600)
+        f.write(token)
+    return token
+
+
+def read_token() -> Optional[str]:
+    """Returns AI_FEEDBACK_DAEMON_TOKEN, or else the token a daemon wrote to token_file(), if any."""
+    token = os.getenv("AI_FEEDBACK_DAEMON_TOKEN")
+    if token:
+        return token
+    try:
+        with open(token_file(), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _make_handler(token: str):
+    class FeedbackRequestHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, payload: dict) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok"})
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self) -> None:
+            if self.path != "/run":
+                self._send_json(404, {"error": "not found"})
+                return
+            sent = self.headers.get("X-Daemon-Token", "")
+            if not hmac.compare_digest(sent.encode("utf-8"), token.encode("utf-8")):
+                self._send_json(403, {"error": "invalid token"})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                argv = [str(arg) for arg in body["argv"]]
+            except (ValueError, KeyError, TypeError):
+                self._send_json(400, {"error": "expected a JSON object with an 'argv' list"})
+                return
+            self._send_json(200, _run_argv(argv))
+
+        def log_message(self, format: str, *args) -> None:
+            print(f"[ai_feedback daemon] {self.address_string()} {format % args}", file=sys.__stderr__)
+
+    return FeedbackRequestHandler
+
+
+def serve(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    token: Optional[str] = None,
+    options: Optional[argparse.Namespace] = None,
+) -> None:
+    """Warms up the package and serves feedback requests until interrupted.
+
+    Args:
+        host (str): Interface to bind to. Defaults to localhost only.
+        port (int): Port to listen on.
+        token (str, optional): The token requests must send in the X-Daemon-Token header. If None,
+            one is generated and written to token_file().
+        options (argparse.Namespace, optional): The process-wide options (caches, PDF extraction,
+            connection pools) of every request, see add_process_arguments() in __main__.py.
+            Requests that set them to other values are rejected. Defaults to their defaults.
+    """
+    from . import __main__ as cli
+    from .helpers.streaming import ContextOutput
+
+    if options is None:
+        options = _build_parser().parse_args([])
+    cli.fix_process_options(options)
+    if not token:
+        token = _write_token(token_file())
+        print(f"ai_feedback daemon token written to {token_file()}", file=sys.__stderr__, flush=True)
+    warm_up()
+    # Installed once for the whole process: print() then writes to the streams of the request
+    # whose context it runs in, whichever thread that is, and to the daemon's own streams otherwise
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = ContextOutput(stdout), ContextOutput(stderr, error=True)
+
+    server = ThreadingHTTPServer((host, port), _make_handler(token))
+    print(f"ai_feedback daemon listening on http://{host}:{server.server_port}", file=sys.__stderr__, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        sys.stdout, sys.stderr = stdout, stderr
+
+
+def absolutize_argv(argv: List[str], cwd: Optional[str] = None) -> List[str]:
+    """Resolves file path arguments against the caller's working directory.
+
+    The daemon has its own working directory, so relative paths must be made absolute before a
+    request is sent. Prompt names that are not files are left untouched.
+
+    Args:
+        argv (List[str]): Arguments for `python -m ai_feedback`.
+        cwd (str, optional): The directory relative paths are relative to; defaults to os.getcwd().
+
+    Returns:
+        List[str]: The arguments with path values made absolute and an explicit --image_output_dir.
+    """
+    cwd = cwd or os.getcwd()
+    resolved = list(argv)
+    for i, arg in enumerate(resolved[:-1]):
+        value = resolved[i + 1]
+        if arg in _OUTPUT_OPTIONS or (arg in _PATH_OPTIONS and os.path.exists(os.path.join(cwd, value))):
+            resolved[i + 1] = os.path.join(cwd, value)
+    if "--image_output_dir" not in resolved:
+        resolved += ["--image_output_dir", os.path.join(cwd, "output_images")]
+    return resolved
+
+
+def run_via_daemon(
+    argv: List[str], url: str, token: Optional[str] = None, timeout: float = DEFAULT_TIMEOUT
+) -> subprocess.CompletedProcess:
+    """Sends a request to a running daemon.
+
+    Args:
+        argv (List[str]): Arguments for `python -m ai_feedback`.
+        url (str): Base URL of the daemon, e.g. http://127.0.0.1:8765.
+        token (str, optional): The daemon's token; defaults to the one read_token() finds.
+        timeout (float): Seconds to wait for the daemon to reply.
+
+    Returns:
+        subprocess.CompletedProcess: The result, shaped like that of running the command as a subprocess.
+
+    Raises:
+        OSError: If the daemon cannot be reached, rejects the token or does not reply in time.
+    """
+    resolved = absolutize_argv(argv)
+    headers = {"Content-Type": "application/json"}
+    token = token or read_token()
+    if token:
+        headers["X-Daemon-Token"] = token
+    request = urllib.request.Request(
+        url.rstrip("/") + "/run", data=json.dumps({"argv": resolved}).encode("utf-8"), headers=headers
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        result = json.loads(response.read())
+    return subprocess.CompletedProcess(resolved, result["returncode"], result["stdout"], result["stderr"])
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    """Builds the argument parser for the serve subcommand."""
+    from . import __main__ as cli
+
+    parser = argparse.ArgumentParser(prog="python -m ai_feedback serve")
+    parser.add_argument("--host", type=str, default=DEFAULT_HOST, help="Interface to bind to.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on.")
+    cli.add_process_arguments(parser)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Parses the serve subcommand's arguments and runs the daemon."""
+    args = _build_parser().parse_args(argv)
+    serve(args.host, args.port, os.getenv("AI_FEEDBACK_DAEMON_TOKEN"), args)
+    return 0
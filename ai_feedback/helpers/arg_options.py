@@ -1,6 +1,10 @@
+from collections.abc import Mapping
 from enum import Enum
+from typing import Iterator
 
 from .. import models
+from .rate_limit import RateLimit
+from .token_budget import TokenBudget
 
 
 def get_enum_values(enum_class: type[Enum]) -> list[str]:
@@ -68,17 +72,6 @@ class Scope(Enum):
         return self.value
 
 
-model_mapping = {
-    "deepSeek-R1:70B": models.DeepSeekModel,
-    "openai": models.OpenAIModel,
-    "openai-vector": models.OpenAIModelVector,
-    "codellama:latest": models.CodeLlamaModel,
-    "claude-3.7-sonnet": models.ClaudeModel,
-    "remote": models.RemoteModel,
-    "deepSeek-v3": models.DeepSeekV3Model,
-}
-
-
 class Models(Enum):
     """
     Enum representing the available AI model types.
@@ -98,6 +91,71 @@ class Models(Enum):
         return self.value
 
 
+class _LazyModelMapping(Mapping):
+    """
+    A read-only mapping from model names to model classes that imports each class on first lookup.
+
+    This keeps startup from importing every provider SDK when only one model is used.
+    """
+
+    def __init__(self, class_names: dict[str, str]) -> None:
+        self._class_names = class_names
+
+    def __getitem__(self, key: str) -> type:
+        return models.load_model_class(self._class_names[key])
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._class_names
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._class_names)
+
+    def __len__(self) -> int:
+        return len(self._class_names)
+
+
+model_mapping = _LazyModelMapping(
+    {
+        Models.DEEPSEEK.value: "DeepSeekModel",
+        Models.OPENAI.value: "OpenAIModel",
+        Models.OPENAIVECTOR.value: "OpenAIModelVector",
+        Models.CODELLAMA.value: "CodeLlamaModel",
+        Models.CLAUDE.value: "ClaudeModel",
+        Models.REMOTE.value: "RemoteModel",
+        Models.DEEPSEEKV3.value: "DeepSeekV3Model",
+    }
+)
+
+# Rate limits and retry policy per model key; keys not listed get RateLimit() defaults.
+# Hosted providers are limited per minute, local models only by the number of concurrent requests.
+rate_limits = {
+    Models.OPENAI.value: RateLimit(requests_per_minute=500, tokens_per_minute=200_000, max_concurrency=16),
+    Models.OPENAIVECTOR.value: RateLimit(requests_per_minute=500, tokens_per_minute=200_000, max_concurrency=4),
+    Models.CLAUDE.value: RateLimit(requests_per_minute=50, tokens_per_minute=40_000, max_concurrency=8),
+    Models.REMOTE.value: RateLimit(max_concurrency=4),
+    Models.LLAMA.value: RateLimit(max_concurrency=2),
+    Models.LLAVA.value: RateLimit(max_concurrency=2),
+    Models.DEEPSEEK.value: RateLimit(max_concurrency=2),
+    Models.CODELLAMA.value: RateLimit(max_concurrency=2),
+    Models.DEEPSEEKV3.value: RateLimit(max_concurrency=1),
+}
+
+# Context window of each model key, the room kept free for the response, and how many tokens the
+# model's tokenizer produces per token estimated by helpers/token_budget.py. Ollama and llama.cpp
+# models use the num_ctx / n_ctx model option instead of the window when it is set.
+token_budgets = {
+    Models.OPENAI.value: TokenBudget(context_window=128_000, output_reserve=16_384),
+    Models.OPENAIVECTOR.value: TokenBudget(context_window=128_000, output_reserve=16_384),
+    Models.CLAUDE.value: TokenBudget(context_window=200_000, output_reserve=8_192, token_factor=1.15),
+    Models.REMOTE.value: TokenBudget(context_window=None, token_factor=1.2),
+    Models.LLAMA.value: TokenBudget(context_window=128_000),
+    Models.LLAVA.value: TokenBudget(context_window=4_096, output_reserve=1_024, token_factor=1.2),
+    Models.DEEPSEEK.value: TokenBudget(context_window=128_000, token_factor=1.05),
+    Models.CODELLAMA.value: TokenBudget(context_window=16_384, output_reserve=2_048, token_factor=1.3),
+    Models.DEEPSEEKV3.value: TokenBudget(context_window=128_000, token_factor=1.05),
+}
+
+
 class FileType(Enum):
     """
     Enum representing different input file types that the application can process.
@@ -150,3 +208,40 @@ class LlamaMode(Enum):
 
     def __str__(self):
         return self.value
+
+
+class PromptLayout(Enum):
+    """
+    Enum representing how the parts of a rendered prompt are ordered.
+    """
+
+    DEFAULT = "default"
+    CACHE_FRIENDLY = "cache_friendly"
+
+    def __str__(self):
+        return self.value
+
+
+class SubmissionView(Enum):
+    """
+    Enum representing how the submission is rendered in the prompt.
+    """
+
+    FULL = "full"
+    DIFF = "diff"
+
+    def __str__(self):
+        return self.value
+
+
+class ContextPolicy(Enum):
+    """
+    Enum representing what is done with prompts that do not fit the model's context window.
+    """
+
+    SHRINK = "shrink"
+    ERROR = "error"
+    OFF = "off"
+
+    def __str__(self):
+        return self.value
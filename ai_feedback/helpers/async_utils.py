@@ -0,0 +1,73 @@
+import asyncio
+import atexit
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Coroutine, Optional, TypeVar
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    """
+    Returns the process-wide event loop that synchronous callers run coroutines on.
+
+    The loop runs in a daemon thread started on first use. Sharing one loop lets pooled async
+    clients (which are bound to the loop they were created on) keep their connections alive
+    across calls from any thread.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="ai_feedback-event-loop", daemon=True).start()
+            atexit.register(_stop_loop, loop)
+            _loop = loop
+        return _loop
+
+
+def _stop_loop(loop: asyncio.AbstractEventLoop) -> None:
+    """Closes the pooled clients bound to the background loop, then stops it."""
+    from .client_pool import aclose_loop_clients
+
+    try:
+        asyncio.run_coroutine_threadsafe(aclose_loop_clients(), loop).result(timeout=5)
+    except Exception:
+        pass
+    loop.call_soon_threadsafe(loop.stop)
+
+
+def run_sync(coroutine: Coroutine[Any, Any, T]) -> T:
+    """
+    Runs a coroutine to completion from synchronous code and returns its result.
+
+    The coroutine runs on the shared background loop with a copy of the caller's context, so
+    context variables such as the current run's stats are visible to it. If the caller is itself
+    running inside an event loop, the coroutine is run on a fresh loop in a helper thread instead,
+    since waiting on the shared loop from one of its own callbacks could deadlock; the pooled
+    clients created on that loop are closed with it.
+    """
+    context = contextvars.copy_context()
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        loop = background_loop()
+
+        async def in_context() -> T:
+            return await context.run(loop.create_task, coroutine)
+
+        return asyncio.run_coroutine_threadsafe(in_context(), loop).result()
+
+    async def closing_clients() -> T:
+        from .client_pool import aclose_loop_clients
+
+        try:
+            return await coroutine
+        finally:
+            await aclose_loop_clients()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(context.run, asyncio.run, closing_clients()).result()
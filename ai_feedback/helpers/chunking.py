@@ -0,0 +1,234 @@
+"""
+Splitting long submissions into parts that are graded separately.
+
+A submission is cut at natural boundaries, depending on its kind:
+
+- PDFs at the entries of their outline (table of contents), in the lines of their extracted text,
+- Jupyter notebooks (converted to text) at their cells,
+- Python files at their top-level statements, such as function and class definitions,
+- other text files at their Markdown headings, found as extract_question_from_txt() finds them.
+
+Consecutive sections are packed into chunks of at most max_lines lines, and a section longer than
+that is cut every max_lines lines. Chunks keep the numbers of their first and last lines in the
+whole file, so that their prompts number lines as the full prompt would. Each chunk also records
+the titles of the sections it holds (headings, notebook headings, definition names), which are
+used to find the matching sections of the solution.
+"""
+
+import ast
+import re
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Lines the notebook converter of helpers/file_converter.py starts every cell with
+_CELL_MARKERS = ("Code Cell:", "Markdown Cell:")
+_DEFINITION_RE = re.compile(r"^(?:async\s+def|def|class)\s+(\w+)|^@")
+
+
+class Chunk(NamedTuple):
+    # First and last line of the chunk, numbered from 1 as in the whole file
+    first: int
+    last: int
+    # Titles of the sections the chunk holds: normalized headings, or names of Python definitions
+    titles: Tuple[str, ...]
+
+
+def _read_lines(file_path: Path) -> List[str]:
+    if file_path.suffix.lower() == ".pdf":
+        from .pdf_index import load_pdf_index
+
+        return load_pdf_index(file_path).lines
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+        return f.readlines()
+
+
+def _pdf_sections(file_path: Path, lines: List[str]) -> List[Tuple[int, Optional[str]]]:
+    """Returns the line indexes where the outline entries of a PDF start, in order, with their titles."""
+    from .pdf_index import load_pdf_index
+    from .template_utils import normalize_text
+
+    index = load_pdf_index(file_path)
+    starts = []
+    previous = 0
+    for entry in index.toc:
+        title = normalize_text(entry["title"])
+        following = [position for position in index.line_positions.get(title, []) if position >= previous]
+        if following:
+            previous = following[0]
+            starts.append((previous, title))
+    return starts
+
+
+def _python_sections(lines: List[str]) -> List[Tuple[int, Optional[str]]]:
+    """Returns the line indexes where the top-level statements of Python code start, with definition names."""
+    try:
+        tree = ast.parse("".join(lines))
+    except (SyntaxError, ValueError):
+        # Submissions do not always parse; fall back to definitions starting at the first column
+        starts = []
+        decorator = None
+        for number, line in enumerate(lines):
+            match = _DEFINITION_RE.match(line)
+            if match is None:
+                continue
+            if match.group(1) is None:
+                # A definition starts at its first decorator
+                decorator = number if decorator is None else decorator
+                continue
+            starts.append((number if decorator is None else decorator, match.group(1)))
+            decorator = None
+        return starts
+
+    starts = []
+    for node in tree.body:
+        decorators = getattr(node, "decorator_list", [])
+        first = min([node.lineno] + [decorator.lineno for decorator in decorators]) - 1
+        starts.append((first, getattr(node, "name", None)))
+    return starts
+
+
+def _text_sections(lines: List[str]) -> List[Tuple[int, Optional[str]]]:
+    """Returns the line indexes where the cells of a converted notebook start, or else its Markdown headings."""
+    from .markdown_index import MarkdownSectionIndex
+
+    headings = MarkdownSectionIndex(lines).headings
+    cells = [number for number, line in enumerate(lines) if line.rstrip("\n") in _CELL_MARKERS]
+    if not cells:
+        return [(heading.start, heading.normalized) for heading in headings]
+
+    # A cell takes the title of the first heading in it, or else of the last heading above it
+    starts = []
+    title = None
+    remaining = iter(headings)
+    heading = next(remaining, None)
+    for cell, end in zip(cells, cells[1:] + [len(lines)]):
+        while heading is not None and heading.start < cell:
+            title = heading.normalized
+            heading = next(remaining, None)
+        cell_title = heading.normalized if heading is not None and heading.start < end else title
+        starts.append((cell, cell_title))
+    return starts
+
+
+def sections(file_path: Path) -> Tuple[List[str], List[Tuple[int, Optional[str]]]]:
+    """
+    Finds the natural boundaries of a file.
+
+    Args:
+        file_path (Path): The file, as the scopes read it (notebooks already converted to text).
+
+    Returns:
+        Tuple[List[str], List[Tuple[int, Optional[str]]]]: The lines of the file, and the index of
+            the first line of every section with its normalized title (None if it has none), in order.
+    """
+    lines = _read_lines(file_path)
+    suffix = file_path.suffix.lower()
+    if suffix == ".pdf":
+        starts = _pdf_sections(file_path, lines)
+    elif suffix == ".py":
+        starts = _python_sections(lines)
+    else:
+        starts = _text_sections(lines)
+    return lines, starts
+
+
+def split_file(file_path: Path, max_lines: int) -> List[Chunk]:
+    """
+    Splits a file into chunks of at most max_lines lines at its natural boundaries.
+
+    Args:
+        file_path (Path): The file, as the scopes read it (notebooks already converted to text).
+        max_lines (int): Most lines of a chunk.
+
+    Returns:
+        List[Chunk]: The chunks, in order, covering every line of the file.
+    """
+    lines, starts = sections(file_path)
+    line_count = len(lines)
+    if line_count == 0:
+        return []
+    boundaries = sorted({0, *(start for start, _ in starts if 0 < start < line_count)}) + [line_count]
+
+    chunks: List[Chunk] = []
+    first = 0
+    for start, end in zip(boundaries, boundaries[1:]):
+        if end - first <= max_lines:
+            continue
+        if start > first:
+            chunks.append(_chunk(first, start, starts))
+            first = start
+        # A section longer than a chunk is cut every max_lines lines
+        while end - first > max_lines:
+            chunks.append(_chunk(first, first + max_lines, starts))
+            first += max_lines
+    chunks.append(_chunk(first, line_count, starts))
+    return chunks
+
+
+def _chunk(first: int, end: int, starts: List[Tuple[int, Optional[str]]]) -> Chunk:
+    """Returns the chunk of lines first to end - 1, with the titles of the sections it holds or continues."""
+    held = [title for start, title in starts if first <= start < end]
+    started = [title for start, title in starts if start < first]
+    if started and all(start != first for start, _ in starts):
+        # A piece of a section cut every max_lines lines belongs to that section
+        held.insert(0, started[-1])
+    return Chunk(first + 1, end, tuple(dict.fromkeys(title for title in held if title)))
+
+
+def section_spans(file_path: Path) -> Dict[str, Tuple[int, int]]:
+    """
+    Returns the first and last line (from 1) of every titled section of a file, by normalized title.
+
+    A section runs up to the next boundary, as in split_file(), and consecutive sections with the same
+    title (such as the cells under a notebook heading) are one. The first section with a title is kept.
+    """
+    lines, starts = sections(file_path)
+    ends = [start for start, _ in starts[1:]] + [len(lines)]
+    spans: Dict[str, Tuple[int, int]] = {}
+    previous = None
+    for (start, title), end in zip(starts, ends):
+        if title and title == previous:
+            spans[title] = (spans[title][0], end)
+        elif title and end > start and title not in spans:
+            spans[title] = (start + 1, end)
+        previous = title if title in spans and spans[title][1] == end else None
+    return spans
+
+
+def matching_lines(spans: Dict[str, Tuple[int, int]], titles: Tuple[str, ...]) -> Optional[Tuple[int, int]]:
+    """Returns the lines of a file spanning its sections with the given titles, or None if it has none of them."""
+    matched = [spans[title] for title in titles if title in spans]
+    if not matched:
+        return None
+    return min(first for first, _ in matched), max(last for _, last in matched)
+
+
+def merge_prompt(prompt_content: str, filename: str, chunks: List[Chunk], responses: List[str]) -> str:
+    """
+    Builds the prompt template of the request that merges the feedback on every chunk.
+
+    The prompt keeps the instructions of prompt_content, with the files replaced by the feedback on
+    each chunk, so that the merged feedback follows the format they ask for.
+
+    Args:
+        prompt_content (str): The user prompt template the chunks were graded with.
+        filename (str): Name of the submission file.
+        chunks (List[Chunk]): The chunks, in order.
+        responses (List[str]): The model's response for every chunk.
+
+    Returns:
+        str: A prompt template, with the braces of the responses escaped.
+    """
+    parts = "".join(
+        f'<part lines="{chunk.first}-{chunk.last}">\n{response.strip()}\n</part>\n\n'
+        for chunk, response in zip(chunks, responses)
+    )
+    instructions = prompt_content.replace("{file_contents}", f"[{filename} was reviewed in parts, see below.]")
+    return (
+        f"{instructions.rstrip()}\n\n---\n\n"
+        f"{filename} was too long to review at once, so each part of it was reviewed separately with the "
+        "instructions above. Combine the feedback on every part below into the single response the instructions "
+        "ask for, as if the whole file had been reviewed at once: keep every distinct point, drop repeated ones, "
+        "and keep every (Line i) reference as written, since line numbers refer to the whole file.\n\n"
+        + parts.replace("{", "{{").replace("}", "}}")
+    )
@@ -0,0 +1,189 @@
+"""
+Shared provider clients.
+
+Creating an SDK client for every request throws away its connection pool, so every call pays
+a new TCP (and TLS) handshake. The functions here return one client per provider and
+configuration instead, built with keep-alive connection pools whose sizes can be configured.
+
+SDK clients are created with their own retries disabled, since helpers/rate_limit.py retries
+every provider call with backoff shared across threads and processes.
+
+Synchronous clients are shared by the whole process. Asynchronous clients hold connections that
+belong to the event loop they were created on, so they are shared per event loop; synchronous
+callers all use the same background loop (see async_utils.run_sync) and therefore share them too.
+"""
+
+import asyncio
+import os
+import threading
+import weakref
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_settings = {
+    "max_connections": int(os.getenv("AI_FEEDBACK_MAX_CONNECTIONS", "20")),
+    "max_keepalive_connections": int(os.getenv("AI_FEEDBACK_MAX_KEEPALIVE", "10")),
+    "keepalive_expiry": 30.0,
+}
+_sync_clients: Dict[Hashable, Any] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, Any]]" = (
+    weakref.WeakKeyDictionary()
+)
+_lock = threading.Lock()
+
+
+def configure(
+    max_connections: Optional[int] = None,
+    max_keepalive_connections: Optional[int] = None,
+    keepalive_expiry: Optional[float] = None,
+) -> None:
+    """
+    Sets the connection pool sizes of clients created from now on. Options left as None keep their
+    current value. Clients created with different settings are closed and dropped from the pool,
+    asynchronous ones on the event loop they belong to.
+
+    Args:
+        max_connections (int, optional): Maximum number of open connections per client.
+        max_keepalive_connections (int, optional): Maximum number of idle connections kept open per client.
+        keepalive_expiry (float, optional): Seconds an idle connection is kept open.
+    """
+    changed = False
+    for name, value in (
+        ("max_connections", max_connections),
+        ("max_keepalive_connections", max_keepalive_connections),
+        ("keepalive_expiry", keepalive_expiry),
+    ):
+        if value is not None and value != _settings[name]:
+            _settings[name] = value
+            changed = True
+    if changed:
+        with _lock:
+            for client in _sync_clients.values():
+                client.close()
+            _sync_clients.clear()
+            async_clients = list(_async_clients.items())
+            _async_clients.clear()
+        for loop, clients in async_clients:
+            # Clients of a loop that is no longer running have nothing left to close on it
+            if loop.is_running() and not loop.is_closed():
+                asyncio.run_coroutine_threadsafe(_aclose_clients(clients), loop)
+
+
+def http_limits():
+    """Returns the httpx connection limits for new clients."""
+    import httpx
+
+    return httpx.Limits(
+        max_connections=_settings["max_connections"],
+        max_keepalive_connections=_settings["max_keepalive_connections"],
+        keepalive_expiry=_settings["keepalive_expiry"],
+    )
+
+
+def get_sync_client(key: Hashable, factory: Callable[[], Any]) -> Any:
+    """
+    Returns the shared synchronous client for key, creating it with factory on first use.
+
+    Args:
+        key (Hashable): Identifies the provider and every setting the client was created with.
+        factory (Callable[[], Any]): Creates the client.
+    """
+    with _lock:
+        client = _sync_clients.get(key)
+        if client is None:
+            client = _sync_clients[key] = factory()
+        return client
+
+
+def get_async_client(key: Hashable, factory: Callable[[], Any]) -> Any:
+    """
+    Returns the asynchronous client for key that is shared by the running event loop, creating it
+    with factory on first use.
+
+    Args:
+        key (Hashable): Identifies the provider and every setting the client was created with.
+        factory (Callable[[], Any]): Creates the client.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            client = clients[key] = factory()
+        return client
+
+
+async def aclose_loop_clients() -> None:
+    """Closes the asynchronous clients shared by the running event loop."""
+    with _lock:
+        clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    await _aclose_clients(clients)
+
+
+async def _aclose_clients(clients: Dict[Hashable, Any]) -> None:
+    for client in clients.values():
+        close = getattr(client, "aclose", None) or getattr(client, "close", None)
+        if close is not None:
+            await close()
+
+
+def async_http_client():
+    """Returns the shared httpx.AsyncClient, for providers called over plain HTTP."""
+    import httpx
+
+    return get_async_client(("httpx",), lambda: httpx.AsyncClient(timeout=None, limits=http_limits()))
+
+
+def async_openai_client(api_key: Optional[str] = None):
+    """Returns the shared openai.AsyncOpenAI client for api_key."""
+    import openai
+
+    return get_async_client(
+        ("openai", api_key),
+        lambda: openai.AsyncOpenAI(
+            api_key=api_key, max_retries=0, http_client=openai.DefaultAsyncHttpxClient(limits=http_limits())
+        ),
+    )
+
+
+def openai_client(api_key: Optional[str] = None):
+    """Returns the shared synchronous openai.OpenAI client for api_key."""
+    import openai
+
+    return get_sync_client(
+        ("openai", api_key),
+        lambda: openai.OpenAI(
+            api_key=api_key, max_retries=0, http_client=openai.DefaultHttpxClient(limits=http_limits())
+        ),
+    )
+
+
+def async_anthropic_client(api_key: Optional[str] = None):
+    """Returns the shared anthropic.AsyncAnthropic client for api_key."""
+    import anthropic
+
+    return get_async_client(
+        ("anthropic", api_key),
+        lambda: anthropic.AsyncAnthropic(
+            api_key=api_key, max_retries=0, http_client=anthropic.DefaultAsyncHttpxClient(limits=http_limits())
+        ),
+    )
+
+
+def anthropic_client(api_key: Optional[str] = None):
+    """Returns the shared synchronous anthropic.Anthropic client for api_key."""
+    import anthropic
+
+    return get_sync_client(
+        ("anthropic", api_key),
+        lambda: anthropic.Anthropic(
+            api_key=api_key, max_retries=0, http_client=anthropic.DefaultHttpxClient(limits=http_limits())
+        ),
+    )
+
+
+def async_ollama_client(host: Optional[str] = None):
+    """Returns the shared ollama.AsyncClient for host (defaults to $OLLAMA_HOST)."""
+    import ollama
+
+    host = host or os.getenv("OLLAMA_HOST")
+    return get_async_client(("ollama", host), lambda: ollama.AsyncClient(host=host, limits=http_limits()))
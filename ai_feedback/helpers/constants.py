@@ -1,4 +1,6 @@
 TEST_OUTPUTS_DIRECTORY = "test_responses_md"
+# Default number of concurrent requests sent to each provider when several questions are graded at once
+PROVIDER_CONCURRENCY = {"openai": 8, "anthropic": 4, "remote": 2, "ollama": 2}
 HELP_MESSAGES = {
     "submission_type": "The format of the submission file (e.g., Jupyter notebook, Python script).",
     "prompt": "Pre-defined prompt name (from ai_feedback/data/prompts/user/) or file path to custom prompt file.",
@@ -6,7 +8,7 @@ HELP_MESSAGES = {
     "scope": "The section of the assignment the model should analyze (e.g., code or image).",
     "submission": "The file path for the submission file.",
     "solution": "The file path for the solution file.",
-    "question": "The specific question number to analyze within the assignment (if applicable).",
+    "question": "The specific question number to analyze within the assignment (if applicable). Several questions can be given separated by commas, or 'all' for every heading starting with Task, Question, Exercise or Problem; the code and text scopes then prompt the model once per question.",
     "model": "The name of the LLM model to use for evaluation.",
     "remote_model": "When using --remote=model, this option specifies the remote model to use.",
     "output": "Format to display the output response.",
@@ -18,4 +20,35 @@ HELP_MESSAGES = {
     "system_prompt": "Pre-defined system prompt name (from ai_feedback/data/prompts/system/) or file path to custom system prompt file.",
     "marking_instructions": "File path to marking instructions/rubric.",
     "model_options": "Comma-separated key-value pairs of model options",
+    "image_output_dir": "Directory where images and question context extracted from the submission are written.",
+    "submissions": "Directory, glob pattern or JSONL manifest of submission files to grade.",
+    "output_dir": "Directory where one output file per submission is written.",
+    "workers": "Number of submissions to grade concurrently.",
+    "cache": "How to use the response cache: 'use' (the default) reads and stores responses, so rerunning an unchanged submission returns the cached response for --cache_ttl hours instead of a new one; 'bypass' ignores the cache, 'refresh' stores new responses without reading.",
+    "cache_dir": "Directory of the response cache (defaults to $AI_FEEDBACK_CACHE_DIR or ~/.cache/ai_feedback/responses).",
+    "cache_max_size": "Maximum size of the response cache in MB before least recently used responses are evicted.",
+    "cache_ttl": "Number of hours a cached response stays valid.",
+    "pdf_cache_dir": "Directory of the cache of parsed PDFs (defaults to $AI_FEEDBACK_PDF_CACHE_DIR or ~/.cache/ai_feedback/pdfs).",
+    "pdf_cache_max_size": "Maximum size of the cache of parsed PDFs in MB before least recently used PDFs are evicted; 0 disables it.",
+    "pdf_backend": "Library the text of PDFs is extracted with: 'pymupdf', 'pypdf2', or 'auto' for pymupdf if it is installed and pypdf2 otherwise (defaults to $AI_FEEDBACK_PDF_BACKEND or auto).",
+    "pdf_workers": "Most processes extracting the pages of a long PDF (defaults to the number of CPUs; 1 extracts them in the main process).",
+    "max_concurrency": "Maximum number of concurrent requests sent to the model provider when grading several image questions or the parts of a --chunk_lines submission (defaults to a per-provider limit for image questions, and to every part at once within the model's rate limits).",
+    "prompt_layout": "How the rendered prompt is ordered: 'default' follows the prompt template, 'cache_friendly' puts the parts shared by every submission (instructions, marking instructions, solution) first so that provider prompt caches can reuse them, followed by the student's files.",
+    "profile": "Directory to write a CPU profile (pstats), sampled stacks for flame graphs and a per-stage peak memory report of the run to.",
+    "metrics": "File to write per-stage timings, prompt and image sizes, token usage and retries of every submission to.",
+    "metrics_format": "Format of the --metrics file: 'jsonl' (one JSON object per submission, appended) or 'prometheus' (a textfile for the node exporter).",
+    "context_policy": "What to do when the rendered prompt does not fit the model's context window: 'shrink' truncates the test output, then omits the solution, then trims the submission around the lines the test output refers to; 'error' stops before sending; 'off' sends it unchanged.",
+    "max_file_lines": "Most lines of each submission, solution and test output file put in the prompt. Longer files keep their first and last lines, about half each, and the lines in between are replaced by a marker. Files are read line by line, so the limit also bounds memory use.",
+    "max_file_bytes": "Most bytes of numbered lines of each submission, solution and test output file put in the prompt, kept like with --max_file_lines.",
+    "submission_view": "How the submission is put in the prompt: 'full' (the default) numbers every line, 'diff' shows only the lines that differ from the starter code (or, without --starter, the solution), with context around them, keeping their line numbers. With starter code, the solution is shown as a diff against it too.",
+    "starter": "File path to the starter code given to students, compared with the submission by --submission_view diff.",
+    "diff_context": "Unchanged lines shown before and after every change with --submission_view diff.",
+    "chunk_lines": "Grade submissions longer than this many lines in parts of at most this many lines, cut at headings, notebook cells, top-level definitions or PDF outline entries, concurrently (up to --max_concurrency), then merge their feedback in a final request. Line numbers stay those of the whole file. Not used with --question.",
+    "stream": "Write the response to the output file (or stdout) as it is generated, and record the time to first token.",
+    "rate_limit": "Comma-separated overrides of the selected model's rate limits, e.g. requests_per_minute=100,tokens_per_minute=50000,max_concurrency=4,max_retries=3.",
+    "max_connections": "Maximum number of open connections per provider client (defaults to $AI_FEEDBACK_MAX_CONNECTIONS or 20).",
+    "max_keepalive": "Maximum number of idle connections kept open per provider client (defaults to $AI_FEEDBACK_MAX_KEEPALIVE or 10).",
+    "pattern": "Glob pattern used to select submission files when --submissions is a directory.",
+    "backend": "How batch requests are sent: 'live' sends one request per submission, 'provider_batch' submits them as one job to the OpenAI Batch API or Anthropic Message Batches and waits for it (resuming an interrupted job).",
+    "poll_interval": "Maximum number of seconds between status checks of a provider batch job.",
 }
@@ -0,0 +1,143 @@
+import os
+import struct
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+# Every entry starts with the time it was written, so that reading an entry (which refreshes its
+# modification time for LRU eviction) does not extend its time-to-live
+_HEADER = struct.Struct("<d")
+# Writes between two scans of the directory, which also count what other processes wrote
+SCAN_INTERVAL = 256
+
+
+class DiskCache:
+    """
+    A directory of cache entries that can be shared by several processes.
+
+    Entries are written to a temporary file and atomically renamed into place, so readers never see
+    a partial entry and concurrent writers of the same key simply replace each other. Each entry's
+    modification time is refreshed when it is read; once the directory grows past max_bytes the
+    least recently used entries are deleted.
+
+    The directory is scanned on the first write, and then only when the size of the entries, kept
+    up to date by every write of this process, passes max_bytes, or every SCAN_INTERVAL writes.
+    """
+
+    def __init__(self, directory: os.PathLike, max_bytes: int, ttl: Optional[float] = None) -> None:
+        """
+        Args:
+            directory (os.PathLike): Directory holding the entries; created if needed.
+            max_bytes (int): Total size the entries may occupy before eviction.
+            ttl (float, optional): Seconds an entry stays valid, or None for no expiry.
+        """
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Size of the entries as of the last scan plus this process's writes since, None before the first scan
+        self._size: Optional[int] = None
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the value stored under key, or None if it is missing or expired."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        if len(data) < _HEADER.size:
+            return None
+
+        (created,) = _HEADER.unpack_from(data)
+        if self.ttl is not None and time.time() - created > self.ttl:
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data[_HEADER.size :]
+
+    def set(self, key: str, value: bytes) -> None:
+        """Stores value under key, then evicts old entries if the cache is over its size limit."""
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        try:
+            replaced = path.stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_HEADER.pack(time.time()))
+                f.write(value)
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._remove(Path(tmp_path))
+            raise
+        with self._lock:
+            self._writes += 1
+            if self._size is not None:
+                self._size += _HEADER.size + len(value) - replaced
+            scan = self._size is None or self._size > self.max_bytes or self._writes % SCAN_INTERVAL == 0
+        if scan:
+            self.evict()
+
+    def evict(self) -> None:
+        """Deletes the least recently used entries until the cache fits in max_bytes.
+
+        Expired entries are deleted when they are next read.
+        """
+        entries = []
+        total = 0
+        now = time.time()
+        for bucket in os.scandir(self.directory):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.startswith(".tmp-"):
+                    # Leftover from a writer that died; give live writers time to finish
+                    if now - stat.st_mtime > 3600:
+                        self._remove(Path(entry.path))
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        if total > self.max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(Path(path))
+                total -= size
+        with self._lock:
+            self._size = total
+
+    def clear(self) -> None:
+        """Deletes every entry."""
+        for bucket in os.scandir(self.directory):
+            if bucket.is_dir():
+                for entry in os.scandir(bucket.path):
+                    self._remove(Path(entry.path))
+        with self._lock:
+            self._size = 0
+
+    @staticmethod
+    def _remove(path: Path) -> None:
+        # Another process may have evicted the same entry already
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
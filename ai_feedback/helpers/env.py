@@ -0,0 +1,14 @@
+import functools
+
+
+@functools.lru_cache(maxsize=None)
+def load_env() -> None:
+    """
+    Loads environment variables from a .env file.
+
+    Safe to call from every module that reads configuration from the environment; the file is
+    only searched for and read the first time.
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
@@ -1,7 +1,7 @@
 import os
 from pathlib import Path
 
-import nbformat
+from .metrics import timed
 
 
 def rename_files(file_path: str) -> str:
@@ -21,6 +21,7 @@ def rename_files(file_path: str) -> str:
     return file_path
 
 
+@timed("convert_notebook")
 def convert_ipynb_to_txt(ipynb_file_path: str, output_txt_file_path: str) -> str:
     """
     Converts a Jupyter notebook (.ipynb) file to a text (.txt) file.
@@ -32,6 +33,8 @@ def convert_ipynb_to_txt(ipynb_file_path: str, output_txt_file_path: str) -> str
     Returns:
         str: Path to the converted .txt file.
     """
+    import nbformat
+
     # Load the .ipynb file
     with open(ipynb_file_path, "r") as f:
         notebook = nbformat.read(f, as_version=4)
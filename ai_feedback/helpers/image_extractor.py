@@ -4,10 +4,16 @@ import json
 import os
 import re
 import tempfile
+import threading
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
+from .metrics import timed
 
+_PYPLOT_LOCK = threading.Lock()
+
+
+@timed("extract_images")
 def extract_images(input_notebook_path: os.PathLike, output_directory: os.PathLike, output_name: str) -> List[Path]:
     image_paths = []
     with open(input_notebook_path, "r") as file:
@@ -147,6 +153,7 @@ def extract_qmd_python_chunks_with_context(qmd_path: str) -> List[Dict[str, Any]
     return chunks
 
 
+@timed("extract_images")
 def extract_qmd_python_images(qmd_path: str, output_dir: Optional[str] = None, dpi: int = 120) -> List[str]:
     """
     Runs the python blocks of code and saves images using matplotlib.
@@ -163,6 +170,13 @@ def extract_qmd_python_images(qmd_path: str, output_dir: Optional[str] = None, d
     if not chunks:
         return []
 
+    # pyplot is patched while the chunks run, so only one document can be rendered at a time
+    with _PYPLOT_LOCK:
+        return _render_qmd_chunks(qmd_path, chunks, output_dir, dpi)
+
+
+def _render_qmd_chunks(qmd_path: str, chunks: List[Dict[str, Any]], output_dir: Optional[str], dpi: int) -> List[str]:
+    """Executes the extracted python chunks and saves every figure they produce."""
     outdir = Path(output_dir or tempfile.mkdtemp(prefix="qmd_py_imgs_"))
     outdir.mkdir(parents=True, exist_ok=True)
 
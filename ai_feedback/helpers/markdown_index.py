@@ -0,0 +1,119 @@
+"""
+Sections of Markdown files (and notebooks converted to text), found by their headings.
+
+A MarkdownSectionIndex is built once per file and holds its lines and every heading with its
+level, normalized title and line span, so any number of questions can be extracted without
+rescanning the file. Indexes are kept for the rest of the process by load_markdown_index(), keyed
+by the file's path, size and modification time, like the PDF indexes of helpers/pdf_index.py.
+"""
+
+import collections
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+# Indexes kept in memory by load_markdown_index()
+MAX_CACHED_INDEXES = 64
+
+_HEADER_RE = re.compile(r"^(#{1,6})\s+(.*)$")
+
+
+class Heading(NamedTuple):
+    title: str
+    # Title after normalize_text(), which questions are matched against
+    normalized: str
+    level: int
+    # The section spans lines start to end - 1, from the heading to the next one at its level or above
+    start: int
+    end: int
+
+
+class MarkdownSectionIndex:
+    """The lines of a Markdown file and its headings, indexed by normalized title."""
+
+    def __init__(self, lines: List[str]) -> None:
+        """
+        Args:
+            lines (List[str]): The lines of the file, with their line endings.
+        """
+        from .template_utils import normalize_text
+
+        self.lines = lines
+        found = []
+        for number, line in enumerate(lines):
+            match = _HEADER_RE.match(line)
+            if match:
+                found.append((number, len(match.group(1)), match.group(2).strip()))
+
+        ends = [len(lines)] * len(found)
+        open_headings: List[int] = []
+        for index, (number, level, _) in enumerate(found):
+            while open_headings and found[open_headings[-1]][1] >= level:
+                ends[open_headings.pop()] = number
+            open_headings.append(index)
+
+        self.headings = [
+            Heading(title, normalize_text(title), level, number, end)
+            for (number, level, title), end in zip(found, ends)
+        ]
+        # The first heading with every normalized title
+        self.positions: Dict[str, Heading] = {}
+        for heading in self.headings:
+            self.positions.setdefault(heading.normalized, heading)
+
+    @classmethod
+    def build(cls, file_path: Path | str) -> "MarkdownSectionIndex":
+        """Reads and indexes a Markdown file."""
+        with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+            return cls(f.readlines())
+
+    def section(self, question: str) -> Tuple[str, bool]:
+        """
+        Returns the block from the first heading titled question up to (but not including) the
+        next heading of the same or higher level.
+
+        Args:
+            question (str): The heading's title, matched after normalization.
+
+        Returns:
+            Tuple[str, bool]: The lines of the section, and False (with "") if no heading has that title.
+        """
+        from .template_utils import normalize_text
+
+        heading = self.positions.get(normalize_text(question))
+        if heading is None:
+            return "", False
+        return "".join(self.lines[heading.start : heading.end]), True
+
+    def sections(self, questions: Iterable[str]) -> Dict[str, Tuple[str, bool]]:
+        """Returns the section of every question, as section() does."""
+        return {question: self.section(question) for question in questions}
+
+
+_indexes: "collections.OrderedDict[Tuple[str, int, int], MarkdownSectionIndex]" = collections.OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def load_markdown_index(file_path: Path | str) -> MarkdownSectionIndex:
+    """
+    Returns the index of a Markdown file, reading it only if it changed since it was last indexed in this process.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+    """
+    stat = os.stat(file_path)
+    key = (os.path.realpath(file_path), stat.st_size, stat.st_mtime_ns)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+
+    index = MarkdownSectionIndex.build(file_path)
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            _indexes.popitem(last=False)
+    return index
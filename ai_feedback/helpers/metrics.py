@@ -0,0 +1,307 @@
+"""
+Per-stage timing metrics of grading runs.
+
+With --metrics PATH, each submission records how long its stages took, the size of its prompt
+and images, its token usage and its retries. The stages are notebook conversion, PDF parsing,
+image extraction, prompt rendering, the model call and output writing. The records are written
+to PATH as JSON lines, or as a Prometheus textfile with --metrics_format prometheus. Batch runs
+also get p50/p95/p99 times per stage.
+
+Stages nest: the time of render_prompt includes any parse_pdf it triggers, and the time of
+model_call includes response cache lookups and rate limit waits.
+
+Metrics are collected by a recorder held in a context variable, like the run stats, so
+concurrent daemon requests keep their own files. Without a recorder, stage() returns a shared
+no-op context manager, so instrumented code costs one context variable lookup.
+"""
+
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional
+
+from .run_stats import RunStats, current_run
+
+METRICS_FORMATS = ("jsonl", "prometheus")
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Run stats values copied into every record
+_USAGE_VALUES = ("input_tokens", "cached_input_tokens", "output_tokens", "retries", "rate_limit_wait_seconds")
+_NO_STAGE = contextlib.nullcontext()
+
+
+class MetricsRecorder:
+    """Collects the metrics of every submission of a run and writes them to a file."""
+
+    def __init__(self, path: str, format: str = "jsonl") -> None:
+        """
+        Args:
+            path (str): The file to write to. JSON lines are appended to it; a Prometheus textfile replaces it.
+            format (str): "jsonl" or "prometheus".
+        """
+        if format not in METRICS_FORMATS:
+            raise ValueError(f"Unknown metrics format '{format}'; expected one of: {', '.join(METRICS_FORMATS)}.")
+        self.path = path
+        self.format = format
+        self.records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def record(self, submission: str, status: str, seconds: float, stats: RunStats, **labels: Any) -> Dict[str, Any]:
+        """
+        Records the metrics of one submission; in the jsonl format, they are written straight away.
+
+        Args:
+            submission (str): Path of the submission.
+            status (str): "ok" or "error".
+            seconds (float): Total time spent on the submission.
+            stats (RunStats): The run stats collected for the submission.
+            **labels: Other fields of the record, e.g. model and scope.
+
+        Returns:
+            Dict[str, Any]: The record.
+        """
+        values = stats.as_dict()
+        record = {
+            "type": "submission",
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "submission": submission,
+            **labels,
+            "status": status,
+            "seconds": round(seconds, 6),
+            "stages": {stage: round(value, 6) for stage, value in stats.times().items()},
+            **stats.measurements(),
+            **{name: values[name] for name in _USAGE_VALUES if name in values},
+        }
+        with self._lock:
+            self.records.append(record)
+            if self.format == "jsonl":
+                self._append(record)
+        return record
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Summarizes the time of every stage, and of whole submissions under "total".
+
+        Returns:
+            Dict[str, Dict[str, float]]: For every stage, the number of submissions that went
+                through it, the sum of their times and the p50, p95 and p99 times.
+        """
+        with self._lock:
+            records = list(self.records)
+        samples: Dict[str, List[float]] = {"total": [record["seconds"] for record in records]}
+        for record in records:
+            for stage, seconds in record["stages"].items():
+                samples.setdefault(stage, []).append(seconds)
+        return {stage: _summarize(values) for stage, values in samples.items() if values}
+
+    def close(self) -> None:
+        """Writes the batch summary line (jsonl) or the textfile (prometheus)."""
+        with self._lock:
+            count = len(self.records)
+        if self.format == "prometheus":
+            self._write_textfile()
+        elif count > 1:
+            summary = {"type": "summary", "submissions": count, "stages": self.summary()}
+            with self._lock:
+                self._append(summary)
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as metrics_file:
+            metrics_file.write(json.dumps(record) + "\n")
+
+    def _write_textfile(self) -> None:
+        """Writes the metrics in the Prometheus text format, atomically for the node exporter's textfile collector."""
+        with self._lock:
+            records = list(self.records)
+        lines = [
+            "# HELP ai_feedback_stage_seconds Time spent in each stage of grading a submission.",
+            "# TYPE ai_feedback_stage_seconds summary",
+        ]
+        for stage, summary in self.summary().items():
+            for quantile in QUANTILES:
+                lines.append(
+                    f'ai_feedback_stage_seconds{{stage="{stage}",quantile="{quantile}"}} {summary[_quantile_name(quantile)]}'
+                )
+            lines.append(f'ai_feedback_stage_seconds_sum{{stage="{stage}"}} {summary["sum"]}')
+            lines.append(f'ai_feedback_stage_seconds_count{{stage="{stage}"}} {summary["count"]}')
+
+        statuses: Dict[str, int] = {}
+        totals: Dict[str, float] = {}
+        for record in records:
+            statuses[record["status"]] = statuses.get(record["status"], 0) + 1
+            for name, value in record.items():
+                if name not in ("seconds", "stages") and isinstance(value, (int, float)):
+                    totals[name] = totals.get(name, 0) + value
+        lines.append("# HELP ai_feedback_submissions_total Submissions graded, by status.")
+        lines.append("# TYPE ai_feedback_submissions_total counter")
+        lines.extend(
+            f'ai_feedback_submissions_total{{status="{status}"}} {count}' for status, count in statuses.items()
+        )
+        for name, value in sorted(totals.items()):
+            lines.append(f"# TYPE ai_feedback_{name}_total counter")
+            lines.append(f"ai_feedback_{name}_total {value}")
+
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as metrics_file:
+            metrics_file.write("\n".join(lines) + "\n")
+        os.replace(temporary, self.path)
+
+
+def _quantile_name(quantile: float) -> str:
+    return f"p{round(quantile * 100)}"
+
+
+def _percentile(values: List[float], quantile: float) -> float:
+    """Returns the quantile of sorted values, interpolating between the closest ranks."""
+    position = (len(values) - 1) * quantile
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def _summarize(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    summary: Dict[str, float] = {"count": len(values), "sum": round(sum(values), 6)}
+    for quantile in QUANTILES:
+        summary[_quantile_name(quantile)] = round(_percentile(values, quantile), 6)
+    return summary
+
+
+_current_recorder: contextvars.ContextVar[Optional[MetricsRecorder]] = contextvars.ContextVar("metrics", default=None)
+
+
+def start_metrics(path: str, format: str = "jsonl") -> MetricsRecorder:
+    """Starts recording metrics to path in the current thread or task and the ones it starts."""
+    recorder = MetricsRecorder(path, format)
+    _current_recorder.set(recorder)
+    return recorder
+
+
+def active_metrics() -> Optional[MetricsRecorder]:
+    """Returns the recorder metrics are collected for, or None if metrics are off."""
+    return _current_recorder.get()
+
+
+def finish_metrics() -> Optional[MetricsRecorder]:
+    """Writes the remaining metrics of the active recorder and stops recording.
+
+    Returns:
+        Optional[MetricsRecorder]: The recorder that was active, or None.
+    """
+    recorder = _current_recorder.get()
+    if recorder is not None:
+        recorder.close()
+        _current_recorder.set(None)
+    return recorder
+
+
+# Process-wide objects told when a stage starts and ends (see helpers/profiling.py), whether or not
+# metrics are recorded
+_stage_observers: List[Any] = []
+
+
+def add_stage_observer(observer: Any) -> None:
+    """Calls observer.stage_started(name) and observer.stage_ended(name) around every stage."""
+    _stage_observers.append(observer)
+
+
+def remove_stage_observer(observer: Any) -> None:
+    """Stops notifying an observer added with add_stage_observer()."""
+    _stage_observers.remove(observer)
+
+
+class _Stage:
+    """Adds the time spent in a with block to a stage of the current submission."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.stats = current_run()
+        self.observers = list(_stage_observers)
+
+    def __enter__(self) -> None:
+        for observer in self.observers:
+            observer.stage_started(self.name)
+        self.started_at = time.perf_counter()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stats.add_time(self.name, time.perf_counter() - self.started_at)
+        for observer in reversed(self.observers):
+            observer.stage_ended(self.name)
+
+
+def stage(name: str) -> ContextManager[None]:
+    """Times a with block as part of the named stage, if metrics are being recorded or the run is profiled."""
+    if _current_recorder.get() is None and not _stage_observers:
+        return _NO_STAGE
+    return _Stage(name)
+
+
+def timed(name: str) -> Callable:
+    """Decorator that times every call of a function as part of the named stage."""
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def measure(name: str, amount: float) -> None:
+    """Adds amount to a measurement of the current submission, e.g. prompt_bytes, if metrics are being recorded."""
+    if _current_recorder.get() is not None:
+        current_run().measure(name, amount)
+
+
+def record_submission(args, status: str, seconds: float) -> None:
+    """Records the metrics of the submission described by args, if metrics are being recorded.
+
+    Args:
+        args: Parsed argument namespace of the submission.
+        status (str): "ok" or "error".
+        seconds (float): Total time spent on the submission.
+    """
+    recorder = _current_recorder.get()
+    if recorder is not None:
+        recorder.record(args.submission, status, seconds, current_run(), model=args.model, scope=args.scope)
+
+
+@contextlib.contextmanager
+def submission_metrics(args) -> Iterator[None]:
+    """Times the with block as one submission and records its metrics, with status "error" if it raises."""
+    started_at = time.perf_counter()
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        record_submission(args, status, time.perf_counter() - started_at)
+
+
+def format_summary(summary: Dict[str, Dict[str, float]]) -> str:
+    """Formats MetricsRecorder.summary() as a table of stage times.
+
+    Args:
+        summary (Dict[str, Dict[str, float]]): The summary to format.
+
+    Returns:
+        str: One line per stage with its count and p50, p95 and p99 times in seconds.
+    """
+    width = max(len(stage) for stage in summary)
+    lines = [f"{'stage':<{width}}  {'count':>5}  {'p50':>8}  {'p95':>8}  {'p99':>8}"]
+    for stage_name, values in summary.items():
+        lines.append(
+            f"{stage_name:<{width}}  {values['count']:>5}  {values['p50']:>7.3f}s  {values['p95']:>7.3f}s  {values['p99']:>7.3f}s"
+        )
+    return "\n".join(lines)
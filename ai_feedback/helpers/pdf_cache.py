@@ -0,0 +1,141 @@
+"""
+Persistent cache of the outline and page text of parsed PDFs.
+
+The same solution and handout PDFs are parsed for every submission of an assignment, often by
+separate processes. Their parsed outline and page text are stored in a DiskCache, keyed by a
+hash of the file's contents, so copies of a file at different paths share an entry. Hashing a
+large file still takes time, so the content hash of each file is also stored under its path,
+device, inode, size and modification time, and a file that has not changed is not read again.
+
+Entries are zlib-compressed JSON. The cache can be shared by several processes and evicts the
+least recently used entries once it grows past its size limit. Each entry records the backend
+the text was extracted with (see helpers/pdf_text.py), and is only used when the text of that
+backend is asked for.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .disk_cache import DiskCache
+
+# Changed whenever the stored format or the way PDFs are parsed changes, which invalidates every entry
+FORMAT_VERSION = 2
+
+_DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "ai_feedback", "pdfs")
+
+_settings = {
+    "enabled": True,
+    "directory": os.getenv("AI_FEEDBACK_PDF_CACHE_DIR", _DEFAULT_DIRECTORY),
+    "max_bytes": 256 * 1024 * 1024,
+}
+_store: Optional[DiskCache] = None
+_store_lock = threading.Lock()
+
+
+def configure(enabled: Optional[bool] = None, directory: Optional[str] = None, max_bytes: Optional[int] = None) -> None:
+    """
+    Sets how parsed PDFs are cached. Options left as None keep their current value.
+
+    Args:
+        enabled (bool, optional): Whether parsed PDFs are read from and stored in the cache.
+        directory (str, optional): Directory of the on-disk cache.
+        max_bytes (int, optional): Size of the cache before least recently used PDFs are evicted.
+    """
+    global _store
+    with _store_lock:
+        for name, value in (("enabled", enabled), ("directory", directory), ("max_bytes", max_bytes)):
+            if value is not None:
+                _settings[name] = value
+        _store = None
+
+
+def _get_store() -> Optional[DiskCache]:
+    """Returns the on-disk store, or None if the cache is disabled or the directory is unusable."""
+    global _store
+    if not _settings["enabled"]:
+        return None
+    with _store_lock:
+        if _store is None:
+            try:
+                _store = DiskCache(_settings["directory"], _settings["max_bytes"])
+            except OSError as e:
+                print(f"Warning: PDF cache disabled, cannot use {_settings['directory']}: {e}", file=sys.stderr)
+                _settings["enabled"] = False
+                return None
+        return _store
+
+
+def _content_digest(store: DiskCache, pdf_path: Path | str) -> str:
+    """Returns the SHA-256 of a file, read from the cache if the file has not changed since it was hashed."""
+    stat = os.stat(pdf_path)
+    fingerprint = f"{os.path.realpath(pdf_path)}\0{stat.st_dev}\0{stat.st_ino}\0{stat.st_size}\0{stat.st_mtime_ns}"
+    fingerprint_key = hashlib.sha256(b"file:" + fingerprint.encode("utf-8", "surrogateescape")).hexdigest()
+    cached = store.get(fingerprint_key)
+    if cached is not None:
+        return cached.decode("ascii")
+
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    store.set(fingerprint_key, digest.hexdigest().encode("ascii"))
+    return digest.hexdigest()
+
+
+def _entry_key(digest: str) -> str:
+    return hashlib.sha256(f"pdf:{FORMAT_VERSION}:{digest}".encode("ascii")).hexdigest()
+
+
+def get(pdf_path: Path | str, backend: str = "auto") -> Optional[Tuple[List[Dict[str, Any]], List[str], str]]:
+    """
+    Returns the cached outline and page text of a PDF.
+
+    Args:
+        pdf_path (Path | str): Path to the PDF file.
+        backend (str): The backend the text must have been extracted with, or "auto" for any.
+
+    Returns:
+        Optional[Tuple[List[Dict[str, Any]], List[str], str]]: The flattened outline, the text of
+            every page and its backend, or None if the PDF is not cached (with that backend) or
+            the cache is disabled.
+    """
+    store = _get_store()
+    if store is None:
+        return None
+    try:
+        cached = store.get(_entry_key(_content_digest(store, pdf_path)))
+        if cached is None:
+            return None
+        entry = json.loads(zlib.decompress(cached))
+        if backend != "auto" and entry["backend"] != backend:
+            return None
+        return entry["toc"], entry["pages"], entry["backend"]
+    except (OSError, ValueError, KeyError, zlib.error) as e:
+        print(f"Warning: could not read the cached PDF {pdf_path}: {e}", file=sys.stderr)
+        return None
+
+
+def put(pdf_path: Path | str, toc: List[Dict[str, Any]], pages: List[str], backend: str) -> None:
+    """
+    Stores the outline and page text of a PDF, unless the cache is disabled.
+
+    Args:
+        pdf_path (Path | str): Path to the PDF file they were parsed from.
+        toc (List[Dict[str, Any]]): The flattened outline.
+        pages (List[str]): The text of every page.
+        backend (str): The backend the text was extracted with.
+    """
+    store = _get_store()
+    if store is None:
+        return
+    try:
+        entry = json.dumps({"toc": toc, "pages": pages, "backend": backend}, separators=(",", ":")).encode("utf-8")
+        store.set(_entry_key(_content_digest(store, pdf_path)), zlib.compress(entry))
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Warning: could not cache the parsed PDF {pdf_path}: {e}", file=sys.stderr)
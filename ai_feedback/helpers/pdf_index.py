@@ -0,0 +1,167 @@
+"""
+Parsed PDF documents shared by full-text rendering and --question lookups.
+
+A PdfDocumentIndex is built once per file and holds its outline (table of contents), the text
+of every page, the lines of the full text with their normalized forms, and dicts from a
+normalized heading or line to its positions, so finding a question's section does not rescan the
+document. Indexes are kept for the rest of the process by load_pdf_index(), keyed by the file's
+path, size and modification time, so the solution PDF of a batch is parsed once. The outline and
+page text are also kept on disk across runs and processes by helpers/pdf_cache.py, so a PDF is
+only parsed again when its contents change.
+"""
+
+import bisect
+import collections
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import pdf_cache, pdf_text
+from .metrics import timed
+
+# Indexes kept in memory by load_pdf_index()
+MAX_CACHED_INDEXES = 16
+
+
+class PdfDocumentIndex:
+    """The outline and text of a PDF, indexed by normalized heading and line."""
+
+    def __init__(self, toc: List[Dict[str, Any]], pages: List[str], backend: Optional[str] = None) -> None:
+        """
+        Args:
+            toc (List[Dict[str, Any]]): The flattened outline, as {title, page, level} dicts.
+            pages (List[str]): The text of every page.
+            backend (str, optional): The backend of helpers/pdf_text.py the page text was
+                extracted with, or None if it could not be extracted and pages only holds an
+                error message, in which case the index is not cached on disk.
+        """
+        from .template_utils import normalize_text
+
+        self.toc = toc
+        self.pages = pages
+        self.backend = backend
+        self.text = "".join(page + "\n" for page in pages).strip()
+        self.lines = self.text.split("\n")
+        self.normalized_lines = [normalize_text(line) for line in self.lines]
+
+        # Line indexes of every normalized line, in increasing order
+        self.line_positions: Dict[str, List[int]] = collections.defaultdict(list)
+        for index, line in enumerate(self.normalized_lines):
+            self.line_positions[line].append(index)
+        self.line_positions.default_factory = None
+
+        # Outline entries of every normalized title, and the entry after each one that is not below it
+        self.heading_positions: Dict[str, List[int]] = collections.defaultdict(list)
+        for index, entry in enumerate(toc):
+            self.heading_positions[normalize_text(entry["title"])].append(index)
+        self.heading_positions.default_factory = None
+        self.next_heading: List[Optional[int]] = [None] * len(toc)
+        open_entries: List[int] = []
+        for index, entry in enumerate(toc):
+            while open_entries and toc[open_entries[-1]]["level"] >= entry["level"]:
+                self.next_heading[open_entries.pop()] = index
+            open_entries.append(index)
+
+    @classmethod
+    @timed("parse_pdf")
+    def build(cls, pdf_path: Path | str) -> "PdfDocumentIndex":
+        """
+        Parses a PDF: its outline with PyMuPDF and its page text with the configured backend.
+
+        Raises:
+            Exception: If the outline cannot be read. A page text that cannot be extracted is
+                replaced by an error message, as extract_pdf_text() always did.
+        """
+        import pymupdf
+
+        with pymupdf.open(pdf_path) as doc:
+            toc = [{"title": row[1], "page": row[2], "level": row[0]} for row in doc.get_toc(simple=False)]
+            page_count = doc.page_count
+        try:
+            backend, pages = pdf_text.extract_pages(pdf_path, page_count)
+        except Exception as e:
+            print(f"Error extracting text from PDF {pdf_path}: {e}")
+            return cls(toc, [f"[Error: Could not extract text from PDF {os.path.basename(pdf_path)}]"])
+        return cls(toc, pages, backend)
+
+    def next_heading_title(self, heading: str) -> Optional[str]:
+        """Returns the title of the outline entry after the last one titled heading that is at its level or above."""
+        from .template_utils import normalize_text
+
+        positions = self.heading_positions.get(normalize_text(heading))
+        if not positions:
+            return None
+        following = self.next_heading[positions[-1]]
+        return self.toc[following]["title"] if following is not None else None
+
+    def extract_section(self, heading: str) -> Tuple[str, bool]:
+        """
+        Extracts the lines from the first one reading heading up to the line before the next
+        outline heading at its level or above.
+
+        Args:
+            heading (str): Title of an outline entry, matched after normalization.
+
+        Returns:
+            Tuple[str, bool]: The stripped lines of the section, and False (with "") if no
+                outline entry has that title.
+
+        Raises:
+            ValueError: If the heading is in the outline but no line of the text reads it.
+        """
+        from .template_utils import normalize_text
+
+        normalized_heading = normalize_text(heading)
+        if normalized_heading not in self.heading_positions:
+            print(f"[ERROR] Heading '{normalized_heading}' not found in TOC")
+            return "", False
+
+        starts = self.line_positions.get(normalized_heading)
+        if not starts:
+            raise ValueError(f"[ERROR] Start indices for heading '{heading}' not found.")
+        start_line = starts[0]
+        end_line = len(self.lines) - 1
+
+        next_title = self.next_heading_title(heading)
+        if next_title:
+            candidates = self.line_positions.get(normalize_text(next_title), [])
+            following = bisect.bisect_right(candidates, start_line)
+            if following < len(candidates):
+                end_line = candidates[following] - 1
+
+        return "\n".join(line.strip() for line in self.lines[start_line : end_line + 1]), True
+
+
+_indexes: "collections.OrderedDict[Tuple[str, int, int], PdfDocumentIndex]" = collections.OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def load_pdf_index(pdf_path: Path | str) -> PdfDocumentIndex:
+    """
+    Returns the index of a PDF, parsing it only if it is in neither this process's indexes nor the
+    on-disk cache.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+    """
+    stat = os.stat(pdf_path)
+    key = (os.path.realpath(pdf_path), stat.st_size, stat.st_mtime_ns)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+
+    cached = pdf_cache.get(pdf_path, pdf_text.resolve_backend())
+    if cached is not None:
+        index = PdfDocumentIndex(*cached)
+    else:
+        index = PdfDocumentIndex.build(pdf_path)
+        if index.backend is not None:
+            pdf_cache.put(pdf_path, index.toc, index.pages, index.backend)
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            _indexes.popitem(last=False)
+    return index
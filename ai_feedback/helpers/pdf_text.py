@@ -0,0 +1,116 @@
+"""
+Extraction of the page text of PDFs, with a choice of backend.
+
+Two backends are available: PyMuPDF ("pymupdf"), which is several times faster, and PyPDF2
+("pypdf2"), which earlier versions used. Their text is the same line for line under
+normalize_text() for the PDFs --question is meant for, so headings are found either way, although
+PyMuPDF keeps characters like zero-width spaces that PyPDF2 drops. Since the text ends up in
+prompts and response cache keys, "auto" is a fixed choice rather than a measured one: PyMuPDF if
+it is installed, PyPDF2 otherwise.
+
+The pages of a long PDF are split into contiguous ranges extracted by a pool of processes, one
+range per task, and put back together in page order. benchmarks/pdf_backends.py compares the
+backends with and without the pool.
+"""
+
+import functools
+import importlib.util
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+PDF_BACKENDS = ["auto", "pymupdf", "pypdf2"]
+
+# PDFs with at least this many pages are extracted by a pool of processes. Starting the processes
+# takes a few tenths of a second, more than PyMuPDF takes for hundreds of pages.
+PARALLEL_PAGES = {"pymupdf": 2000, "pypdf2": 200}
+# Pages extracted by each task of the pool
+PAGES_PER_TASK = 50
+
+_settings = {
+    "backend": os.getenv("AI_FEEDBACK_PDF_BACKEND", "auto"),
+    "workers": None,
+}
+
+
+def configure(backend: Optional[str] = None, workers: Optional[int] = None) -> None:
+    """
+    Sets how the text of PDFs is extracted. Options left as None keep their current value.
+
+    Args:
+        backend (str, optional): "pymupdf", "pypdf2" or "auto" for PyMuPDF if it is installed.
+        workers (int, optional): Most processes extracting the pages of a long PDF; 1 extracts
+            them in this process. Defaults to the number of CPUs.
+    """
+    if backend is not None and backend not in PDF_BACKENDS:
+        raise ValueError(f"Unknown PDF backend '{backend}', expected one of {PDF_BACKENDS}.")
+    for name, value in (("backend", backend), ("workers", workers)):
+        if value is not None:
+            _settings[name] = value
+
+
+def _pymupdf_pages(pdf_path: str, start: int, stop: int) -> List[str]:
+    import pymupdf
+
+    with pymupdf.open(pdf_path) as doc:
+        # PyMuPDF ends every page with a newline, which PyPDF2 does not
+        return [doc[number].get_text().rstrip("\n") for number in range(start, stop)]
+
+
+def _pypdf2_pages(pdf_path: str, start: int, stop: int) -> List[str]:
+    import PyPDF2
+
+    with open(pdf_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        return [reader.pages[number].extract_text() for number in range(start, stop)]
+
+
+# Extract the text of pages start to stop - 1; module-level so that pool processes can run them
+_EXTRACTORS: Dict[str, Callable[[str, int, int], List[str]]] = {
+    "pymupdf": _pymupdf_pages,
+    "pypdf2": _pypdf2_pages,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _pymupdf_installed() -> bool:
+    return importlib.util.find_spec("pymupdf") is not None
+
+
+def resolve_backend() -> str:
+    """Returns the backend PDFs are extracted with: the configured one, or for "auto" PyMuPDF if it is
+    installed and PyPDF2 otherwise."""
+    if _settings["backend"] != "auto":
+        return _settings["backend"]
+    return "pymupdf" if _pymupdf_installed() else "pypdf2"
+
+
+def extract_pages(pdf_path: Path | str, page_count: int) -> Tuple[str, List[str]]:
+    """
+    Extracts the text of every page of a PDF, in parallel if it is long.
+
+    Args:
+        pdf_path (Path | str): Path to the PDF file.
+        page_count (int): Number of pages of the PDF.
+
+    Returns:
+        Tuple[str, List[str]]: The backend used and the text of every page, in page order.
+
+    Raises:
+        Exception: Whatever the backend raises for a PDF it cannot read.
+    """
+    backend = resolve_backend()
+    extract = _EXTRACTORS[backend]
+    workers = min(_settings["workers"] or os.cpu_count() or 1, -(-page_count // PAGES_PER_TASK))
+    if workers <= 1 or page_count < PARALLEL_PAGES[backend]:
+        return backend, extract(str(pdf_path), 0, page_count)
+
+    starts = range(0, page_count, PAGES_PER_TASK)
+    stops = [min(start + PAGES_PER_TASK, page_count) for start in starts]
+    # Spawned rather than forked, since the batch runner and async models have threads running
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        ranges = pool.map(extract, itertools.repeat(str(pdf_path)), starts, stops)
+        return backend, [page for pages in ranges for page in pages]
@@ -0,0 +1,316 @@
+"""
+CPU and memory profiles of whole runs.
+
+With --profile DIR, the run is profiled and three files named after its start time and process id
+are written to DIR:
+
+- <name>.pstats: cProfile statistics of every thread, including the event loop thread of the
+  async models and the batch workers. Read them with `python -m pstats` or snakeviz.
+- <name>.collapsed: stacks of every thread sampled every few milliseconds, one
+  "frame;frame;... count" line per stack, for flamegraph.pl or speedscope. Samples are taken on
+  the wall clock, so threads waiting on the provider show up too.
+- <name>.memory.txt: the peak traced memory of every stage (see helpers/metrics.py) and the
+  allocation sites that grew the most during it, from tracemalloc snapshots taken when the stage
+  starts and ends.
+
+Profiling slows a run down considerably, tracemalloc in particular, so it is meant for
+investigating specific inputs. cProfile and tracemalloc are process-wide, so only one run of a
+process is profiled at a time, and the memory peaks of stages that run concurrently in batch
+workers overlap. Memory readings include the bookkeeping of cProfile and the stack sampler,
+usually a few MiB.
+"""
+
+import contextlib
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .metrics import add_stage_observer, remove_stage_observer
+
+# Seconds between two stack samples
+SAMPLE_INTERVAL = 0.005
+# Allocation sites listed per stage in the memory report
+TOP_ALLOCATIONS = 10
+
+_profile_lock = threading.Lock()
+
+
+class _ThreadProfilers:
+    """Runs a cProfile profiler in the current thread and every thread that starts after it.
+
+    Since Python 3.12, cProfile is built on sys.monitoring, so a single profiler sees every thread
+    and only one can be enabled at a time. Before that, each thread needs a profiler of its own.
+    """
+
+    def __init__(self) -> None:
+        self.profilers: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self._per_thread = sys.version_info < (3, 12)
+
+    def start(self) -> None:
+        if self._per_thread:
+            threading.setprofile(self._start_thread)
+        self._start_thread()
+
+    def _start_thread(self, *_: Any) -> None:
+        # Called by a new thread's first profile event; enabling the profiler replaces this hook
+        profiler = cProfile.Profile()
+        with self._lock:
+            self.profilers.append(profiler)
+        profiler.enable()
+
+    def stop(self) -> pstats.Stats:
+        """Stops every profiler and merges the statistics of every thread."""
+        if self._per_thread:
+            threading.setprofile(None)
+        with self._lock:
+            profilers = list(self.profilers)
+        for profiler in profilers:
+            profiler.disable()
+        stats = pstats.Stats(profilers[0])
+        for profiler in profilers[1:]:
+            profiler.create_stats()
+            # A thread that made no call while it was profiled has no statistics to merge
+            if profiler.stats:
+                stats.add(profiler)
+        return stats
+
+
+class _StackSampler(threading.Thread):
+    """Counts the stacks of every other thread at a fixed interval."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL) -> None:
+        super().__init__(name="ai_feedback-profiler", daemon=True)
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.counts[";".join(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+    def collapsed(self) -> str:
+        """Returns the samples in the collapsed stack format."""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.counts.items()))
+
+
+class _Snapshot(NamedTuple):
+    snapshot: tracemalloc.Snapshot
+    # Traced memory taken up by the snapshot itself
+    size: int
+
+
+class _OpenStage(NamedTuple):
+    name: str
+    start: int
+    snapshot: _Snapshot
+
+
+class _StageMemory:
+    """The memory used by every call of one stage."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.peak_growth = 0
+        self.retained = 0
+        # Snapshots from the start and end of the call with the highest peak, compared once the run has ended
+        self.snapshots: Optional[Tuple[_Snapshot, _Snapshot]] = None
+
+    def top_allocations(self) -> List[tracemalloc.StatisticDiff]:
+        """Returns the allocation sites that grew the most during the call with the highest peak."""
+        if self.snapshots is None:
+            return []
+        start, end = self.snapshots
+        own_files = (__file__, tracemalloc.__file__)
+        differences = [
+            difference
+            for difference in end.snapshot.compare_to(start.snapshot, "lineno")
+            if difference.traceback[0].filename not in own_files
+        ]
+        return differences[:TOP_ALLOCATIONS]
+
+
+class _MemoryTracker:
+    """
+    Records the peak traced memory of every stage, and the allocation sites that grew during it.
+
+    Snapshots are traced like any other allocation, so the memory held by the snapshots kept for
+    the report is subtracted from every reading.
+    """
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, _StageMemory] = {}
+        self.run_peak = 0
+        self._open = threading.local()
+        self._peaks: Dict[int, int] = {}
+        self._overhead = 0
+        self._lock = threading.Lock()
+        self._started_tracing = False
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self.stage_started("run")
+
+    def stop(self) -> None:
+        self.stage_ended("run")
+        if self._started_tracing:
+            tracemalloc.stop()
+
+    def _track_peak(self) -> int:
+        """Folds the peak since the last stage boundary into every open stage, and starts a new peak.
+
+        Returns:
+            int: The traced memory in use, without the snapshots.
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            peak -= self._overhead
+            self.run_peak = max(self.run_peak, peak)
+            for key in self._peaks:
+                self._peaks[key] = max(self._peaks[key], peak)
+            current -= self._overhead
+        tracemalloc.reset_peak()
+        return current
+
+    def _take_snapshot(self) -> _Snapshot:
+        before = tracemalloc.get_traced_memory()[0]
+        snapshot = tracemalloc.take_snapshot()
+        size = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.reset_peak()
+        with self._lock:
+            self._overhead += size
+        return _Snapshot(snapshot, size)
+
+    def _release(self, *snapshots: _Snapshot) -> None:
+        with self._lock:
+            self._overhead -= sum(snapshot.size for snapshot in snapshots)
+
+    def stage_started(self, name: str) -> None:
+        stack = getattr(self._open, "stack", None)
+        if stack is None:
+            stack = self._open.stack = []
+        current = self._track_peak()
+        entry = _OpenStage(name, current, self._take_snapshot())
+        with self._lock:
+            self._peaks[id(entry)] = current
+        stack.append(entry)
+
+    def stage_ended(self, name: str) -> None:
+        stack = getattr(self._open, "stack", None)
+        if not stack or stack[-1].name != name:
+            # The stage started before profiling did
+            return
+        entry = stack.pop()
+        current = self._track_peak()
+        with self._lock:
+            peak = self._peaks.pop(id(entry))
+        snapshot = self._take_snapshot()
+        released: Tuple[_Snapshot, ...] = (entry.snapshot, snapshot)
+        with self._lock:
+            memory = self.stages.setdefault(name, _StageMemory())
+            memory.calls += 1
+            memory.retained += current - entry.start
+            if peak - entry.start >= memory.peak_growth:
+                memory.peak_growth = peak - entry.start
+                released = memory.snapshots or ()
+                memory.snapshots = (entry.snapshot, snapshot)
+        self._release(*released)
+
+    def report(self) -> str:
+        """Formats the peak memory of every stage and the allocation sites of its largest call."""
+        width = max([len(name) for name in self.stages] + [5])
+        lines = [
+            f"Peak traced memory of the run: {_format_size(self.run_peak)}",
+            "",
+            f"{'stage':<{width}}  {'calls':>5}  {'peak above start':>16}  {'retained':>10}",
+        ]
+        for name, memory in self.stages.items():
+            lines.append(
+                f"{name:<{width}}  {memory.calls:>5}  {_format_size(memory.peak_growth):>16}  "
+                f"{_format_size(memory.retained):>10}"
+            )
+        for name, memory in self.stages.items():
+            lines.append("")
+            lines.append(f"Allocation sites that grew the most during {name} (its largest call):")
+            for difference in memory.top_allocations():
+                frame = difference.traceback[0]
+                lines.append(f"  {_format_size(difference.size_diff):>10}  {frame.filename}:{frame.lineno}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_size(size: int) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+@contextlib.contextmanager
+def profile_run(directory: str, interval: float = SAMPLE_INTERVAL) -> Iterator[Optional[str]]:
+    """
+    Profiles the with block and writes its CPU and memory profiles to directory.
+
+    Args:
+        directory (str): Directory to write the profiles to; created if needed.
+        interval (float): Seconds between two stack samples.
+
+    Yields:
+        Optional[str]: The path the profile files start with, or None if another run of this
+            process is already being profiled.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        print("Warning: another run is already being profiled; --profile is ignored.", file=sys.stderr)
+        yield None
+        return
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.join(directory, f"ai_feedback_{datetime.now():%Y%m%d_%H%M%S}_{os.getpid()}")
+        memory = _MemoryTracker()
+        sampler = _StackSampler(interval)
+        profilers = _ThreadProfilers()
+
+        memory.start()
+        add_stage_observer(memory)
+        sampler.start()
+        profilers.start()
+        try:
+            yield prefix
+        finally:
+            stats = profilers.stop()
+            sampler.stop()
+            remove_stage_observer(memory)
+            memory.stop()
+
+            stats.dump_stats(f"{prefix}.pstats")
+            with open(f"{prefix}.collapsed", "w", encoding="utf-8") as collapsed_file:
+                collapsed_file.write(sampler.collapsed())
+            with open(f"{prefix}.memory.txt", "w", encoding="utf-8") as memory_file:
+                memory_file.write(memory.report())
+            print(f"Profile written to {prefix}.pstats, .collapsed and .memory.txt", file=sys.stderr)
+    finally:
+        _profile_lock.release()
@@ -0,0 +1,122 @@
+"""
+Deferring model requests to provider batch APIs.
+
+In provider batch mode (see ai_feedback/batch_api.py) every submission is processed twice. In the
+first pass the prompts are rendered as usual, but the models that support batching pass their
+request body to batch_response(), which records it and stops the submission with DeferredRequest
+instead of calling the provider. The recorded requests are then submitted as one batch job. Once
+the job has ended, the second pass renders the prompts again and batch_response() answers every
+request from the job's results, so the responses are cached and written like any other.
+
+Requests are identified by a hash of their provider and body, so the results of a job can be
+matched to submissions again after a restart.
+"""
+
+import contextlib
+import contextvars
+import hashlib
+import json
+import threading
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+from .run_stats import current_run
+
+
+class BatchOutcome(NamedTuple):
+    """The result of one request of a provider batch job."""
+
+    response: Optional[str]
+    error: Optional[str] = None
+
+
+class DeferredRequest(Exception):
+    """Raised in place of sending a request that was recorded for a provider batch job."""
+
+    def __init__(self, custom_id: str) -> None:
+        super().__init__(f"Request {custom_id} was deferred to a provider batch job.")
+        self.custom_id = custom_id
+
+
+class BatchRequests:
+    """
+    The requests recorded for a provider batch job, or the results it returned.
+
+    Without results, batch_response() records requests; with results, it answers them.
+    """
+
+    def __init__(self, results: Optional[Dict[str, BatchOutcome]] = None, batch_id: Optional[str] = None) -> None:
+        """
+        Args:
+            results (Dict[str, BatchOutcome], optional): The results of an ended job by request id.
+            batch_id (str, optional): The id of the job the results came from.
+        """
+        self.results = results
+        self.batch_id = batch_id
+        self.requests: Dict[str, Tuple[str, dict]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, custom_id: str, provider: str, body: dict) -> None:
+        """Adds a request to the job; identical requests from several submissions are sent once."""
+        with self._lock:
+            self.requests[custom_id] = (provider, body)
+
+
+_current_batch: contextvars.ContextVar[Optional[BatchRequests]] = contextvars.ContextVar("provider_batch", default=None)
+
+
+def active_batch() -> Optional[BatchRequests]:
+    """Returns the provider batch requests are being recorded for or answered from, or None."""
+    return _current_batch.get()
+
+
+@contextlib.contextmanager
+def provider_batch(batch: BatchRequests) -> Iterator[BatchRequests]:
+    """Records or answers the requests made in the current thread or task until the block exits."""
+    token = _current_batch.set(batch)
+    try:
+        yield batch
+    finally:
+        _current_batch.reset(token)
+
+
+def request_id(provider: str, body: dict) -> str:
+    """Returns the id of a request in a batch job, derived from its provider and body."""
+    encoded = json.dumps([provider, body], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:32]
+
+
+def batch_response(provider: str, body: dict) -> Optional[str]:
+    """
+    Called by models with the request they are about to send.
+
+    Args:
+        provider (str): The batch API the request belongs to ("openai" or "anthropic").
+        body (dict): The request parameters; parameters set to None are left out.
+
+    Returns:
+        Optional[str]: None if no provider batch is active, in which case the request should be
+            sent as usual. Otherwise the response text from the batch job's results.
+
+    Raises:
+        DeferredRequest: If the request was recorded for a job that has not been submitted yet.
+        RuntimeError: If the request failed in the job or was not part of it.
+    """
+    batch = _current_batch.get()
+    if batch is None:
+        return None
+
+    body = {name: value for name, value in body.items() if value is not None}
+    custom_id = request_id(provider, body)
+    if batch.results is None:
+        batch.record(custom_id, provider, body)
+        raise DeferredRequest(custom_id)
+
+    outcome = batch.results.get(custom_id)
+    if outcome is None:
+        raise RuntimeError(
+            f"Request {custom_id} is not part of provider batch {batch.batch_id}; run the batch again to submit it."
+        )
+    if outcome.error is not None:
+        raise RuntimeError(f"Request {custom_id} failed in provider batch {batch.batch_id}: {outcome.error}")
+    current_run().set("provider_batch", batch.batch_id)
+    return outcome.response
@@ -0,0 +1,462 @@
+"""
+Rate limiting and retries for model providers.
+
+Every provider call goes through the RateLimiter of its model key (see arg_options.rate_limits):
+
+- Requests and tokens per minute are metered by token buckets kept in a small state file per
+  model key, locked with fcntl, so that every thread, asyncio task and worker process on the host
+  shares the same budget. A Retry-After received by one process pauses the others too.
+- Concurrent requests are limited per process by an AIMD gate: the limit grows by one request
+  per "limit" successful calls and is halved whenever the provider answers 429/529 or a call takes
+  much longer than usual.
+- Transient failures (rate limits, overload, 5xx, timeouts, dropped connections) are retried with
+  exponential backoff and full jitter, waiting at least as long as the provider's Retry-After.
+"""
+
+import asyncio
+import email.utils
+import functools
+import inspect
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    NamedTuple,
+    Optional,
+    TypeVar,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows: limits are only shared by the threads of one process
+    fcntl = None
+
+from .provider_batch import active_batch
+from .run_stats import current_run
+from .streaming import current_sink
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+# Status codes that mean the provider wants fewer concurrent requests
+OVERLOAD_STATUS_CODES = {429, 529}
+# Exception classes (matched by name, so that no SDK has to be imported) for connection problems
+_TRANSIENT_ERROR_NAMES = {"APIConnectionError", "TransportError", "ConnectionError", "TimeoutError"}
+
+_DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "ai_feedback", "rate_limits")
+
+
+class RateLimit(NamedTuple):
+    """Limits and retry policy for one model key."""
+
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+    max_concurrency: int = 4
+    max_retries: int = 5
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+    # A call slower than this multiple of the average latency counts as a latency spike
+    latency_spike_factor: float = 4.0
+
+
+class _SharedBuckets:
+    """Requests-per-minute and tokens-per-minute buckets in a state file shared by every process on the host."""
+
+    def __init__(self, path: str, limit: RateLimit) -> None:
+        self.path = path
+        self.capacities = {"requests": limit.requests_per_minute, "tokens": limit.tokens_per_minute}
+        self._lock = threading.Lock()
+        self._state: Dict[str, float] = {}
+
+    def _update(self, change: Callable[[Dict[str, float]], Any]) -> Any:
+        """Applies change to the state under the inter-process lock and saves it."""
+        with self._lock:
+            if fcntl is None:
+                return change(self._state)
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, "a+", encoding="utf-8") as f:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                    f.seek(0)
+                    try:
+                        state = json.loads(f.read() or "{}")
+                    except ValueError:
+                        state = {}
+                    result = change(state)
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    return result
+            except OSError:
+                # Fall back to limiting this process only
+                return change(self._state)
+
+    def reserve(self, tokens: int) -> float:
+        """Takes one request and the given tokens from the buckets.
+
+        Returns:
+            float: 0 if they were taken, otherwise the number of seconds to wait before trying again.
+        """
+
+        def take(state: Dict[str, float]) -> float:
+            now = time.time()
+            elapsed = max(0.0, now - state.get("updated", now))
+            state["updated"] = now
+            wait = max(0.0, state.get("blocked_until", 0.0) - now)
+
+            needed = {"requests": 1, "tokens": tokens}
+            for name, capacity in self.capacities.items():
+                if not capacity:
+                    continue
+                level = min(capacity, state.get(name, capacity) + elapsed * capacity / 60)
+                state[name] = level
+                # A request larger than the whole bucket waits for a full bucket rather than forever
+                shortfall = min(needed[name], capacity) - level
+                if shortfall > 0:
+                    wait = max(wait, shortfall * 60 / capacity)
+            if wait == 0:
+                for name, capacity in self.capacities.items():
+                    if capacity:
+                        state[name] -= min(needed[name], capacity)
+            return wait
+
+        return self._update(take)
+
+    def block(self, seconds: float) -> None:
+        """Stops every process from sending requests for the given number of seconds."""
+
+        def extend(state: Dict[str, float]) -> None:
+            state["blocked_until"] = max(state.get("blocked_until", 0.0), time.time() + seconds)
+
+        self._update(extend)
+
+
+class _AdaptiveGate:
+    """A concurrency limit with additive increase and multiplicative decrease.
+
+    It can be waited on from threads and from any event loop.
+    """
+
+    def __init__(self, max_limit: int) -> None:
+        self.max_limit = max(1, max_limit)
+        self.limit = float(self.max_limit)
+        self.active = 0
+        self._lock = threading.Lock()
+        self._waiters: deque = deque()
+
+    def _has_room(self) -> bool:
+        return self.active < max(1, int(self.limit))
+
+    def _wake_waiters(self) -> None:
+        # Called with the lock held; a woken waiter owns the slot taken for it
+        while self._waiters and self._has_room():
+            self.active += 1
+            self._waiters.popleft()()
+
+    def acquire(self) -> None:
+        with self._lock:
+            if not self._waiters and self._has_room():
+                self.active += 1
+                return
+            event = threading.Event()
+            self._waiters.append(event.set)
+        event.wait()
+
+    async def aacquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if not self._waiters and self._has_room():
+                self.active += 1
+                return
+            future = loop.create_future()
+
+            def wake() -> None:
+                loop.call_soon_threadsafe(resolve)
+
+            def resolve() -> None:
+                # The waiter may have been cancelled after its slot was taken; give the slot back
+                if future.done():
+                    self.release()
+                else:
+                    future.set_result(None)
+
+            self._waiters.append(wake)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = wake in self._waiters
+                if queued:
+                    self._waiters.remove(wake)
+            if not queued and future.done() and not future.cancelled():
+                # Cancelled after being woken up: the slot is ours to give back
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            self.active -= 1
+            self._wake_waiters()
+
+    def increase(self) -> None:
+        with self._lock:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._wake_waiters()
+
+    def decrease(self) -> None:
+        with self._lock:
+            self.limit = max(1.0, self.limit / 2)
+
+
+def _chain(error: Optional[BaseException]) -> Iterator[BaseException]:
+    """Yields an error followed by the errors it was raised from or while handling."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    """Returns the HTTP status code of a provider error or of the error it was raised from."""
+    for cause in _chain(error):
+        status = getattr(cause, "status_code", None)
+        if status is None:
+            status = getattr(getattr(cause, "response", None), "status_code", None)
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def _is_transient(error: BaseException) -> bool:
+    """Returns whether an error is a dropped connection or timeout, rather than a rejected request."""
+    for cause in _chain(error):
+        if isinstance(cause, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+            return True
+        if any(cls.__name__ in _TRANSIENT_ERROR_NAMES for cls in type(cause).__mro__):
+            return True
+    return False
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """Returns the number of seconds the provider asked to wait before retrying, if it said so."""
+    for cause in _chain(error):
+        headers = getattr(getattr(cause, "response", None), "headers", None)
+        if headers is not None:
+            milliseconds = headers.get("retry-after-ms")
+            if milliseconds:
+                try:
+                    return float(milliseconds) / 1000
+                except ValueError:
+                    pass
+            value = headers.get("retry-after")
+            if value:
+                try:
+                    return max(0.0, float(value))
+                except ValueError:
+                    pass
+                try:
+                    # Retry-After may also be an HTTP date
+                    return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+    return None
+
+
+class RateLimiter:
+    """Meters, limits and retries the calls made for one model key."""
+
+    def __init__(self, key: str, limit: RateLimit, directory: str) -> None:
+        self.key = key
+        self.limit = limit
+        file_name = re.sub(r"[^A-Za-z0-9_.-]", "_", key) + ".json"
+        self.buckets = _SharedBuckets(os.path.join(directory, file_name), limit)
+        self.gate = _AdaptiveGate(limit.max_concurrency)
+        self._latency: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _retry_delay(self, error: BaseException, attempt: int, streamed: bool) -> Optional[float]:
+        """Returns how long to wait before retrying after error, or None if it should not be retried."""
+        status = _status_code(error)
+        if attempt >= self.limit.max_retries or streamed:
+            # Part of the response was already written out and cannot be taken back
+            return None
+        if status is None and not _is_transient(error):
+            return None
+        if status is not None and status not in RETRYABLE_STATUS_CODES:
+            return None
+
+        delay = random.uniform(0, min(self.limit.max_delay, self.limit.base_delay * 2**attempt))
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = retry_after + random.uniform(0, self.limit.base_delay)
+        if status in OVERLOAD_STATUS_CODES:
+            self.gate.decrease()
+            self.buckets.block(delay)
+        current_run().increment("retries")
+        return delay
+
+    def _record_latency(self, seconds: float) -> None:
+        """Grows the concurrency limit after a normal call and shrinks it after a latency spike."""
+        with self._lock:
+            average = self._latency
+            self._latency = seconds if average is None else 0.8 * average + 0.2 * seconds
+        if average is not None and seconds > self.limit.latency_spike_factor * average:
+            self.gate.decrease()
+        else:
+            self.gate.increase()
+
+    async def arun(self, call: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        """Awaits call() within the limits, retrying transient failures.
+
+        The shared buckets are locked and updated in a worker thread, since another process may hold
+        their file lock and the event loop must not wait for it.
+
+        Args:
+            call (Callable[[], Awaitable[T]]): Makes the request; called again for every attempt.
+            tokens (int): Estimated number of tokens the request uses.
+        """
+        attempt = 0
+        while True:
+            wait = await asyncio.to_thread(self.buckets.reserve, tokens)
+            while wait > 0:
+                current_run().increment("rate_limit_wait_seconds", round(wait, 2))
+                await asyncio.sleep(wait)
+                wait = await asyncio.to_thread(self.buckets.reserve, tokens)
+
+            await self.gate.aacquire()
+            sink = current_sink()
+            written = sink.written if sink is not None else 0
+            start = time.perf_counter()
+            try:
+                result = await call()
+            except Exception as e:
+                streamed = sink is not None and sink.written != written
+                # Blocks the shared buckets after a rate limit error, which writes their file
+                delay = await asyncio.to_thread(self._retry_delay, e, attempt, streamed)
+                if delay is None:
+                    raise
+            else:
+                self._record_latency(time.perf_counter() - start)
+                return result
+            finally:
+                self.gate.release()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def run(self, call: Callable[[], T], tokens: int = 0) -> T:
+        """Calls call() within the limits, retrying transient failures.
+
+        Args:
+            call (Callable[[], T]): Makes the request; called again for every attempt.
+            tokens (int): Estimated number of tokens the request uses.
+        """
+        attempt = 0
+        while True:
+            wait = self.buckets.reserve(tokens)
+            while wait > 0:
+                current_run().increment("rate_limit_wait_seconds", round(wait, 2))
+                time.sleep(wait)
+                wait = self.buckets.reserve(tokens)
+
+            self.gate.acquire()
+            sink = current_sink()
+            written = sink.written if sink is not None else 0
+            start = time.perf_counter()
+            try:
+                result = call()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, sink is not None and sink.written != written)
+                if delay is None:
+                    raise
+            else:
+                self._record_latency(time.perf_counter() - start)
+                return result
+            finally:
+                self.gate.release()
+            attempt += 1
+            time.sleep(delay)
+
+
+_settings = {"directory": os.getenv("AI_FEEDBACK_RATE_LIMIT_DIR", _DEFAULT_DIRECTORY)}
+_overrides: Dict[str, Dict[str, Any]] = {}
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def configure(model_key: Optional[str] = None, directory: Optional[str] = None, **overrides: Any) -> None:
+    """
+    Overrides the limits of a model key, and where the limiter state shared between processes is kept.
+
+    Args:
+        model_key (str, optional): The model whose limits are overridden.
+        directory (str, optional): Directory of the shared state files.
+        **overrides: RateLimit fields to override, e.g. requests_per_minute=100.
+    """
+    unknown = set(overrides) - set(RateLimit._fields)
+    if unknown:
+        raise ValueError(f"Unknown rate limit option(s): {', '.join(sorted(unknown))}")
+    with _limiters_lock:
+        if directory is not None:
+            _settings["directory"] = directory
+            _limiters.clear()
+        if model_key is not None and overrides:
+            _overrides.setdefault(model_key, {}).update(overrides)
+            _limiters.pop(model_key, None)
+
+
+def get_limiter(model_key: str) -> RateLimiter:
+    """Returns the rate limiter of a model key, configured from arg_options.rate_limits."""
+    from .arg_options import rate_limits
+
+    with _limiters_lock:
+        limiter = _limiters.get(model_key)
+        if limiter is None:
+            limit = rate_limits.get(model_key, RateLimit())._replace(**_overrides.get(model_key, {}))
+            limiter = _limiters[model_key] = RateLimiter(model_key, limit, _settings["directory"])
+        return limiter
+
+
+def estimate_tokens(*values: Any) -> int:
+    """Roughly estimates the number of tokens of the text values (about 4 characters per token)."""
+    return sum(len(value) for value in values if isinstance(value, str)) // 4 + 1
+
+
+def rate_limited(model_key: str) -> Callable:
+    """
+    Decorates a Model.generate_response or Model.agenerate_response implementation so that its
+    calls go through the rate limiter of model_key.
+    """
+
+    def decorator(generate_response: Callable) -> Callable:
+        if inspect.iscoroutinefunction(generate_response):
+
+            @functools.wraps(generate_response)
+            async def async_wrapper(self, *args: Any, **kwargs: Any):
+                if active_batch() is not None:
+                    # Requests are recorded or answered locally, not sent
+                    return await generate_response(self, *args, **kwargs)
+                tokens = estimate_tokens(*args, *kwargs.values())
+                return await get_limiter(model_key).arun(lambda: generate_response(self, *args, **kwargs), tokens)
+
+            return async_wrapper
+
+        @functools.wraps(generate_response)
+        def wrapper(self, *args: Any, **kwargs: Any):
+            if active_batch() is not None:
+                return generate_response(self, *args, **kwargs)
+            tokens = estimate_tokens(*args, *kwargs.values())
+            return get_limiter(model_key).run(lambda: generate_response(self, *args, **kwargs), tokens)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,207 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional
+
+from .disk_cache import DiskCache
+from .run_stats import current_run
+
+CACHE_MODES = ["use", "bypass", "refresh"]
+
+_DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "ai_feedback", "responses")
+
+_settings = {
+    "mode": "use",
+    "directory": os.getenv("AI_FEEDBACK_CACHE_DIR", _DEFAULT_DIRECTORY),
+    "max_bytes": 512 * 1024 * 1024,
+    "ttl": 7 * 24 * 3600.0,
+}
+_store: Optional[DiskCache] = None
+_store_lock = threading.Lock()
+
+
+def configure(
+    mode: Optional[str] = None,
+    directory: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+    ttl: Optional[float] = None,
+) -> None:
+    """
+    Sets how LLM responses are cached. Options left as None keep their current value.
+
+    Args:
+        mode (str, optional): "use" to read and write the cache, "bypass" to ignore it entirely,
+            or "refresh" to skip reading but store the new responses.
+        directory (str, optional): Directory of the on-disk cache.
+        max_bytes (int, optional): Size of the cache before least recently used responses are evicted.
+        ttl (float, optional): Seconds a cached response stays valid.
+    """
+    global _store
+    if mode is not None and mode not in CACHE_MODES:
+        raise ValueError(f"Unknown cache mode '{mode}', expected one of {CACHE_MODES}.")
+    with _store_lock:
+        for name, value in (("mode", mode), ("directory", directory), ("max_bytes", max_bytes), ("ttl", ttl)):
+            if value is not None:
+                _settings[name] = value
+        _store = None
+
+
+def _get_store() -> Optional[DiskCache]:
+    """Returns the on-disk store, or None if caching is bypassed or the directory is unusable."""
+    global _store
+    if _settings["mode"] == "bypass":
+        return None
+    with _store_lock:
+        if _store is None:
+            try:
+                _store = DiskCache(_settings["directory"], _settings["max_bytes"], _settings["ttl"])
+            except OSError as e:
+                print(f"Warning: response cache disabled, cannot use {_settings['directory']}: {e}", file=sys.stderr)
+                _settings["mode"] = "bypass"
+                return None
+        return _store
+
+
+def _hash_value(value: Any) -> Any:
+    """Converts a key part to something JSON-serializable, replacing bytes by their digest."""
+    if isinstance(value, bytes):
+        return {"sha256": hashlib.sha256(value).hexdigest()}
+    if isinstance(value, dict):
+        return {str(k): _hash_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_hash_value(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def make_key(**parts: Any) -> str:
+    """Returns a content hash identifying a request made up of the given parts."""
+    canonical = json.dumps(_hash_value(parts), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def read_file_bytes(path: Optional[os.PathLike]) -> Optional[bytes]:
+    """Returns the contents of a file referenced by a request, or None if there is no such file."""
+    if path and os.path.isfile(path):
+        return Path(path).read_bytes()
+    return None
+
+
+def _lookup(key_parts: dict) -> tuple[Optional[DiskCache], Optional[str], Any]:
+    """Returns the store, the key and the cached result (None on a miss) for a request."""
+    store = _get_store()
+    if store is None:
+        return None, None, None
+
+    key = make_key(**key_parts)
+    if _settings["mode"] == "use":
+        cached = store.get(key)
+        if cached is not None:
+            current_run().increment("cache_hits")
+            return store, key, json.loads(cached)
+    current_run().increment("cache_misses")
+    return store, key, None
+
+
+def _store_result(store: Optional[DiskCache], key: Optional[str], result: Any) -> None:
+    """Stores a newly computed result, unless caching is bypassed or the result is None."""
+    if store is None or result is None:
+        return
+    try:
+        store.set(key, json.dumps(result).encode("utf-8"))
+    except (OSError, TypeError) as e:
+        print(f"Warning: could not cache response: {e}", file=sys.stderr)
+
+
+def cached_call(key_parts: dict, compute: Callable[[], Any]) -> Any:
+    """
+    Returns the cached result for a request, calling compute and storing its result on a miss.
+
+    Results must be JSON-serializable. None results are not cached. Hits and misses are counted in
+    the current run's stats.
+
+    Args:
+        key_parts (dict): Everything that determines the response (model, prompt, options, attachments...).
+        compute (Callable[[], Any]): Makes the actual request.
+
+    Returns:
+        Any: The cached or newly computed result.
+    """
+    store, key, cached = _lookup(key_parts)
+    if cached is not None:
+        return cached
+    result = compute()
+    _store_result(store, key, result)
+    return result
+
+
+async def acached_call(key_parts: dict, compute: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Coroutine version of cached_call, for requests made by awaiting compute().
+
+    The cache is read and written in a worker thread, so that its disk I/O (including eviction
+    scans) does not hold up the other requests on the event loop.
+
+    Args:
+        key_parts (dict): Everything that determines the response (model, prompt, options, attachments...).
+        compute (Callable[[], Awaitable[Any]]): Makes the actual request.
+
+    Returns:
+        Any: The cached or newly computed result.
+    """
+    store, key, cached = await asyncio.to_thread(_lookup, key_parts)
+    if cached is not None:
+        return cached
+    result = await compute()
+    await asyncio.to_thread(_store_result, store, key, result)
+    return result
+
+
+def cached_response(generate_response: Callable) -> Callable:
+    """
+    Decorates a Model.generate_response or Model.agenerate_response implementation so that identical
+    requests are served from the cache.
+
+    The key covers the model class and name, the prompt, the system instructions, the contents of the
+    JSON schema and of any attached image, the model options and the other request arguments that
+    change what is sent. File path arguments are left out, since their contents are already part of
+    the rendered prompt.
+    """
+    signature = inspect.signature(generate_response)
+    path_arguments = {"submission_file", "solution_file", "test_output", "json_schema", "submission_image"}
+
+    def key_parts_for(self, args: tuple, kwargs: dict) -> dict:
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        arguments = {name: value for name, value in bound.arguments.items() if name != "self"}
+
+        key_parts = {name: value for name, value in arguments.items() if name not in path_arguments}
+        key_parts["model"] = f"{type(self).__name__}:{getattr(self, 'model_name', None) or getattr(self, 'model', '')}"
+        key_parts["json_schema"] = read_file_bytes(arguments.get("json_schema"))
+        key_parts["submission_image"] = read_file_bytes(arguments.get("submission_image"))
+        return key_parts
+
+    if inspect.iscoroutinefunction(generate_response):
+
+        @functools.wraps(generate_response)
+        async def async_wrapper(self, *args: Any, **kwargs: Any):
+            # The JSON schema and image are read off the event loop too
+            key_parts = await asyncio.to_thread(key_parts_for, self, args, kwargs)
+            result = await acached_call(key_parts, lambda: generate_response(self, *args, **kwargs))
+            return tuple(result) if isinstance(result, list) else result
+
+        return async_wrapper
+
+    @functools.wraps(generate_response)
+    def wrapper(self, *args: Any, **kwargs: Any):
+        result = cached_call(key_parts_for(self, args, kwargs), lambda: generate_response(self, *args, **kwargs))
+        return tuple(result) if isinstance(result, list) else result
+
+    return wrapper
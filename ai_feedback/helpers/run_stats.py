@@ -0,0 +1,99 @@
+import contextvars
+import threading
+from typing import Any, Optional
+
+
+class RunStats:
+    """
+    Counters and values collected while generating feedback for one submission, such as cache hits.
+
+    They are shown in the output metadata of the verbose template. A RunStats object is shared by
+    every thread and asyncio task working on the same submission, so updates are locked.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._values: dict[str, Any] = {}
+        self._times: dict[str, float] = {}
+        self._measurements: dict[str, float] = {}
+
+    def increment(self, name: str, amount: float = 1) -> None:
+        """Adds amount to the counter called name, starting from 0."""
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + amount
+
+    def set(self, name: str, value: Any) -> None:
+        """Records value under name, replacing any previous value."""
+        with self._lock:
+            self._values[name] = value
+
+    def get(self, name: str, default: Any = None) -> Any:
+        """Returns the value recorded under name, or default."""
+        with self._lock:
+            return self._values.get(name, default)
+
+    def as_dict(self) -> dict[str, Any]:
+        """Returns a copy of every recorded value."""
+        with self._lock:
+            return dict(self._values)
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        """Adds seconds to the time spent in stage. Stage times are only written to metrics files."""
+        with self._lock:
+            self._times[stage] = self._times.get(stage, 0.0) + seconds
+
+    def times(self) -> dict[str, float]:
+        """Returns a copy of the time spent in every stage."""
+        with self._lock:
+            return dict(self._times)
+
+    def measure(self, name: str, amount: float) -> None:
+        """Adds amount to the measurement called name, e.g. prompt_bytes. Measurements are only written to metrics files."""
+        with self._lock:
+            self._measurements[name] = self._measurements.get(name, 0) + amount
+
+    def measurements(self) -> dict[str, float]:
+        """Returns a copy of every measurement."""
+        with self._lock:
+            return dict(self._measurements)
+
+    def format(self) -> str:
+        """Formats the recorded values as a markdown list."""
+        values = self.as_dict()
+        if not values:
+            return "N/A"
+        return "\n".join(f"- {name}: {value}" for name, value in values.items())
+
+
+_current_run: contextvars.ContextVar[Optional[RunStats]] = contextvars.ContextVar("run_stats", default=None)
+
+
+def start_run() -> RunStats:
+    """Starts collecting stats for a new submission in the current thread or task."""
+    stats = RunStats()
+    _current_run.set(stats)
+    return stats
+
+
+def current_run() -> RunStats:
+    """Returns the stats of the submission being processed, or a detached RunStats if none was started."""
+    return _current_run.get() or RunStats()
+
+
+def record_token_usage(
+    input_tokens: int, output_tokens: int, cached_input_tokens: int = 0, cache_write_input_tokens: int = 0
+) -> None:
+    """Adds the token usage a provider reported for one response to the current run.
+
+    Args:
+        input_tokens (int): All input tokens of the request, including cached ones.
+        output_tokens (int): Generated tokens.
+        cached_input_tokens (int): Input tokens read from the provider's prompt cache.
+        cache_write_input_tokens (int): Input tokens written to the provider's prompt cache.
+    """
+    stats = current_run()
+    stats.increment("input_tokens", input_tokens)
+    stats.increment("cached_input_tokens", cached_input_tokens)
+    if cache_write_input_tokens:
+        stats.increment("cache_write_input_tokens", cache_write_input_tokens)
+    stats.increment("output_tokens", output_tokens)
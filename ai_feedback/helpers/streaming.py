@@ -0,0 +1,172 @@
+import contextlib
+import contextvars
+import io
+import sys
+import threading
+import time
+from typing import AsyncIterator, Iterator, Optional, TextIO, Tuple
+
+from .run_stats import current_run
+
+
+class StreamSink:
+    """
+    Writes a response to a text stream while the model is still generating it.
+
+    The output template is split at its {response} placeholder. The part before it is written
+    when the first token arrives, the tokens follow as they are received, and the part after it
+    is written by finish(). The result is the same text that formatting the template with the
+    complete response would give.
+
+    Models that support streaming call begin() with the request they are about to send and then
+    write() every token. If nothing was streamed (a cached response or a provider without
+    streaming), finish() writes the complete response at once.
+    """
+
+    def __init__(self, stream: TextIO, template: str, **fields: str) -> None:
+        """
+        Args:
+            stream (TextIO): Where the output is written.
+            template (str): The output template.
+            **fields (str): Values of the template placeholders other than request, response and metadata.
+        """
+        self.stream = stream
+        self.head, separator, self.tail = template.partition("{response}")
+        if not separator:
+            self.head, self.tail = template, ""
+        self.fields = fields
+        self.request: Optional[str] = None
+        self.written = 0
+        self._started_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _format(self, text: str) -> str:
+        return text.format(**self.fields, request=self.request or "", metadata=current_run().format())
+
+    def begin(self, request: str) -> None:
+        """Records the request being sent; time to first token is measured from the first call."""
+        with self._lock:
+            if self.request is None:
+                self.request = request
+            if self._started_at is None:
+                self._started_at = time.perf_counter()
+
+    def write(self, text: str) -> None:
+        """Writes the next part of the response, preceded by the template header the first time."""
+        if not text:
+            return
+        with self._lock:
+            if self.written == 0:
+                if self._started_at is not None:
+                    current_run().set("time_to_first_token", f"{time.perf_counter() - self._started_at:.2f}s")
+                self.stream.write(self._format(self.head))
+            self.stream.write(text)
+            self.stream.flush()
+            self.written += len(text)
+
+    def finish(self, request: str, response: str) -> None:
+        """Writes whatever was not streamed, followed by the template footer.
+
+        Args:
+            request (str): The final request, used if no request was recorded by begin().
+            response (str): The complete response, written if no token was streamed.
+        """
+        with self._lock:
+            self.request = request
+            if self.written == 0:
+                self.stream.write(self._format(self.head))
+                self.stream.write(response)
+            self.stream.write(self._format(self.tail))
+            self.stream.flush()
+
+
+_current_sink: contextvars.ContextVar[Optional[StreamSink]] = contextvars.ContextVar("stream_sink", default=None)
+
+
+def current_sink() -> Optional[StreamSink]:
+    """Returns the sink the response being generated should be streamed to, or None if not streaming."""
+    return _current_sink.get()
+
+
+@contextlib.contextmanager
+def streaming(sink: Optional[StreamSink]) -> Iterator[Optional[StreamSink]]:
+    """Streams responses generated in the current thread or task to sink (None: to nowhere) until the block exits."""
+    token = _current_sink.set(sink)
+    try:
+        yield sink
+    finally:
+        _current_sink.reset(token)
+
+
+async def stream_text(pieces: AsyncIterator[Optional[str]]) -> str:
+    """Writes the pieces of a streamed response to the current sink as they arrive.
+
+    Args:
+        pieces (AsyncIterator[Optional[str]]): The text of each streamed chunk; empty or None pieces are skipped.
+
+    Returns:
+        str: The complete response.
+    """
+    sink = current_sink()
+    parts = []
+    async for piece in pieces:
+        if piece:
+            parts.append(piece)
+            if sink is not None:
+                sink.write(piece)
+    return "".join(parts)
+
+
+_output: contextvars.ContextVar[Optional[Tuple[TextIO, TextIO]]] = contextvars.ContextVar("output", default=None)
+
+
+def output_stream() -> TextIO:
+    """Returns where the current run writes its output: the stream bound by redirect_output(), or sys.stdout."""
+    bound = _output.get()
+    return bound[0] if bound is not None else sys.stdout
+
+
+@contextlib.contextmanager
+def redirect_output(stdout: TextIO, stderr: TextIO) -> Iterator[None]:
+    """
+    Sends the output of the run in the current context to stdout and stderr until the block exits.
+
+    The streams are bound to the context, so they follow the run into the threads and tasks it
+    starts with a copy of it: the shared event loop of helpers/async_utils.py, batch workers and
+    chunk workers. Writes to sys.stdout and sys.stderr only follow them once ContextOutput is
+    installed in their place.
+    """
+    token = _output.set((stdout, stderr))
+    try:
+        yield
+    finally:
+        _output.reset(token)
+
+
+class ContextOutput(io.TextIOBase):
+    """
+    Stands in for sys.stdout or sys.stderr, writing to the stream redirect_output() bound in the
+    current context, or to the original stream outside of one.
+    """
+
+    def __init__(self, fallback: TextIO, error: bool = False) -> None:
+        """
+        Args:
+            fallback (TextIO): The stream written to outside of redirect_output().
+            error (bool): Whether this stands in for sys.stderr rather than sys.stdout.
+        """
+        self.fallback = fallback
+        self._index = 1 if error else 0
+
+    def _stream(self) -> TextIO:
+        bound = _output.get()
+        return bound[self._index] if bound is not None else self.fallback
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        return self._stream().write(text)
+
+    def flush(self) -> None:
+        self._stream().flush()
@@ -0,0 +1,170 @@
+"""
+Registry of the prompt, output template and JSON schema files the package reads.
+
+The bundled files under data/prompts/user, data/prompts/system, data/output and data/schema are
+all read and indexed by name the first time any of them is needed, and never read again, since
+they do not change while the package runs. Files given by path (custom prompts, marking
+instructions, JSON schemas) are registered on first use along with their modification time and
+size; later uses only stat the file, and read it again if either changed. Templates are kept
+parsed into their segments and placeholders (see parse_template() in helpers/template_utils.py),
+so rendering a registered template does not parse it again.
+
+Once the daemon or a batch has loaded its templates, loading them again is a dict lookup, plus a
+stat for files given by path.
+"""
+
+import copy
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+_PACKAGE_DIRECTORY = Path(__file__).resolve().parent.parent
+
+# Directories of the bundled files of every kind, relative to the package, and their extension
+BUNDLED_DIRECTORIES = {
+    "user": ("data/prompts/user", ".md"),
+    "system": ("data/prompts/system", ".md"),
+    "output": ("data/output", ".md"),
+    "schema": ("data/schema", ".json"),
+}
+# Kinds whose files are str.format() templates
+_TEMPLATE_KINDS = {"user", "system", "output"}
+
+
+class RegisteredFile(NamedTuple):
+    path: str
+    content: str
+    # Modification time and size of a file given by path when it was read, None for bundled files
+    mtime_ns: Optional[int]
+    size: Optional[int]
+    # Segments of a template as parse_template() returns them, None if the file is not a template
+    # or its braces do not parse (rendering it then fails as str.format() would)
+    segments: Optional[Tuple[Any, ...]]
+    # Names of the template's placeholders
+    placeholders: FrozenSet[str]
+
+
+_bundled: Optional[Dict[Tuple[str, str], RegisteredFile]] = None
+# Bundled files by resolved path, so that a bundled file given by path is not read either
+_bundled_paths: Dict[str, RegisteredFile] = {}
+# Files given by path, by resolved path and whether they were parsed as templates
+_files: Dict[Tuple[str, bool], RegisteredFile] = {}
+_json: Dict[str, Tuple[RegisteredFile, Any]] = {}
+_lock = threading.Lock()
+
+
+def _register(path: str, content: str, template: bool, stat: Optional[os.stat_result] = None) -> RegisteredFile:
+    segments, placeholders = None, frozenset()
+    if template:
+        from .template_utils import parse_template
+
+        try:
+            segments, placeholders = parse_template(content)
+        except ValueError:
+            pass
+    return RegisteredFile(
+        path,
+        content,
+        stat.st_mtime_ns if stat else None,
+        stat.st_size if stat else None,
+        segments,
+        placeholders,
+    )
+
+
+def _index() -> Dict[Tuple[str, str], RegisteredFile]:
+    """Returns the bundled files by kind and name, reading them all on the first call."""
+    global _bundled
+    with _lock:
+        if _bundled is None:
+            bundled = {}
+            for kind, (relative_directory, extension) in BUNDLED_DIRECTORIES.items():
+                directory = _PACKAGE_DIRECTORY / relative_directory
+                for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+                    if not (entry.is_file() and entry.name.endswith(extension)):
+                        continue
+                    with open(entry.path, "r", encoding="utf-8") as file:
+                        registered = _register(entry.path, file.read(), kind in _TEMPLATE_KINDS)
+                    bundled[kind, entry.name[: -len(extension)]] = registered
+                    _bundled_paths[os.path.realpath(entry.path)] = registered
+            _bundled = bundled
+        return _bundled
+
+
+def warm_up() -> None:
+    """Reads and parses every bundled file, if they have not been already."""
+    _index()
+
+
+def bundled(kind: str, name: str) -> Optional[RegisteredFile]:
+    """
+    Returns a bundled file.
+
+    Args:
+        kind (str): "user" or "system" for prompts, "output" for output templates or "schema".
+        name (str): The file's name without its extension, e.g. "code_lines".
+
+    Returns:
+        Optional[RegisteredFile]: The file, or None if there is no bundled file of that kind and name.
+    """
+    return _index().get((kind, name))
+
+
+def bundled_names(kind: str) -> List[str]:
+    """Returns the names of the bundled files of a kind, in alphabetical order."""
+    return [name for file_kind, name in _index() if file_kind == kind]
+
+
+def load_file(path: os.PathLike | str, template: bool = True) -> RegisteredFile:
+    """
+    Returns a file given by path, reading it only if it changed since it was last registered.
+
+    Args:
+        path (os.PathLike | str): Path to the file.
+        template (bool): Whether the file is a template to parse, rather than plain text such as
+            marking instructions.
+
+    Raises:
+        OSError: If the file cannot be read (FileNotFoundError if it does not exist).
+        UnicodeDecodeError: If the file is not UTF-8.
+    """
+    real_path = os.path.realpath(path)
+    _index()
+    registered = _bundled_paths.get(real_path)
+    if registered is not None:
+        return registered
+
+    stat = os.stat(real_path)
+    with _lock:
+        registered = _files.get((real_path, template))
+    if registered is not None and registered.mtime_ns == stat.st_mtime_ns and registered.size == stat.st_size:
+        return registered
+
+    with open(real_path, "r", encoding="utf-8") as file:
+        registered = _register(os.fspath(path), file.read(), template, stat)
+    with _lock:
+        _files[real_path, template] = registered
+    return registered
+
+
+def load_json(path: os.PathLike | str) -> Any:
+    """
+    Returns the parsed contents of a JSON file such as a schema, parsing it only if it changed.
+
+    The result is a copy, so callers may modify it.
+
+    Raises:
+        OSError: If the file cannot be read (FileNotFoundError if it does not exist).
+        ValueError: If the file is not valid JSON.
+    """
+    registered = load_file(path, template=False)
+    real_path = os.path.realpath(path)
+    with _lock:
+        cached = _json.get(real_path)
+    if cached is None or cached[0] is not registered:
+        cached = (registered, json.loads(registered.content))
+        with _lock:
+            _json[real_path] = cached
+    return copy.deepcopy(cached[1])
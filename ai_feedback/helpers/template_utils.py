@@ -1,13 +1,112 @@
+import collections
+import functools
+import itertools
+import math
 import os
 import re
+import string
 import sys
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Deque,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+# PDF, image and ollama libraries are imported where they are used, so that rendering prompts
+# for plain code submissions does not load them
+if TYPE_CHECKING:
+    from ollama import Image
+
+# Lines numbered at a time when rendering files
+_BATCH_LINES = 4096
+# f-string expressions cannot contain backslashes before Python 3.12
+_NEWLINE = "\n"
+
+# Templates whose parse is kept by parse_template(), enough for every bundled prompt and a few of the user's
+_PARSED_TEMPLATES = 128
+
+# Unchanged lines shown around every change when files are rendered as diffs
+DIFF_CONTEXT_LINES = 3
+
+# --question value that selects every question heading
+ALL_QUESTIONS = "all"
+# Normalized titles of the headings that --question all selects
+QUESTION_HEADING_RE = re.compile(r"^(task|question|exercise|problem)\b")
+
+
+class RenderedPrompt(str):
+    """
+    A rendered prompt whose first `prefix` characters are the same for every submission of an
+    assignment (the instructions, marking instructions and solution).
+
+    Providers cache requests by prefix, so models keep the prefix byte-identical at the start of
+    the request (and, for Claude, mark where it ends) to have it processed once per assignment.
+    """
+
+    prefix: str = ""
+
+    def __new__(cls, text: str, prefix: str = "") -> "RenderedPrompt":
+        prompt = super().__new__(cls, text)
+        prompt.prefix = prefix
+        return prompt
+
+
+def split_prompt(prompt: str) -> Tuple[str, str]:
+    """Splits a prompt into its shared prefix and the rest; the prefix is empty for plain prompts."""
+    prefix = getattr(prompt, "prefix", "")
+    if prefix and prompt.startswith(prefix):
+        return prefix, prompt[len(prefix) :]
+    return "", prompt
+
+
+# The literal text and replacement fields of a template, as string.Formatter().parse() yields them
+TemplateSegments = Tuple[Tuple[str, Optional[str], Optional[str], Optional[str]], ...]
 
-import pymupdf
-import PyPDF2
-from ollama import Image
-from PIL import Image as PILImage
+
+@functools.lru_cache(maxsize=_PARSED_TEMPLATES)
+def parse_template(prompt_content: str) -> Tuple[TemplateSegments, FrozenSet[str]]:
+    """Parses a prompt template, once per distinct template (so once per prompt file).
+
+    Args:
+        prompt_content (str): The prompt template with placeholders
+
+    Returns:
+        Tuple[TemplateSegments, FrozenSet[str]]: The segments of the template, and the names of its
+            placeholders without any attribute or index (``{a.b}`` and ``{a[0]}`` are both ``a``)
+
+    Raises:
+        ValueError: If the braces of the template are unbalanced, as str.format() would.
+    """
+    segments = tuple(string.Formatter().parse(prompt_content))
+    names = frozenset(re.split(r"[.\[]", field, maxsplit=1)[0] for _, field, _, _ in segments if field is not None)
+    return segments, names
+
+
+def format_template(prompt_content: str, values: Dict[str, Any]) -> str:
+    """Same as prompt_content.format(**values), without parsing the template again.
+
+    Raises:
+        KeyError: If a placeholder of the template has no value.
+    """
+    formatter = string.Formatter()
+    parts: List[str] = []
+    for literal, field, spec, conversion in parse_template(prompt_content)[0]:
+        parts.append(literal)
+        if field is None:
+            continue
+        value = formatter.convert_field(formatter.get_field(field, (), values)[0], conversion)
+        if spec and "{" in spec:
+            spec = formatter.vformat(spec, (), values)
+        parts.append(format(value, spec or ""))
+    return "".join(parts)
 
 
 def render_prompt_template(
@@ -19,6 +118,12 @@ def render_prompt_template(
     test_output: Optional[Path] = None,
     question: Optional[str] = None,
     marking_instructions: Optional[str] = None,
+    layout: str = "default",
+    max_file_bytes: Optional[int] = None,
+    max_file_lines: Optional[int] = None,
+    line_ranges: Optional[Dict[str, Tuple[int, int]]] = None,
+    diff_base: Optional[Path] = None,
+    diff_context: Optional[int] = None,
     **kwargs,
 ) -> str:
     """Render a prompt template by replacing placeholders with actual values.
@@ -33,27 +138,62 @@ def render_prompt_template(
         has_submission_image (bool): Whether a submission image is present
         has_solution_image (bool): Whether a solution image is present
         marking_instructions (str, optional): Marking instructions to replace {marking_instructions} placeholder
+        layout (str): "default", or "cache_friendly" to move the parts shared by every submission (the
+            solution and marking instructions) ahead of the first line of the template that holds the
+            student's files, so that the prompt starts with a prefix that is the same for every submission
+        max_file_bytes (int, optional): Bytes of numbered lines kept per file, see iter_numbered_lines()
+        max_file_lines (int, optional): Lines kept per file, see iter_numbered_lines()
+        line_ranges (Dict[str, Tuple[int, int]], optional): The only lines (first and last, from 1) rendered of
+            the files named by tag ("submission", "solution" or "test_output"), keeping their (Line i) numbers.
+            Ignored with a question, whose section is rendered instead
+        diff_base (Path, optional): Starter code (or the solution) to render the submission as a diff against,
+            see _format_diff_with_xml_tag(); the solution is also rendered as a diff against starter code.
+            Ignored with a question and for the lines of line_ranges
+        diff_context (int, optional): Unchanged lines shown around every change of a diff (default DIFF_CONTEXT_LINES)
         **kwargs: Additional key-value pairs for placeholder replacement
 
     Returns:
-        str: The rendered prompt with placeholders replaced
+        str: The rendered prompt with placeholders replaced (a RenderedPrompt for the cache_friendly layout)
     """
     template_data = kwargs.copy()
-
-    template_data['file_references'] = gather_file_references(submission, solution, test_output)
-    if question is not None:
-        template_data['file_contents'] = _get_question_contents([submission, solution], question)
-    else:
-        template_data['file_contents'] = gather_xml_file_contents(submission, solution, test_output)
+    # Only the placeholders of the template are computed: image prompts, for example, never read the files
+    names = parse_template(prompt_content)[1]
+
+    shared_end = _shared_prefix_end(prompt_content) if layout == "cache_friendly" else -1
+    if 'file_references' in names:
+        template_data['file_references'] = gather_file_references(submission, solution, test_output)
+    if shared_end >= 0:
+        # The solution moves into the shared prefix, so {file_contents} holds only the student's files
+        if question is not None:
+            shared_context, solution_found = _get_question_block(solution, "solution", question)
+            student_contents, submission_found = _get_question_block(submission, "submission", question)
+            if not (solution_found or submission_found):
+                print(f"Task '{question}' not found in any assignment file.")
+                sys.exit(1)
+        else:
+            shared_context = gather_xml_file_contents(
+                None, solution, None, max_file_bytes, max_file_lines, line_ranges, diff_base, diff_context
+            )
+            student_contents = gather_xml_file_contents(
+                submission, None, test_output, max_file_bytes, max_file_lines, line_ranges, diff_base, diff_context
+            )
+        template_data['file_contents'] = student_contents.strip()
+    elif 'file_contents' in names:
+        if question is not None:
+            template_data['file_contents'] = _get_question_contents([submission, solution], question)
+        else:
+            template_data['file_contents'] = gather_xml_file_contents(
+                submission, solution, test_output, max_file_bytes, max_file_lines, line_ranges, diff_base, diff_context
+            )
 
     # Handle marking instructions placeholder
     if marking_instructions is not None:
         template_data['marking_instructions'] = marking_instructions
-    elif '{marking_instructions}' in prompt_content:
+    elif 'marking_instructions' in names:
         template_data['marking_instructions'] = ''
 
     # Handle image placeholders with context-aware replacement
-    if '{submission_image}' in prompt_content and 'submission_image' not in template_data:
+    if 'submission_image' in names and 'submission_image' not in template_data:
         if has_submission_image and has_solution_image:
             template_data['submission_image'] = 'The first attached image is the student\'s submission.'
         elif has_submission_image:
@@ -61,7 +201,7 @@ def render_prompt_template(
         else:
             template_data['submission_image'] = '[Submission Image Attached]'
 
-    if '{solution_image}' in prompt_content and 'solution_image' not in template_data:
+    if 'solution_image' in names and 'solution_image' not in template_data:
         if has_submission_image and has_solution_image:
             template_data['solution_image'] = 'The second attached image is the expected solution.'
         elif has_solution_image:
@@ -69,7 +209,24 @@ def render_prompt_template(
         else:
             template_data['solution_image'] = '[Solution Image Attached]'
 
-    return prompt_content.format(**template_data)
+    if shared_end >= 0:
+        head, tail = prompt_content[:shared_end], prompt_content[shared_end:]
+        if marking_instructions and '{marking_instructions}' in tail:
+            shared_context += f"<marking_instructions>\n{marking_instructions.strip()}\n</marking_instructions>\n\n"
+            template_data['marking_instructions'] = "See the <marking_instructions> above."
+        prefix = format_template(head, template_data) + shared_context
+        return RenderedPrompt(prefix + format_template(tail, template_data), prefix)
+    return format_template(prompt_content, template_data)
+
+
+def _shared_prefix_end(prompt_content: str) -> int:
+    """Returns where the first line of a template that refers to the student's files starts, or -1 if none does."""
+    positions = [
+        prompt_content.find(name) for name in ('{file_references}', '{file_contents}') if name in prompt_content
+    ]
+    if not positions:
+        return -1
+    return prompt_content.rfind("\n", 0, min(positions)) + 1
 
 
 def gather_file_references(
@@ -96,7 +253,14 @@ def gather_file_references(
 
 
 def gather_xml_file_contents(
-    submission: Optional[Path] = None, solution: Optional[Path] = None, test_output: Optional[Path] = None
+    submission: Optional[Path] = None,
+    solution: Optional[Path] = None,
+    test_output: Optional[Path] = None,
+    max_file_bytes: Optional[int] = None,
+    max_file_lines: Optional[int] = None,
+    line_ranges: Optional[Dict[str, Tuple[int, int]]] = None,
+    diff_base: Optional[Path] = None,
+    diff_context: Optional[int] = None,
 ) -> str:
     """Generate file contents with XML tags for prompt templates.
 
@@ -104,30 +268,62 @@ def gather_xml_file_contents(
         submission (Path, optional): Student's submission file path
         solution (Path, optional): Instructor's solution file path
         test_output (Path, optional): Student's test output file path
+        max_file_bytes (int, optional): Bytes of numbered lines kept per file, see iter_numbered_lines()
+        max_file_lines (int, optional): Lines kept per file, see iter_numbered_lines()
+        line_ranges (Dict[str, Tuple[int, int]], optional): The only lines rendered of the files named by tag
+        diff_base (Path, optional): File the submission, and the solution unless it is that file, are rendered
+            as a diff against
+        diff_context (int, optional): Unchanged lines shown around every change of a diff (default DIFF_CONTEXT_LINES)
 
     Returns:
         str: File contents formatted with XML tags and line numbers
     """
     file_contents = ""
+    line_ranges = line_ranges or {}
 
     if submission:
-        file_contents += _format_file_with_xml_tag(submission, "submission")
+        if diff_base and "submission" not in line_ranges:
+            file_contents += _format_diff_with_xml_tag(submission, "submission", diff_base, diff_context)
+        else:
+            file_contents += _format_file_with_xml_tag(
+                submission, "submission", max_file_bytes, max_file_lines, line_ranges.get("submission")
+            )
 
     if solution:
-        file_contents += _format_file_with_xml_tag(solution, "solution")
+        if diff_base and diff_base != solution and "solution" not in line_ranges:
+            file_contents += _format_diff_with_xml_tag(solution, "solution", diff_base, diff_context)
+        else:
+            file_contents += _format_file_with_xml_tag(
+                solution, "solution", max_file_bytes, max_file_lines, line_ranges.get("solution")
+            )
 
     if test_output:
-        file_contents += _format_file_with_xml_tag(test_output, "test_output")
+        file_contents += _format_file_with_xml_tag(
+            test_output, "test_output", max_file_bytes, max_file_lines, line_ranges.get("test_output")
+        )
 
     return file_contents
 
 
-def _format_file_with_xml_tag(file_path: Path, tag_name: str) -> str:
+def _format_file_with_xml_tag(
+    file_path: Path,
+    tag_name: str,
+    max_bytes: Optional[int] = None,
+    max_lines: Optional[int] = None,
+    line_range: Optional[Tuple[int, int]] = None,
+) -> str:
     """Format a single file with XML tags and line numbers.
 
+    Text files are read and numbered a batch of lines at a time, so with limits only the lines kept
+    are held in memory, however large the file is.
+
     Args:
         file_path (Path): Path to the file to format
         tag_name (str): The XML tag name (submission, solution, test_output)
+        max_bytes (int, optional): Bytes of numbered lines to keep, see iter_numbered_lines()
+        max_lines (int, optional): Lines to keep, see iter_numbered_lines()
+        line_range (Tuple[int, int], optional): The first and last line (from 1) to render, numbered as in
+            the whole file; the lines of a PDF's extracted text are selected the same way
 
     Returns:
         str: Formatted file content with XML tags
@@ -141,40 +337,234 @@ def _format_file_with_xml_tag(file_path: Path, tag_name: str) -> str:
         # Handle PDF files separately
         if filename.lower().endswith('.pdf'):
             text_content = extract_pdf_text(file_path)
+            if line_range is not None:
+                text_content = "\n".join(text_content.split("\n")[line_range[0] - 1 : line_range[1]])
             return f"<{tag_name} filename=\"{filename}\">\n{text_content}\n</{tag_name}>\n\n"
         else:
             # Handle regular text files
+            first_line, last_line = line_range or (1, None)
             with open(file_path, "r", encoding="utf-8") as file:
-                lines = file.readlines()
-            return _wrap_lines_with_xml(lines, tag_name, filename)
+                lines = itertools.islice(file, first_line - 1, last_line)
+                return "".join(iter_numbered_lines(lines, tag_name, filename, max_bytes, max_lines, first_line))
 
     except Exception as e:
         print(f"Error reading file {filename}: {e}")
         return ""
 
 
-def _wrap_lines_with_xml(lines: List[str], tag_name: str, filename: str) -> str:
+def resolve_diff_base(submission_view: str, starter: Optional[str], solution: Optional[Path]) -> Optional[Path]:
+    """Returns the file the submission is rendered as a diff against, or None to render it in full.
+
+    Args:
+        submission_view (str): "full", or "diff" to compare the submission with the starter code or,
+            without starter code, the solution
+        starter (str, optional): Path to the starter code given to students
+        solution (Path, optional): Path to the instructor's solution file
+
+    Returns:
+        Optional[Path]: The starter code or the solution, or None for the full view.
+
+    Raises:
+        FileNotFoundError: If the starter code file does not exist.
+        SystemExit: If the diff view is selected without starter code or a solution.
+    """
+    if submission_view != "diff":
+        return None
+    if starter:
+        if not os.path.isfile(starter):
+            raise FileNotFoundError(f"Starter code file '{starter}' not found.")
+        return Path(starter)
+    if solution is None:
+        print("Error: --submission_view diff needs --starter or --solution to compare the submission with.")
+        sys.exit(1)
+    return solution
+
+
+def _format_diff_with_xml_tag(file_path: Path, tag_name: str, base_path: Path, context: Optional[int] = None) -> str:
+    """Format a file with XML tags as a diff against another, keeping the file's line numbers.
+
+    Only the lines that differ from base_path are shown, with context lines around them, in the
+    style of a unified diff: new or changed lines are marked "+", unchanged ones " ", and lines of
+    the base that were removed are shown unnumbered, marked "-". Every run of unchanged lines
+    left out is replaced by a marker naming its line numbers. PDFs, which have no line numbers,
+    are rendered in full by _format_file_with_xml_tag().
+
+    Args:
+        file_path (Path): Path to the file to format
+        tag_name (str): The XML tag name (submission, solution)
+        base_path (Path): The file it is compared with, e.g. the starter code
+        context (int, optional): Unchanged lines shown before and after every change (default DIFF_CONTEXT_LINES)
+
+    Returns:
+        str: The diff with XML tags
+    """
+    if file_path.suffix.lower() == ".pdf" or base_path.suffix.lower() == ".pdf":
+        return _format_file_with_xml_tag(file_path, tag_name)
+    import difflib
+
+    filename = os.path.basename(file_path)
+    try:
+        with open(file_path, "r", encoding="utf-8") as file:
+            lines = [line.rstrip(_NEWLINE) for line in file]
+        with open(base_path, "r", encoding="utf-8") as file:
+            base_lines = [line.rstrip(_NEWLINE) for line in file]
+    except Exception as e:
+        print(f"Error reading file {filename}: {e}")
+        return ""
+
+    body = [f"[Compared with {base_path.name}: lines marked + are new or changed, lines marked - were removed.]"]
+    shown = 0
+    matcher = difflib.SequenceMatcher(None, base_lines, lines, autojunk=False)
+    for group in matcher.get_grouped_opcodes(DIFF_CONTEXT_LINES if context is None else context):
+        first_line = group[0][3]
+        if first_line > shown:
+            body.append(_unchanged_marker(shown + 1, first_line, base_path.name))
+        for operation, base_start, base_end, start, end in group:
+            if operation in ("replace", "delete"):
+                body.extend(f"- {line}".rstrip() for line in base_lines[base_start:base_end])
+            mark = " " if operation == "equal" else "+"
+            body.extend(f"(Line {number}) {mark} {lines[number - 1]}".rstrip() for number in range(start + 1, end + 1))
+        shown = group[-1][4]
+    if shown < len(lines):
+        body.append(_unchanged_marker(shown + 1, len(lines), base_path.name))
+    return f"<{tag_name} filename=\"{filename}\">\n" + "\n".join(body) + f"\n</{tag_name}>\n\n"
+
+
+def _unchanged_marker(first: int, last: int, base_name: str) -> str:
+    span = f"line {first}" if first == last else f"lines {first}-{last}"
+    return f"[... {span} unchanged from {base_name} ...]"
+
+
+def _wrap_lines_with_xml(lines: Iterable[str], tag_name: str, filename: str) -> str:
     """Wrap lines with XML tags and add line numbers.
 
     Args:
-        lines (List[str]): List of lines to format
+        lines (Iterable[str]): Lines to format, e.g. a list or an open file
         tag_name (str): The XML tag name (submission, solution, test_output)
         filename (str): The filename to include in the XML tag
 
     Returns:
         str: Formatted content with XML tags and line numbers
     """
-    content = f"<{tag_name} filename=\"{filename}\">\n"
+    return "".join(iter_numbered_lines(lines, tag_name, filename))
 
-    for i, line in enumerate(lines, start=1):
-        stripped_line = line.rstrip("\n")
-        if stripped_line.strip():
-            content += f"(Line {i}) {stripped_line}\n"
-        else:
-            content += f"(Line {i}) {line}"
 
-    content += f"</{tag_name}>\n\n"
-    return content
+def iter_numbered_lines(
+    lines: Iterable[str],
+    tag_name: str,
+    filename: str,
+    max_bytes: Optional[int] = None,
+    max_lines: Optional[int] = None,
+    first_line: int = 1,
+) -> Iterator[str]:
+    """
+    Yields an XML-tagged block of lines prefixed with (Line i) in pieces, reading lines as they are needed.
+
+    Without limits, every line is kept. When a file is larger than max_bytes (counting the numbered lines as
+    rendered) or has more than max_lines lines, its first and last lines are kept within the limits, about half
+    each, and the lines in between are replaced by a marker naming them. Only the last lines are buffered, so
+    memory stays within the limits however large the file is.
+
+    Args:
+        lines (Iterable[str]): Lines ending in a line break (except perhaps the last one), e.g. an open file
+        tag_name (str): The XML tag name (submission, solution, test_output)
+        filename (str): The filename to include in the XML tag
+        max_bytes (int, optional): Bytes of numbered lines to keep
+        max_lines (int, optional): Number of lines to keep
+        first_line (int): The number of the first line, for a part of a file numbered as in the whole file
+
+    Yields:
+        str: The opening tag, runs of numbered lines, any omission marker and the closing tag
+    """
+    yield f"<{tag_name} filename=\"{filename}\">\n"
+    batches = _numbered_batches(iter(lines), first_line)
+    if max_bytes is None and max_lines is None:
+        for batch in batches:
+            yield "".join(batch)
+    else:
+        yield from _keep_head_and_tail(batches, max_bytes, max_lines, first_line)
+    yield f"</{tag_name}>\n\n"
+
+
+def _numbered_batches(lines: Iterator[str], first_line: int = 1) -> Iterator[List[str]]:
+    """Yields the lines prefixed with (Line i), _BATCH_LINES at a time; blank lines keep their whitespace."""
+    number = first_line
+    while True:
+        batch = list(itertools.islice(lines, _BATCH_LINES))
+        if not batch:
+            return
+        yield [
+            f"(Line {i}) {line.rstrip(_NEWLINE)}\n" if line.strip() else f"(Line {i}) {line}"
+            for i, line in enumerate(batch, start=number)
+        ]
+        number += len(batch)
+
+
+def _sizes(batch: List[str]) -> List[int]:
+    """Returns the UTF-8 size of every line of a batch."""
+    if "".join(batch).isascii():
+        return [len(line) for line in batch]
+    return [len(line.encode("utf-8")) for line in batch]
+
+
+def _keep_head_and_tail(
+    batches: Iterator[List[str]], max_bytes: Optional[int], max_lines: Optional[int], first_line: int = 1
+) -> Iterator[str]:
+    """Yields the first and last numbered lines within the limits, with a marker in place of the others."""
+    byte_limit = math.inf if max_bytes is None else max_bytes
+    line_limit = math.inf if max_lines is None else max_lines
+    head_lines = head_bytes = 0
+    # Batches of the last lines, with the size of each line, kept in the room the first lines left
+    tail: Deque[Tuple[List[str], List[int]]] = collections.deque()
+    tail_lines = tail_bytes = 0
+    omitted = 0
+
+    for batch in batches:
+        sizes = _sizes(batch)
+        if not tail and not omitted:
+            kept = 0
+            while kept < len(batch) and head_lines < line_limit / 2 and head_bytes + sizes[kept] <= byte_limit / 2:
+                head_lines += 1
+                head_bytes += sizes[kept]
+                kept += 1
+            if kept:
+                yield "".join(batch[:kept])
+            if kept == len(batch):
+                continue
+            batch, sizes = batch[kept:], sizes[kept:]
+        tail.append((batch, sizes))
+        tail_lines += len(batch)
+        tail_bytes += sum(sizes)
+        # Drop the oldest batch once the newer ones fill the room by themselves
+        while len(tail) > 1:
+            oldest_lines, oldest_bytes = len(tail[0][0]), sum(tail[0][1])
+            if (
+                head_lines + tail_lines - oldest_lines < line_limit
+                and head_bytes + tail_bytes - oldest_bytes < byte_limit
+            ):
+                break
+            tail.popleft()
+            tail_lines -= oldest_lines
+            tail_bytes -= oldest_bytes
+            omitted += oldest_lines
+
+    # Drop the first of the remaining lines until the rest fits
+    first_batch, first_sizes = tail[0] if tail else ([], [])
+    dropped = 0
+    while dropped < len(first_batch) and (head_lines + tail_lines > line_limit or head_bytes + tail_bytes > byte_limit):
+        tail_lines -= 1
+        tail_bytes -= first_sizes[dropped]
+        dropped += 1
+    omitted += dropped
+    if tail:
+        tail[0] = (first_batch[dropped:], first_sizes[dropped:])
+
+    if omitted:
+        first, last = first_line + head_lines, first_line + head_lines + omitted - 1
+        span = f"line {first}" if first == last else f"lines {first}-{last}"
+        yield f"[... {span} omitted to stay within the file size limit ...]\n"
+    for batch, _ in tail:
+        yield "".join(batch)
 
 
 def extract_pdf_text(pdf_path: Path | str) -> str:
@@ -186,16 +576,10 @@ def extract_pdf_text(pdf_path: Path | str) -> str:
     Returns:
         str: Extracted text content from the PDF
     """
-    try:
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text() + "\n"
+    from .pdf_index import load_pdf_index
 
-            return text.strip()
+    try:
+        return load_pdf_index(pdf_path).text
     except Exception as e:
         print(f"Error extracting text from PDF {pdf_path}: {e}")
         return f"[Error: Could not extract text from PDF {os.path.basename(pdf_path)}]"
@@ -231,6 +615,8 @@ def gather_image_size(output_directory: str, question: str) -> str:
         str: Image size in format "width by height"
     """
     try:
+        from PIL import Image as PILImage
+
         from ..helpers.image_reader import read_submission_images
 
         submission_image_paths = read_submission_images(output_directory, question)
@@ -242,7 +628,7 @@ def gather_image_size(output_directory: str, question: str) -> str:
     return "unknown"
 
 
-def gather_images(output_directory: str, question: str, include_images: list[str]) -> list[Image]:
+def gather_images(output_directory: str, question: str, include_images: list[str]) -> list["Image"]:
     """Gather images for attachment to message.
 
     Args:
@@ -253,6 +639,8 @@ def gather_images(output_directory: str, question: str, include_images: list[str
     Returns:
         list[Image]: List of Image objects for message attachment
     """
+    from ollama import Image
+
     images = []
 
     try:
@@ -295,26 +683,12 @@ def _get_question_contents(assignment_files: List[Optional[Path]], question: str
     semantic_tags = ["submission", "solution"]
 
     for index, file_path in enumerate(assignment_files):
-        if not file_path or "error_output" in file_path.name or file_path.name == ".DS_Store":
-            continue
-
-        task_content = ""
-        if file_path.suffix == '.txt':
-            intro_content, found = extract_question_from_txt(file_path, question)
-        elif file_path.suffix == ".pdf":
-            intro_content, found = extract_question_from_pdf(file_path, question)
-        else:
-            continue
-
+        tag_name = semantic_tags[index] if index < len(semantic_tags) else "file"
+        block, found = _get_question_block(file_path, tag_name, question)
+        file_contents += block
         if found:
             task_found = True
 
-        tag_name = semantic_tags[index] if index < len(semantic_tags) else "file"
-        file_contents += f"<{tag_name} filename=\"{file_path.name}\">\n"
-        file_contents += intro_content + "\n\n" if intro_content else ""
-        file_contents += task_content + "\n\n"
-        file_contents += f"</{tag_name}>\n\n"
-
     if not task_found:
         print(f"Task '{question}' not found in any assignment file.")
         sys.exit(1)
@@ -322,6 +696,36 @@ def _get_question_contents(assignment_files: List[Optional[Path]], question: str
     return file_contents.strip()
 
 
+def _get_question_block(file_path: Optional[Path], tag_name: str, question: str) -> Tuple[str, bool]:
+    """
+    Wraps the part of one file under the heading for question in an XML tag.
+
+    Args:
+        file_path (Optional[Path]): The file to search; files that are not .txt or .pdf are skipped.
+        tag_name (str): The XML tag name (submission, solution).
+        question (str): Question identifier
+
+    Returns:
+        Tuple[str, bool]: The tagged block (empty for skipped files) and whether the question was found.
+    """
+    if not file_path or "error_output" in file_path.name or file_path.name == ".DS_Store":
+        return "", False
+
+    task_content = ""
+    if file_path.suffix == '.txt':
+        intro_content, found = extract_question_from_txt(file_path, question)
+    elif file_path.suffix == ".pdf":
+        intro_content, found = extract_question_from_pdf(file_path, question)
+    else:
+        return "", False
+
+    block = f"<{tag_name} filename=\"{file_path.name}\">\n"
+    block += intro_content + "\n\n" if intro_content else ""
+    block += task_content + "\n\n"
+    block += f"</{tag_name}>\n\n"
+    return block, found
+
+
 def normalize_text(x: str) -> str:
     """Normalize text for consistent matching (rough R parity)."""
     x = re.sub(r"[\r\n\t]", " ", x)
@@ -337,15 +741,9 @@ def flatten_toc(pdf_path: Path) -> List[Dict[str, Any]]:
     Convert PyMuPDF TOC (outline) to a flat list of dicts:
     {title, page, level}
     """
-    doc = pymupdf.open(pdf_path)
-    toc_rows = doc.get_toc(simple=False)
-    doc.close()
+    from .pdf_index import load_pdf_index
 
-    flat = []
-    for row in toc_rows:
-        level, title, page = row[0], row[1], row[2]
-        flat.append({"title": title, "page": page if page is not None else None, "level": level})
-    return flat
+    return [dict(entry) for entry in load_pdf_index(pdf_path).toc]
 
 
 def get_next_heading_title(flat_toc: List[Dict[str, Any]], heading: str) -> Optional[str]:
@@ -353,108 +751,116 @@ def get_next_heading_title(flat_toc: List[Dict[str, Any]], heading: str) -> Opti
     Given a flattened TOC and a heading title, return the title of the next
     heading that is at the same or higher level (not a subheading).
     """
-    norm_heading = normalize_text(heading)
-    titles_norm = [normalize_text(d["title"]) for d in flat_toc]
-    matches = [i for i, t in enumerate(titles_norm) if t == norm_heading]
-    if not matches:
-        return None
-
-    match_idx = matches[-1]
-    start_level = flat_toc[match_idx]["level"]
-
-    if match_idx >= len(flat_toc) - 1:
-        return None
+    from .pdf_index import PdfDocumentIndex
 
-    for i in range(match_idx + 1, len(flat_toc)):
-        if flat_toc[i]["level"] <= start_level:
-            return flat_toc[i]["title"]
-    return None
+    return PdfDocumentIndex(flat_toc, []).next_heading_title(heading)
 
 
 def extract_question_from_pdf(pdf_path: Path, heading: str) -> tuple[str, bool]:
     """
     Extract the text block under a given heading (matched by exact normalized title)
     up to the next heading at the same or higher level.
+
+    The PDF is parsed and indexed once per process (see helpers/pdf_index.py), so looking up
+    several questions, or the same solution for several submissions, reuses the parse.
     """
+    from .pdf_index import load_pdf_index
+
     if not os.path.exists(pdf_path):
         raise FileNotFoundError(f"[Error: Submission file {os.path.basename(pdf_path)} not found]")
 
-    # Load and flatten TOC
-    toc = flatten_toc(pdf_path)
+    return load_pdf_index(pdf_path).extract_section(heading)
 
-    titles_norm = [normalize_text(d["title"]) for d in toc]
-    norm_heading = normalize_text(heading)
 
-    if norm_heading not in titles_norm:
-        print(f"[ERROR] Heading '{norm_heading}' not found in TOC")
-        return "", False
+def extract_question_from_txt(submission_path: Path, question: str) -> tuple[str, bool]:
+    """
+    Given a Markdown file, return the block from the heading 'question'
+    up to (but not including) the next heading of the same or higher level.
 
-    next_heading_title = get_next_heading_title(toc, heading)
+    The file is read and indexed once per process (see helpers/markdown_index.py), so extracting
+    several questions reuses the parse.
+    """
+    from .markdown_index import load_markdown_index
 
-    # Read full text (as continuous lines)
-    full_text = extract_pdf_text(pdf_path)
-    lines = full_text.split("\n")
+    if not os.path.exists(submission_path):
+        raise FileNotFoundError(f"[Error: Submission file {submission_path} not found]")
 
-    norm_lines = [normalize_text(l.strip()) for l in lines]
+    return load_markdown_index(submission_path).section(question)
 
-    # Locate start of heading within text
-    start_indices = [i for i, t in enumerate(norm_lines) if t == norm_heading]
 
-    if not start_indices:
-        raise ValueError(f"[ERROR] Start indices for heading '{heading}' not found.")
+def question_headings(file_path: Optional[Path]) -> List[str]:
+    """
+    Returns the titles of the question headings of a Markdown (.txt) or PDF file, in document order.
 
-    start_line = start_indices[0]
-    end_line = len(lines) - 1
+    Question headings are those whose title starts with Task, Question, Exercise or Problem, like
+    the '## Task {#}' headings assignments are expected to use, at the highest level any of them has.
 
-    # If we know the next heading, find its first occurrence after start_line
-    if next_heading_title:
-        nh = normalize_text(next_heading_title)
-        next_idx = [i for i, t in enumerate(norm_lines) if t == nh and i > start_line]
-        if next_idx:
-            end_line = next_idx[0] - 1
+    Args:
+        file_path (Optional[Path]): A .txt or .pdf file; other files have no headings.
+    """
+    if not file_path or not os.path.isfile(file_path):
+        return []
+    if file_path.suffix == ".pdf":
+        from .pdf_index import load_pdf_index
 
-    if start_line > end_line or start_line < 0:
-        raise ValueError(f"Invalid line bounds: start={start_line}, end={end_line}")
+        headings = [(entry["level"], entry["title"]) for entry in load_pdf_index(file_path).toc]
+    elif file_path.suffix == ".txt":
+        from .markdown_index import load_markdown_index
 
-    extracted = lines[start_line : end_line + 1]
+        headings = [(heading.level, heading.title) for heading in load_markdown_index(file_path).headings]
+    else:
+        return []
 
-    return "\n".join([l.strip() for l in extracted]), True
+    questions = [(level, title) for level, title in headings if QUESTION_HEADING_RE.match(normalize_text(title))]
+    # Question headings below others, like a "### Task 2a" under "## Task 2", are part of their sections
+    top_level = min((level for level, _ in questions), default=0)
+    return [title for level, title in questions if level == top_level]
 
 
-def extract_question_from_txt(submission_path: Path, question: str) -> tuple[str, bool]:
+def resolve_questions(question: Optional[str], assignment_files: List[Optional[Path]]) -> Optional[List[str]]:
     """
-    Given a Markdown file, return the block from the heading 'question'
-    up to (but not including) the next heading of the same or higher level.
-    """
-    _MD_HEADER_RE = re.compile(r"^(#{1,6})\s+(.*)$")
-    if not os.path.exists(submission_path):
-        raise FileNotFoundError(f"[Error: Submission file {submission_path} not found]")
+    Expands a --question value that names several questions.
 
-    with open(submission_path, "r", encoding="utf-8", errors="ignore") as f:
-        lines = f.readlines()
+    The value may be a single question, a comma-separated list of questions, or "all" for every
+    question heading (see question_headings()) of the first file that has any, which is the
+    solution when it is listed first. A value with commas that is itself a heading of one of the
+    files is a single question.
 
-    def norm(x: str) -> str:
-        return normalize_text(re.sub(r"\s+", " ", x.strip()))
+    Args:
+        question (Optional[str]): The --question value.
+        assignment_files (List[Optional[Path]]): The files whose headings are searched.
 
-    header_lines = []
-    for idx, line in enumerate(lines):
-        m = _MD_HEADER_RE.match(line)
-        if m:
-            level = len(m.group(1))
-            text = norm(m.group(2))
-            header_lines.append((idx, level, text))
+    Returns:
+        Optional[List[str]]: The questions, without duplicates, or None if the value is a single
+            question or there is none.
+    """
+    if not question:
+        return None
+    if question.strip().lower() == ALL_QUESTIONS:
+        for file_path in assignment_files:
+            titles = question_headings(file_path)
+            if titles:
+                return list(dict.fromkeys(titles))
+        return []
+    if "," not in question or _is_heading(question, assignment_files):
+        return None
+    return list(dict.fromkeys(part.strip() for part in question.split(",") if part.strip()))
 
-    norm_question = norm(question)
-    matches = [i for i, (_, _, txt) in enumerate(header_lines) if txt == norm_question]
-    if not matches:
-        return "", False
 
-    start_tuple = header_lines[matches[0]]
-    start_line, cur_level, _ = start_tuple
+def _is_heading(question: str, assignment_files: List[Optional[Path]]) -> bool:
+    """Returns whether any of the files has a heading titled question."""
+    normalized = normalize_text(question)
+    for file_path in assignment_files:
+        if not file_path or not os.path.isfile(file_path):
+            continue
+        if file_path.suffix == ".pdf":
+            from .pdf_index import load_pdf_index
 
-    # find next heading of same or higher level
-    next_candidates = [ln for ln, lvl, _ in header_lines if ln > start_line and lvl <= cur_level]
-    end_line = next_candidates[0] - 1 if next_candidates else len(lines) - 1
+            if normalized in load_pdf_index(file_path).heading_positions:
+                return True
+        elif file_path.suffix == ".txt":
+            from .markdown_index import load_markdown_index
 
-    block = "".join(lines[start_line : end_line + 1])
-    return block, True
+            if normalized in load_markdown_index(file_path).positions:
+                return True
+    return False
@@ -0,0 +1,337 @@
+"""
+Pre-flight token estimation and context-window budgeting for rendered prompts.
+
+A prompt that does not fit the model's context window fails only after the provider has spent
+its timeout on it, or is silently cut by local servers. fit_prompt() estimates the size of a
+rendered prompt before it is sent and, when it is too large, shrinks it step by step:
+
+1. the test output is truncated, keeping its first and (mostly) last lines,
+2. the solution is omitted,
+3. the submission is trimmed to the lines around the ones the test output refers to
+   (or its first and last lines), keeping their original (Line i) numbers.
+
+Token counts are estimated with a heuristic that mimics how BPE tokenizers split text (words,
+digit groups, punctuation and line breaks), scaled by a per-model factor, so no tokenizer needs
+to be installed or downloaded. Estimates err slightly on the high side.
+"""
+
+import re
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from .run_stats import current_run
+
+# Tokens added by the chat format for the system and user messages
+MESSAGE_OVERHEAD_TOKENS = 12
+# Smallest part of the test output kept before moving on to the next step
+MIN_TEST_OUTPUT_TOKENS = 256
+
+_OMITTED = "[Omitted to fit the model's context window.]"
+_PIECE_RE = re.compile(r"[^\W\d_]+|\d+|\s+|[^\w\s]|_")
+
+
+class TokenBudget(NamedTuple):
+    """The context window of a model and how its tokenizer compares to the estimate."""
+
+    # Tokens the model accepts in total, or None if unknown (the prompt is then never shrunk)
+    context_window: Optional[int]
+    # Tokens kept free for the response when model_options do not set a maximum
+    output_reserve: int = 4096
+    # Tokens the model's tokenizer produces per estimated token
+    token_factor: float = 1.0
+
+
+class PromptTooLargeError(ValueError):
+    """Raised when a prompt does not fit the model's context window and may not be (or cannot be) shrunk."""
+
+
+def estimate_tokens(text: str, token_factor: float = 1.0) -> int:
+    """
+    Estimates the number of tokens of text.
+
+    Words count one token per six letters (non-Latin scripts one per two), digit runs one per three
+    digits, punctuation one per character and whitespace one per line break or indentation run,
+    while the single space before a word is free, as in BPE vocabularies.
+
+    Args:
+        text (str): The text to estimate.
+        token_factor (float): Multiplier for tokenizers that split text more finely than the estimate.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    tokens = 0
+    for piece in _PIECE_RE.findall(text):
+        first = piece[0]
+        if first.isspace():
+            if piece != " ":
+                tokens += max(1, piece.count("\n"))
+        elif first.isdigit():
+            tokens += (len(piece) + 2) // 3
+        elif first.isalpha():
+            tokens += (len(piece) + 5) // 6 if piece.isascii() else (len(piece) + 1) // 2
+        else:
+            tokens += 1
+    return int(tokens * token_factor + 0.5)
+
+
+def _option(model_options: Optional[dict], *names: str) -> Optional[int]:
+    """Returns the first positive integer model option among names."""
+    for name in names:
+        try:
+            value = int((model_options or {}).get(name, 0))
+        except (TypeError, ValueError):
+            continue
+        if value > 0:
+            return value
+    return None
+
+
+def prompt_limit(budget: TokenBudget, model_options: Optional[dict] = None) -> Optional[int]:
+    """Returns the number of tokens the system and user prompt may use, or None if unlimited.
+
+    The context window can be overridden with the num_ctx / n_ctx model options, and the space
+    kept free for the response follows max_tokens / num_predict / n_predict when they are set.
+    """
+    context_window = _option(model_options, "num_ctx", "n_ctx") or budget.context_window
+    if context_window is None:
+        return None
+    reserve = _option(model_options, "max_tokens", "max_completion_tokens", "num_predict", "n_predict")
+    return context_window - (reserve if reserve is not None else budget.output_reserve)
+
+
+class _Block(NamedTuple):
+    """The body of an XML-tagged file in a rendered prompt."""
+
+    start: int
+    end: int
+    filename: str
+    lines: List[str]
+    # Whether the body ends with a line break before the closing tag
+    trailing_newline: bool
+
+
+def _find_block(prompt: str, tag: str) -> Optional[_Block]:
+    """Finds the first <tag filename="..."> block of a rendered prompt."""
+    match = re.search(rf'<{tag} filename="([^"]*)">\n', prompt)
+    if match is None:
+        return None
+    end = prompt.rfind(f"</{tag}>", match.end())
+    if end < 0:
+        return None
+    body = prompt[match.end() : end]
+    trailing_newline = body.endswith("\n")
+    lines = (body[:-1] if trailing_newline else body).split("\n")
+    return _Block(match.end(), end, match.group(1), lines, trailing_newline)
+
+
+def _replace_block(prompt: str, block: _Block, lines: List[str]) -> str:
+    """Replaces the body of a block, keeping the line break before its closing tag."""
+    body = "\n".join(lines) + ("\n" if block.trailing_newline else "")
+    return prompt[: block.start] + body + prompt[block.end :]
+
+
+def _line_number(line: str, index: int) -> int:
+    """Returns the (Line i) number of a numbered prompt line, or its 1-based position."""
+    match = re.match(r"\(Line (\d+)\)", line)
+    return int(match.group(1)) if match else index + 1
+
+
+def _keep_lines(
+    lines: List[str], allowed: int, priority: Callable[[int], Tuple], token_factor: float
+) -> Tuple[List[str], bool]:
+    """
+    Keeps the most important lines that fit in allowed tokens, in their original order, and
+    replaces every run of dropped lines with a marker naming the omitted line numbers.
+
+    Args:
+        lines (List[str]): The lines of a block.
+        allowed (int): Tokens the kept lines and markers may use.
+        priority (Callable[[int], Tuple]): Sort key of a line index; lower keys are kept first.
+        token_factor (float): The model's token factor.
+
+    Returns:
+        Tuple[List[str], bool]: The kept lines with markers, and whether any line was dropped.
+    """
+    if _block_tokens(lines, token_factor) <= allowed:
+        return lines, False
+
+    costs = [estimate_tokens(line, token_factor) + 1 for line in lines]
+
+    order = sorted(range(len(lines)), key=priority)
+    budget = allowed
+    for _ in range(5):
+        kept = set()
+        used = 0
+        for index in order:
+            if used + costs[index] > budget:
+                break
+            kept.add(index)
+            used += costs[index]
+        result = _with_markers(lines, kept)
+        # Markers take space too; retry with less room for lines until everything fits
+        total = _block_tokens(result, token_factor)
+        if total <= allowed:
+            break
+        budget -= total - allowed
+    return result, True
+
+
+def _block_tokens(lines: List[str], token_factor: float) -> int:
+    """Estimates the tokens of the lines of a block as they appear in the prompt."""
+    return estimate_tokens("\n".join(lines), token_factor)
+
+
+def _with_markers(lines: List[str], kept: set) -> List[str]:
+    """Returns the kept lines in order, with a marker in place of every run of dropped lines."""
+    result: List[str] = []
+    index = 0
+    while index < len(lines):
+        if index in kept:
+            result.append(lines[index])
+            index += 1
+            continue
+        start = index
+        while index < len(lines) and index not in kept:
+            index += 1
+        first, last = _line_number(lines[start], start), _line_number(lines[index - 1], index - 1)
+        span = f"line {first}" if first == last else f"lines {first}-{last}"
+        result.append(f"[... {span} omitted to fit the model's context window ...]")
+    return result
+
+
+def _referenced_lines(test_output: Optional[_Block], filename: str) -> List[int]:
+    """Returns the line numbers of filename mentioned in the test output, e.g. in tracebacks."""
+    if test_output is None or not filename:
+        return []
+    text = "\n".join(test_output.lines)
+    pattern = rf'{re.escape(filename)}(?:", line |:)(\d+)'
+    return sorted({int(number) for number in re.findall(pattern, text)})
+
+
+def _truncate_test_output(prompt: str, overflow: int, token_factor: float) -> Tuple[str, bool]:
+    block = _find_block(prompt, "test_output")
+    if block is None:
+        return prompt, False
+    current = _block_tokens(block.lines, token_factor)
+    allowed = max(MIN_TEST_OUTPUT_TOKENS, current - overflow)
+    # A tenth of the room goes to the first lines, the rest to the last lines (failures and tracebacks)
+    head = 0
+    used = 0
+    while head < len(block.lines):
+        used += estimate_tokens(block.lines[head], token_factor) + 1
+        if used > allowed // 10:
+            break
+        head += 1
+    lines, changed = _keep_lines(block.lines, allowed, lambda i: (0, i) if i < head else (1, -i), token_factor)
+    return _replace_block(prompt, block, lines), changed
+
+
+def _omit_solution(prompt: str, overflow: int, token_factor: float) -> Tuple[str, bool]:
+    block = _find_block(prompt, "solution")
+    if block is None or block.lines[0] == _OMITTED:
+        return prompt, False
+    return _replace_block(prompt, block, [_OMITTED]), True
+
+
+def _trim_submission(prompt: str, overflow: int, token_factor: float) -> Tuple[str, bool]:
+    block = _find_block(prompt, "submission")
+    if block is None:
+        return prompt, False
+    numbers = [_line_number(line, i) for i, line in enumerate(block.lines)]
+    anchors = _referenced_lines(_find_block(prompt, "test_output"), block.filename)
+    anchor_indices = [i for i, number in enumerate(numbers) if number in anchors]
+    if not anchor_indices:
+        anchor_indices = [0, len(block.lines) - 1]
+
+    def priority(index: int) -> Tuple:
+        return (min(abs(index - anchor) for anchor in anchor_indices), index)
+
+    current = _block_tokens(block.lines, token_factor)
+    lines, changed = _keep_lines(block.lines, max(0, current - overflow), priority, token_factor)
+    return _replace_block(prompt, block, lines), changed
+
+
+# Shrinking steps in the order they are applied, with the description shown in the run metadata
+_SHRINK_STEPS = (
+    ("test output truncated", _truncate_test_output),
+    ("solution omitted", _omit_solution),
+    ("submission trimmed", _trim_submission),
+)
+
+
+def fit_prompt(
+    prompt: str,
+    system_instructions: str,
+    budget: TokenBudget,
+    model_options: Optional[dict] = None,
+    policy: str = "shrink",
+) -> str:
+    """
+    Estimates the tokens of a rendered prompt and makes it fit the model's context window.
+
+    The estimate is recorded in the run metadata, along with the steps taken to shrink the prompt.
+
+    Args:
+        prompt (str): The rendered prompt.
+        system_instructions (str): The system prompt sent with it.
+        budget (TokenBudget): The model's context window and token factor.
+        model_options (dict, optional): The model options, which may change the window or response size.
+        policy (str): "shrink" to shrink prompts that are too large, "error" to refuse them,
+            "off" to only record the estimate.
+
+    Returns:
+        str: The prompt, shrunk if needed. A RenderedPrompt keeps its shared prefix if that was left intact.
+
+    Raises:
+        PromptTooLargeError: If the prompt is too large and the policy is "error", or it is still
+            too large after every shrinking step.
+    """
+    factor = budget.token_factor
+    fixed = estimate_tokens(system_instructions or "", factor) + MESSAGE_OVERHEAD_TOKENS
+    tokens = fixed + estimate_tokens(prompt, factor)
+    stats = current_run()
+    stats.set("estimated_prompt_tokens", tokens)
+
+    limit = prompt_limit(budget, model_options)
+    if limit is None or tokens <= limit or policy == "off":
+        return prompt
+    if policy == "error":
+        raise PromptTooLargeError(
+            f"The prompt is about {tokens} tokens, more than the {limit} tokens available in the model's context window."
+        )
+
+    shrunk = prompt
+    steps = []
+    for description, step in _SHRINK_STEPS:
+        shrunk, changed = step(shrunk, tokens - limit, factor)
+        if changed:
+            steps.append(description)
+            tokens = fixed + estimate_tokens(shrunk, factor)
+        if tokens <= limit:
+            break
+
+    stats.set("estimated_prompt_tokens", tokens)
+    stats.set("context_window_limit", limit)
+    if steps:
+        stats.set("prompt_shrunk", ", ".join(steps))
+    if tokens > limit:
+        raise PromptTooLargeError(
+            f"The prompt is about {tokens} tokens after shrinking it, more than the {limit} tokens available "
+            "in the model's context window."
+        )
+
+    prefix = getattr(prompt, "prefix", "")
+    if prefix and shrunk.startswith(prefix):
+        return type(prompt)(shrunk, prefix)
+    return shrunk
+
+
+def fit_prompt_for_model(
+    prompt: str, system_instructions: str, model_key: str, model_options: Optional[dict], policy: str
+) -> str:
+    """Applies fit_prompt() with the token budget configured for model_key in arg_options.token_budgets."""
+    from .arg_options import token_budgets
+
+    return fit_prompt(
+        prompt, system_instructions, token_budgets.get(model_key, TokenBudget(None)), model_options, policy
+    )
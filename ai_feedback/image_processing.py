@@ -1,17 +1,23 @@
+import asyncio
 import base64
 from pathlib import Path
 from typing import Optional
 
-from anthropic import Anthropic
-from dotenv import load_dotenv
-from ollama import Image, Message, chat
-from openai import OpenAI
+from ollama import Image, Message
 from PIL import Image as PILImage
 
+from .helpers import client_pool
 from .helpers.arg_options import Models
+from .helpers.async_utils import run_sync
+from .helpers.constants import PROVIDER_CONCURRENCY
+from .helpers.env import load_env
 from .helpers.image_extractor import extract_images, extract_qmd_python_images
 from .helpers.image_reader import *
-from .helpers.template_utils import render_prompt_template
+from .helpers.metrics import active_metrics, measure, stage
+from .helpers.rate_limit import estimate_tokens, get_limiter
+from .helpers.response_cache import acached_call, read_file_bytes
+from .helpers.streaming import current_sink, stream_text
+from .helpers.template_utils import ALL_QUESTIONS, render_prompt_template
 from .models.RemoteModel import RemoteModel
 
 
@@ -21,11 +27,11 @@ def encode_image(image_path: os.PathLike) -> bytes:
         return base64.b64encode(image_file.read()).decode("utf-8")
 
 
-def openai_call(message: Message, model: str) -> str | None:
+async def openai_call(message: Message, model: str) -> str | None:
     """Sends a request to OpenAI"""
     # Load environment variables from .env file
-    load_dotenv()
-    client = OpenAI()
+    load_env()
+    client = client_pool.async_openai_client()
     images = [
         {
             "type": "image_url",
@@ -33,9 +39,9 @@ def openai_call(message: Message, model: str) -> str | None:
         }
         for image in message.images
     ]
-    completion = client.chat.completions.create(
-        model=model,
-        messages=[
+    request_kwargs = {
+        "model": model,
+        "messages": [
             {
                 "role": "user",
                 "content": [
@@ -47,16 +53,20 @@ def openai_call(message: Message, model: str) -> str | None:
                 + images,
             }
         ],
-        temperature=0.33,
-    )
+        "temperature": 0.33,
+    }
+    if current_sink() is not None:
+        chunks = await client.chat.completions.create(**request_kwargs, stream=True)
+        return await stream_text(chunk.choices[0].delta.content async for chunk in chunks if chunk.choices)
+    completion = await client.chat.completions.create(**request_kwargs)
     return completion.choices[0].message.content
 
 
-def anthropic_call(message: Message, model: str) -> str | None:
+async def anthropic_call(message: Message, model: str) -> str | None:
     """Sends a request to OpenAI"""
     # Load environment variables from .env file
-    load_dotenv()
-    client = Anthropic(api_key=os.getenv("CLAUDE_API_KEY"))
+    load_env()
+    client = client_pool.async_anthropic_client(os.getenv("CLAUDE_API_KEY"))
     images = [
         {
             "type": "image",
@@ -68,10 +78,10 @@ def anthropic_call(message: Message, model: str) -> str | None:
         }
         for image in message.images
     ]
-    message = client.messages.create(
-        max_tokens=2048,
-        model=model,
-        messages=[
+    request_kwargs = {
+        "max_tokens": 2048,
+        "model": model,
+        "messages": [
             {
                 "role": "user",
                 "content": [
@@ -83,17 +93,42 @@ def anthropic_call(message: Message, model: str) -> str | None:
                 + images,
             }
         ],
-        temperature=0.33,
-    )
+        "temperature": 0.33,
+    }
+    if current_sink() is not None:
+        async with client.messages.stream(**request_kwargs) as stream:
+            return await stream_text(stream.text_stream)
+    message = await client.messages.create(**request_kwargs)
     return message.content[0].text
 
 
+async def ollama_call(message: Message, model: str) -> str | None:
+    """Sends a request to Ollama"""
+    client = client_pool.async_ollama_client()
+    if current_sink() is not None:
+        parts = await client.chat(model=model, messages=[message], options={"temperature": 0.33}, stream=True)
+        return await stream_text(part.message.content async for part in parts)
+    response = await client.chat(model=model, messages=[message], options={"temperature": 0.33})
+    return response.message.content
+
+
+def _message_key(provider: str, model: str, message: Message) -> dict:
+    """Returns the response cache key parts for an image-scope request."""
+    return {
+        "provider": provider,
+        "model": model,
+        "content": message.content,
+        "images": [read_file_bytes(image.value) for image in message.images],
+        "temperature": 0.33,
+    }
+
+
 def process_image(
     args, prompt: dict, system_instructions: str, marking_instructions: Optional[str] = None
 ) -> tuple[str, str]:
     """Generates feedback for an image submission.
     Returns the LLM prompt delivered and the returned response."""
-    OUTPUT_DIRECTORY = "output_images"
+    OUTPUT_DIRECTORY = getattr(args, "image_output_dir", None) or "output_images"
     submission_notebook = Path(args.submission)
     solution_notebook = None
     if args.solution:
@@ -107,13 +142,15 @@ def process_image(
     if args.solution and solution_notebook.is_file():
         extract_images(solution_notebook, OUTPUT_DIRECTORY, "solution")
 
-    if args.question:
-        questions = [args.question]
-    else:
+    if not args.question or args.question.strip().lower() == ALL_QUESTIONS:
         questions = os.listdir(OUTPUT_DIRECTORY)
+    elif "," in args.question and not os.path.isdir(os.path.join(OUTPUT_DIRECTORY, args.question)):
+        questions = list(dict.fromkeys(part.strip() for part in args.question.split(",") if part.strip()))
+    else:
+        questions = [args.question]
 
     requests: list[str] = []
-    responses: list[str] = []
+    messages: list[tuple[str, str, Message]] = []
 
     for question in questions:
         # Start with the raw prompt content
@@ -135,14 +172,15 @@ def process_image(
             image = PILImage.open(submission_image_path)
             prompt_content = prompt_content.replace("{image_size}", f"{image.width} by {image.height}")
 
-        rendered_prompt = render_prompt_template(
-            prompt_content,
-            submission=submission_notebook,
-            solution=solution_notebook,
-            has_submission_image="{submission_image}" in prompt_content,
-            has_solution_image="{solution_image}" in prompt_content and args.solution_image,
-            marking_instructions=marking_instructions,
-        )
+        with stage("render_prompt"):
+            rendered_prompt = render_prompt_template(
+                prompt_content,
+                submission=submission_notebook,
+                solution=solution_notebook,
+                has_submission_image="{submission_image}" in prompt_content,
+                has_solution_image="{solution_image}" in prompt_content and args.solution_image,
+                marking_instructions=marking_instructions,
+            )
 
         message = Message(role="user", content=rendered_prompt, images=[])
         if "{submission_image}" in prompt_content:
@@ -157,29 +195,107 @@ def process_image(
         for image in images:
             message.images.append(Image(value=image))
 
-        # Prompt the LLM
+        if active_metrics() is not None:
+            measure("prompt_bytes", len(rendered_prompt.encode("utf-8")))
+            measure("image_bytes", sum(os.path.getsize(image.value) for image in message.images))
         requests.append(f"{message.content}\n\n{[str(image.value) for image in message.images]}")
-        if args.model == Models.OPENAI.value:
-            responses.append(openai_call(message, model="gpt-4o"))
-        elif args.model == Models.CLAUDE.value:
-            responses.append(anthropic_call(message, model="claude-3-7-sonnet-20250219"))
-        elif args.model == Models.REMOTE.value:
-            if args.remote_model:
-                model = RemoteModel(model_name=args.remote_model)
-            else:
-                model = RemoteModel()
-
-            _request, response = model.generate_response(
-                rendered_prompt,
-                args.submission,
-                system_instructions=system_instructions,
-                question=question,
-                submission_image=args.submission_image,
-                json_schema=args.json_schema,
-                model_options=args.model_options,
-            )
-            responses.append(str(response))
-        else:
-            responses.append(chat(model=args.model, messages=[message], options={"temperature": 0.33}).message.content)
+        messages.append((question, rendered_prompt, message))
+
+    request = "\n\n---\n\n".join(requests)
+    provider = _provider(args.model)
+    limit = args.max_concurrency if getattr(args, "max_concurrency", None) else PROVIDER_CONCURRENCY[provider]
+    sink = current_sink()
+    if sink is not None:
+        # Streamed responses are written in question order, so questions are asked one at a time
+        sink.begin(request)
+        limit = 1
+    with stage("model_call"):
+        responses = run_sync(_ask_all(args, provider, messages, system_instructions, limit))
+
+    return request, "\n\n---\n\n".join(responses)
+
+
+def _provider(model: str) -> str:
+    """Returns the provider that serves the given --model value in the image scope."""
+    if model == Models.OPENAI.value:
+        return "openai"
+    if model == Models.CLAUDE.value:
+        return "anthropic"
+    if model == Models.REMOTE.value:
+        return "remote"
+    return "ollama"
+
+
+async def _ask(
+    args,
+    provider: str,
+    question: str,
+    rendered_prompt: str,
+    message: Message,
+    system_instructions: str,
+    remote_model: Optional[RemoteModel] = None,
+) -> str:
+    """Prompts the LLM for a single question and returns its response."""
+    limiter = get_limiter(args.model)
+    tokens = estimate_tokens(message.content)
+    if provider == "openai":
+        return await acached_call(
+            _message_key("openai", "gpt-4o", message),
+            lambda: limiter.arun(lambda: openai_call(message, model="gpt-4o"), tokens),
+        )
+    if provider == "anthropic":
+        claude_model = "claude-3-7-sonnet-20250219"
+        return await acached_call(
+            _message_key("anthropic", claude_model, message),
+            lambda: limiter.arun(lambda: anthropic_call(message, model=claude_model), tokens),
+        )
+    if provider == "remote":
+        _request, response = await remote_model.agenerate_response(
+            rendered_prompt,
+            args.submission,
+            system_instructions=system_instructions,
+            question=question,
+            submission_image=args.submission_image,
+            json_schema=args.json_schema,
+            model_options=args.model_options,
+        )
+        return str(response)
+    return await acached_call(
+        _message_key("ollama", args.model, message),
+        lambda: limiter.arun(lambda: ollama_call(message, args.model), tokens),
+    )
+
+
+async def _ask_all(
+    args, provider: str, messages: list[tuple[str, str, Message]], system_instructions: str, limit: int
+) -> list[str]:
+    """Prompts the LLM for every question concurrently, at most {limit} requests at a time.
+
+    Responses are returned in question order. A question whose request fails gets an error
+    message as its response instead of aborting the other questions. When streaming, each
+    response is also written to the current sink, separated like in the joined output.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+    remote_model = None
+    if provider == "remote":
+        remote_model = RemoteModel(model_name=args.remote_model) if args.remote_model else RemoteModel()
+
+    sink = current_sink()
+
+    async def ask_one(index: int, question: str, rendered_prompt: str, message: Message) -> str:
+        async with semaphore:
+            if sink is not None and index > 0:
+                sink.write("\n\n---\n\n")
+            written = sink.written if sink is not None else 0
+            try:
+                response = await _ask(
+                    args, provider, question, rendered_prompt, message, system_instructions, remote_model
+                )
+            except Exception as e:
+                response = f"Error generating feedback for {question}: {e}"
+            if sink is not None and sink.written == written:
+                # Cached, failed or non-streaming responses arrive all at once
+                sink.write(response)
+            return response
 
-    return "\n\n---\n\n".join(requests), "\n\n---\n\n".join(responses)
+    return await asyncio.gather(*(ask_one(index, *entry) for index, entry in enumerate(messages)))
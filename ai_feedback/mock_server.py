@@ -0,0 +1,770 @@
+"""
+Local stand-in for the model providers, for offline load, latency and batch testing.
+
+Serves, keeping everything in memory:
+
+- the chat endpoints of every provider path: OpenAI chat completions (/v1/chat/completions),
+  Anthropic messages (/v1/messages), Ollama (/api/chat), llama-server completions
+  (/v1/completions) and the ai-server /chat form endpoint used by RemoteModel, each with and
+  without streaming;
+- the parts of the OpenAI Files and Batch APIs and of Anthropic Message Batches that
+  ai_feedback.batch_api uses. A batch job stays in progress for --batch_seconds after it is
+  created and then ends with a canned response for every request.
+
+Chat responses wait for a latency drawn from --latency before their first token, and then
+produce --response_tokens tokens at --tokens_per_second. --error_rate and --rate_limit_rate make
+that share of chat requests fail with a 500, or with a 429 and a Retry-After header. A request
+whose prompt contains MOCK_ERROR always fails. GET /mock/stats returns the request counts.
+
+Usage:
+    python -m ai_feedback.mock_server --port 8766 --latency lognormal:0.8,4 --tokens_per_second 40
+    OPENAI_BASE_URL=http://127.0.0.1:8766/v1 OPENAI_API_KEY=mock python -m ai_feedback --model openai ...
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8766 CLAUDE_API_KEY=mock python -m ai_feedback --model claude-3.7-sonnet ...
+    OLLAMA_HOST=http://127.0.0.1:8766 python -m ai_feedback --model codellama:latest ...
+    LLAMA_SERVER_URL=http://127.0.0.1:8766 python -m ai_feedback --model deepSeek-v3 --llama_mode server ...
+    REMOTE_URL=http://127.0.0.1:8766/chat python -m ai_feedback --model remote ...
+
+benchmarks/load_test.py runs concurrent grading jobs against it.
+"""
+
+import argparse
+import datetime
+import email.message
+import email.parser
+import email.policy
+import itertools
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .helpers.token_budget import estimate_tokens
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8766
+ERROR_MARKER = "MOCK_ERROR"
+
+
+def _content_text(content: Any) -> str:
+    """Returns the text of a message content, which may be a string or a list of content blocks."""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content or "")
+
+
+def _prompt_text(body: Dict[str, Any]) -> str:
+    """Returns the text of the last message of a chat or messages request body."""
+    messages = body.get("messages") or [{}]
+    return _content_text(messages[-1].get("content", ""))
+
+
+def _request_tokens(body: Dict[str, Any]) -> int:
+    """Estimates the input tokens of a chat or messages request body, system prompt included."""
+    text = _content_text(body.get("system", ""))
+    for message in body.get("messages") or []:
+        text += "\n" + _content_text(message.get("content", ""))
+    return estimate_tokens(text)
+
+
+def _response_text(model: str, prompt: str) -> str:
+    return f"Mock response from {model} to a {len(prompt)} character prompt."
+
+
+def mock_response(body: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """Returns the canned response text for a request body, or an error message for failing requests."""
+    prompt = _prompt_text(body)
+    if ERROR_MARKER in prompt:
+        return None, f"Mock error requested by the prompt ({ERROR_MARKER})."
+    return _response_text(body.get("model", "unknown"), prompt), None
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Parses a latency distribution into a function that draws latencies in seconds from it.
+
+    Args:
+        spec (str): "SECONDS" or "fixed:SECONDS", "uniform:LOW,HIGH", "normal:MEAN,STDDEV",
+            "exponential:MEAN" or "lognormal:MEDIAN,P99". Negative draws are clamped to 0.
+
+    Returns:
+        Callable[[random.Random], float]: Draws one latency with the given random generator.
+
+    Raises:
+        ValueError: If the spec is malformed.
+    """
+    kind, _, values = spec.partition(":") if ":" in spec else ("fixed", "", spec)
+    try:
+        numbers = [float(value) for value in values.split(",")]
+    except ValueError:
+        raise ValueError(f"Invalid latency '{spec}': the parameters must be numbers.")
+    expected = {"fixed": 1, "exponential": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+    if kind not in expected:
+        raise ValueError(f"Unknown latency distribution '{kind}'; expected one of: {', '.join(expected)}.")
+    if len(numbers) != expected[kind] or any(number < 0 for number in numbers):
+        raise ValueError(f"Invalid latency '{spec}': {kind} takes {expected[kind]} non-negative parameter(s).")
+
+    if kind == "fixed":
+        return lambda generator: numbers[0]
+    if kind == "uniform":
+        return lambda generator: generator.uniform(*numbers)
+    if kind == "normal":
+        return lambda generator: max(0.0, generator.gauss(*numbers))
+    if kind == "exponential":
+        return lambda generator: generator.expovariate(1 / numbers[0]) if numbers[0] else 0.0
+    median, p99 = numbers
+    if median <= 0 or p99 < median:
+        raise ValueError(f"Invalid latency '{spec}': lognormal needs 0 < MEDIAN <= P99.")
+    # 2.326 is the z-score of the 99th percentile
+    sigma = math.log(p99 / median) / 2.326
+    return lambda generator: generator.lognormvariate(math.log(median), sigma)
+
+
+class ChatBehaviour(NamedTuple):
+    """How the chat endpoints respond."""
+
+    # Distribution of the time before the first token, see parse_latency()
+    latency: str = "0"
+    # Speed at which response tokens are produced, or 0 to produce them instantly
+    tokens_per_second: float = 0.0
+    # Tokens in every response (at least the words of the canned sentence)
+    response_tokens: int = 64
+    # Share of requests that fail with a 500 after their latency
+    error_rate: float = 0.0
+    # Share of requests that are refused straight away with a 429 and a Retry-After header
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+    # Seed of the latency and failure draws, for reproducible runs
+    seed: Optional[int] = None
+
+
+class MockState:
+    """Files, batch jobs and request counts of the server, shared by every request handler thread."""
+
+    def __init__(self, batch_seconds: float, behaviour: ChatBehaviour = ChatBehaviour()) -> None:
+        self.batch_seconds = batch_seconds
+        self.behaviour = behaviour
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.counts: Counter = Counter()
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._latency = parse_latency(behaviour.latency)
+        self._random = random.Random(behaviour.seed)
+        self._random_lock = threading.Lock()
+
+    def new_id(self, prefix: str) -> str:
+        return f"{prefix}_mock{next(self._ids):06d}"
+
+    def ended(self, job: Dict[str, Any]) -> bool:
+        return time.time() >= job["created"] + self.batch_seconds
+
+    def count(self, *names: str) -> None:
+        with self.lock:
+            self.counts.update(names)
+
+    def draw(self) -> Tuple[Optional[int], float]:
+        """Draws whether a chat request fails (with 429 or 500, else None) and its latency in seconds."""
+        with self._random_lock:
+            roll = self._random.random()
+            latency = self._latency(self._random)
+        if roll < self.behaviour.rate_limit_rate:
+            return 429, latency
+        if roll < self.behaviour.rate_limit_rate + self.behaviour.error_rate:
+            return 500, latency
+        return None, latency
+
+    def response_pieces(self, model: str, prompt: str) -> List[str]:
+        """Returns the tokens of the response to prompt, as they are streamed."""
+        words = _response_text(model, prompt).split(" ")
+        words += [_FILLER[i % len(_FILLER)] for i in range(self.behaviour.response_tokens - len(words))]
+        return [word if i == 0 else f" {word}" for i, word in enumerate(words)]
+
+
+# Words the canned responses are padded with up to ChatBehaviour.response_tokens
+_FILLER = ("The", "submission", "passes", "most", "tests;", "check", "the", "edge", "cases.")
+
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+    """Routes requests to the chat and batch endpoints of the providers."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    state: MockState
+
+    # Handlers that keep the state locked and return (status, payload)
+    routes = [
+        ("POST", r"/v1/files", "create_file"),
+        ("GET", r"/v1/files/(?P<file_id>[^/]+)/content", "file_content"),
+        ("POST", r"/v1/batches", "create_openai_batch"),
+        ("GET", r"/v1/batches/(?P<batch_id>[^/]+)", "get_openai_batch"),
+        ("POST", r"/v1/messages/batches", "create_anthropic_batch"),
+        ("GET", r"/v1/messages/batches/(?P<batch_id>[^/]+)", "get_anthropic_batch"),
+        ("GET", r"/v1/messages/batches/(?P<batch_id>[^/]+)/results", "anthropic_results"),
+        ("GET", r"/mock/stats", "stats"),
+    ]
+    # Chat protocols, which wait and stream without holding the lock: (path, protocol)
+    chat_routes = [
+        (r"/v1/chat/completions", "openai"),
+        (r"/v1/messages", "anthropic"),
+        (r"/api/chat", "ollama"),
+        (r"/v1/completions", "llama"),
+        (r"/chat", "remote"),
+    ]
+
+    def _dispatch(self, method: str) -> None:
+        path = self.path.split("?", 1)[0]
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if method == "POST":
+            for pattern, protocol in self.chat_routes:
+                if re.fullmatch(pattern, path):
+                    self._chat(protocol, body)
+                    return
+        for route_method, pattern, name in self.routes:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                with self.state.lock:
+                    status, payload = getattr(self, name)(body, **match.groupdict())
+                break
+        else:
+            status, payload = 404, {"error": {"type": "not_found_error", "message": f"No route for {method} {path}"}}
+        self._send(status, payload)
+
+    def _send(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        if isinstance(payload, bytes):
+            data, content_type = payload, "application/binary"
+        else:
+            data, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _form_fields(self, body: bytes) -> Dict[str, email.message.EmailMessage]:
+        """Parses a multipart/form-data body into its parts by field name."""
+        header = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode("utf-8")
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(header + body)
+        return {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+
+    def do_GET(self) -> None:
+        self._dispatch("GET")
+
+    def do_POST(self) -> None:
+        self._dispatch("POST")
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def stats(self, body: bytes) -> Tuple[int, Any]:
+        return 200, dict(self.state.counts)
+
+    # Chat endpoints
+
+    def _chat_request(self, protocol: str, body: bytes) -> Tuple[str, str, int, bool, bool]:
+        """Reads a chat request.
+
+        Returns:
+            Tuple[str, str, int, bool, bool]: The prompt, the model, the estimated input tokens,
+                whether the response is streamed and whether usage is sent with a streamed response.
+        """
+        if protocol == "remote":
+            if self.headers.get("Content-Type", "").startswith("multipart/form-data"):
+                fields = {name: part.get_content() for name, part in self._form_fields(body).items()}
+            else:
+                fields = {name: values[0] for name, values in urllib.parse.parse_qs(body.decode("utf-8")).items()}
+            prompt = fields.get("content", "")
+            tokens = estimate_tokens(f"{fields.get('system_instructions', '')}\n{prompt}")
+            return prompt, fields.get("model", "remote"), tokens, False, False
+        request = json.loads(body or b"{}")
+        stream = bool(request.get("stream", protocol == "ollama"))
+        if protocol == "llama":
+            prompt = str(request.get("prompt", ""))
+            return prompt, request.get("model", "llama-server"), estimate_tokens(prompt), stream, True
+        include_usage = protocol != "openai" or bool((request.get("stream_options") or {}).get("include_usage"))
+        return _prompt_text(request), request.get("model", "mock"), _request_tokens(request), stream, include_usage
+
+    def _chat(self, protocol: str, body: bytes) -> None:
+        """Answers a chat request of protocol after the configured latency, failing it if drawn to."""
+        behaviour = self.state.behaviour
+        try:
+            prompt, model, input_tokens, stream, include_usage = self._chat_request(protocol, body)
+        except ValueError as e:
+            self._send_error(protocol, 400, f"Invalid request: {e}")
+            return
+        failure, latency = self.state.draw()
+        self.state.count("requests", f"requests_{protocol}")
+        if failure == 429:
+            self.state.count("rate_limited")
+            self._send_error(protocol, 429, "Mock rate limit.", {"Retry-After": f"{behaviour.retry_after:g}"})
+            return
+        if ERROR_MARKER in prompt:
+            self.state.count("errors")
+            self._send_error(protocol, 400, f"Mock error requested by the prompt ({ERROR_MARKER}).")
+            return
+        time.sleep(latency)
+        if failure == 500:
+            self.state.count("errors")
+            self._send_error(protocol, 500, "Mock server error.")
+            return
+
+        pieces = self.state.response_pieces(model, prompt)
+        usage = (input_tokens, len(pieces))
+        delay = 1 / behaviour.tokens_per_second if behaviour.tokens_per_second > 0 else 0.0
+        if not stream:
+            time.sleep(delay * len(pieces))
+            self._send(200, _CHAT_FORMATS[protocol][0](self.state.new_id("mock"), model, "".join(pieces), usage))
+            return
+
+        self.state.count("streamed")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson" if protocol == "ollama" else "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunks = _CHAT_FORMATS[protocol][1](self.state.new_id("mock"), model, pieces, usage, include_usage)
+        for data, is_token in chunks:
+            if is_token and delay:
+                time.sleep(delay)
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _send_error(self, protocol: str, status: int, message: str, headers: Optional[Dict[str, str]] = None) -> None:
+        if protocol == "anthropic":
+            kind = {429: "rate_limit_error", 400: "invalid_request_error"}.get(status, "api_error")
+            payload: Any = {"type": "error", "error": {"type": kind, "message": message}}
+        elif protocol in ("openai", "llama"):
+            kind = {429: "rate_limit_exceeded", 400: "invalid_request_error"}.get(status, "server_error")
+            payload = {"error": {"message": message, "type": kind, "code": status}}
+        else:
+            payload = {"error": message}
+        self._send(status, payload, headers)
+
+    # OpenAI Files and Batch API
+
+    def create_file(self, body: bytes) -> Tuple[int, Any]:
+        fields = self._form_fields(body)
+        if "file" not in fields:
+            return 400, {"error": {"message": "Missing file."}}
+        file_id = self.state.new_id("file")
+        content = fields["file"].get_payload(decode=True)
+        purpose = fields["purpose"].get_content().strip() if "purpose" in fields else "batch"
+        self.state.files[file_id] = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": fields["file"].get_filename() or "upload.jsonl",
+            "purpose": purpose,
+            "status": "processed",
+            "content": content,
+        }
+        return 200, {key: value for key, value in self.state.files[file_id].items() if key != "content"}
+
+    def file_content(self, body: bytes, file_id: str) -> Tuple[int, Any]:
+        if file_id not in self.state.files:
+            return 404, {"error": {"message": f"No file {file_id}."}}
+        return 200, self.state.files[file_id]["content"]
+
+    def create_openai_batch(self, body: bytes) -> Tuple[int, Any]:
+        params = json.loads(body)
+        input_file = self.state.files.get(params.get("input_file_id"))
+        if input_file is None:
+            return 400, {"error": {"message": "Unknown input_file_id."}}
+        requests, errors = [], []
+        for line_number, line in enumerate(input_file["content"].decode("utf-8").splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                requests.append((request["custom_id"], request["body"]))
+            except (ValueError, KeyError) as e:
+                errors.append({"code": "invalid_request", "message": f"Invalid request: {e}", "line": line_number})
+        batch_id = self.state.new_id("batch")
+        self.state.batches[batch_id] = {
+            "id": batch_id,
+            "provider": "openai",
+            "created": time.time(),
+            "endpoint": params.get("endpoint"),
+            "input_file_id": input_file["id"],
+            "requests": requests,
+            "errors": errors,
+        }
+        return 200, self._openai_batch(self.state.batches[batch_id])
+
+    def get_openai_batch(self, body: bytes, batch_id: str) -> Tuple[int, Any]:
+        job = self.state.batches.get(batch_id)
+        if job is None or job["provider"] != "openai":
+            return 404, {"error": {"message": f"No batch {batch_id}."}}
+        return 200, self._openai_batch(job)
+
+    def _openai_batch(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Describes a job as an OpenAI batch object, writing its result files once it has ended."""
+        status = "in_progress"
+        if job["errors"]:
+            status = "failed"
+        elif self.state.ended(job):
+            status = "completed"
+            if "output_file_id" not in job:
+                self._write_openai_results(job)
+        total = len(job["requests"])
+        failed = job.get("failed", 0)
+        return {
+            "id": job["id"],
+            "object": "batch",
+            "endpoint": job["endpoint"],
+            "errors": {"object": "list", "data": job["errors"]} if job["errors"] else None,
+            "input_file_id": job["input_file_id"],
+            "completion_window": "24h",
+            "status": status,
+            "output_file_id": job.get("output_file_id"),
+            "error_file_id": job.get("error_file_id"),
+            "created_at": int(job["created"]),
+            "completed_at": int(job["created"] + self.state.batch_seconds) if status == "completed" else None,
+            "request_counts": {
+                "total": total,
+                "completed": total - failed if status == "completed" else 0,
+                "failed": failed,
+            },
+        }
+
+    def _write_openai_results(self, job: Dict[str, Any]) -> None:
+        outputs: List[str] = []
+        errors: List[str] = []
+        for custom_id, body in job["requests"]:
+            text, error = mock_response(body)
+            request_id = self.state.new_id("req")
+            if error is not None:
+                response = {"status_code": 400, "request_id": request_id, "body": {"error": {"message": error}}}
+                errors.append(json.dumps({"id": request_id, "custom_id": custom_id, "response": response}))
+                continue
+            completion = {
+                "id": f"chatcmpl-{request_id}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            }
+            response = {"status_code": 200, "request_id": request_id, "body": completion}
+            outputs.append(json.dumps({"id": request_id, "custom_id": custom_id, "response": response, "error": None}))
+        job["failed"] = len(errors)
+        for key, lines in (("output_file_id", outputs), ("error_file_id", errors)):
+            if lines:
+                file_id = self.state.new_id("file")
+                content = ("\n".join(lines) + "\n").encode("utf-8")
+                self.state.files[file_id] = {"id": file_id, "purpose": "batch_output", "content": content}
+                job[key] = file_id
+            else:
+                job[key] = None
+
+    # Anthropic Message Batches
+
+    def create_anthropic_batch(self, body: bytes) -> Tuple[int, Any]:
+        params = json.loads(body)
+        requests = [(request["custom_id"], request["params"]) for request in params.get("requests", [])]
+        if not requests:
+            return 400, {"type": "error", "error": {"type": "invalid_request_error", "message": "No requests."}}
+        batch_id = self.state.new_id("msgbatch")
+        self.state.batches[batch_id] = {
+            "id": batch_id,
+            "provider": "anthropic",
+            "created": time.time(),
+            "requests": requests,
+        }
+        return 200, self._anthropic_batch(self.state.batches[batch_id])
+
+    def get_anthropic_batch(self, body: bytes, batch_id: str) -> Tuple[int, Any]:
+        job = self.state.batches.get(batch_id)
+        if job is None or job["provider"] != "anthropic":
+            return 404, {"type": "error", "error": {"type": "not_found_error", "message": f"No batch {batch_id}."}}
+        return 200, self._anthropic_batch(job)
+
+    def _anthropic_batch(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Describes a job as an Anthropic message batch object."""
+        ended = self.state.ended(job)
+        failed = sum(mock_response(body)[1] is not None for _, body in job["requests"]) if ended else 0
+        total = len(job["requests"])
+        return {
+            "id": job["id"],
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else total,
+                "succeeded": total - failed if ended else 0,
+                "errored": failed,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": _iso(job["created"]),
+            "ended_at": _iso(job["created"] + self.state.batch_seconds) if ended else None,
+            "expires_at": _iso(job["created"] + 86400),
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": (
+                f"http://{self.headers.get('Host')}/v1/messages/batches/{job['id']}/results" if ended else None
+            ),
+        }
+
+    def anthropic_results(self, body: bytes, batch_id: str) -> Tuple[int, Any]:
+        job = self.state.batches.get(batch_id)
+        if job is None or job["provider"] != "anthropic" or not self.state.ended(job):
+            return 404, {"type": "error", "error": {"type": "not_found_error", "message": "No results yet."}}
+        lines = []
+        for custom_id, params in job["requests"]:
+            text, error = mock_response(params)
+            if error is not None:
+                result = {
+                    "type": "errored",
+                    "error": {"type": "error", "error": {"type": "api_error", "message": error}},
+                }
+            else:
+                message = {
+                    "id": self.state.new_id("msg"),
+                    "type": "message",
+                    "role": "assistant",
+                    "model": params.get("model", "mock"),
+                    "content": [{"type": "text", "text": text}],
+                    "stop_reason": "end_turn",
+                    "stop_sequence": None,
+                    "usage": {"input_tokens": 0, "output_tokens": 0},
+                }
+                result = {"type": "succeeded", "message": message}
+            lines.append(json.dumps({"custom_id": custom_id, "result": result}))
+        return 200, ("\n".join(lines) + "\n").encode("utf-8")
+
+
+# Chat response formats. Each protocol has a function building the complete response from
+# (id, model, text, (input_tokens, output_tokens)), and one yielding the (data, carries a token)
+# chunks of a streamed response from (id, model, pieces, usage, include_usage).
+
+
+def _sse(payload: Any, event: Optional[str] = None) -> bytes:
+    data = payload if isinstance(payload, str) else json.dumps(payload)
+    return (f"event: {event}\n" if event else "").encode("utf-8") + f"data: {data}\n\n".encode("utf-8")
+
+
+def _openai_usage(usage: Tuple[int, int]) -> Dict[str, int]:
+    return {"prompt_tokens": usage[0], "completion_tokens": usage[1], "total_tokens": sum(usage)}
+
+
+def _openai_response(id: str, model: str, text: str, usage: Tuple[int, int]) -> Dict[str, Any]:
+    return {
+        "id": f"chatcmpl-{id}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": _openai_usage(usage),
+    }
+
+
+def _openai_chunks(
+    id: str, model: str, pieces: List[str], usage: Tuple[int, int], include_usage: bool
+) -> Iterator[Tuple[bytes, bool]]:
+    def chunk(delta: Dict[str, str], finish_reason: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            "id": f"chatcmpl-{id}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    yield _sse(chunk({"role": "assistant", "content": ""})), False
+    for piece in pieces:
+        yield _sse(chunk({"content": piece})), True
+    yield _sse(chunk({}, "stop")), False
+    if include_usage:
+        yield _sse({**chunk({}), "choices": [], "usage": _openai_usage(usage)}), False
+    yield _sse("[DONE]"), False
+
+
+def _anthropic_response(id: str, model: str, text: str, usage: Tuple[int, int]) -> Dict[str, Any]:
+    return {
+        "id": f"msg_{id}",
+        "type": "message",
+        "role": "assistant",
+        "model": model,
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": usage[0], "output_tokens": usage[1]},
+    }
+
+
+def _anthropic_chunks(
+    id: str, model: str, pieces: List[str], usage: Tuple[int, int], include_usage: bool
+) -> Iterator[Tuple[bytes, bool]]:
+    message = {**_anthropic_response(id, model, "", (usage[0], 1)), "content": [], "stop_reason": None}
+    yield _sse({"type": "message_start", "message": message}, "message_start"), False
+    block = {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}
+    yield _sse(block, "content_block_start"), False
+    for piece in pieces:
+        delta = {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}}
+        yield _sse(delta, "content_block_delta"), True
+    yield _sse({"type": "content_block_stop", "index": 0}, "content_block_stop"), False
+    delta = {
+        "type": "message_delta",
+        "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+        "usage": {"output_tokens": usage[1]},
+    }
+    yield _sse(delta, "message_delta"), False
+    yield _sse({"type": "message_stop"}, "message_stop"), False
+
+
+def _ollama_response(id: str, model: str, text: str, usage: Tuple[int, int]) -> Dict[str, Any]:
+    return {
+        "model": model,
+        "created_at": _iso(time.time()),
+        "message": {"role": "assistant", "content": text},
+        "done": True,
+        "done_reason": "stop",
+        "prompt_eval_count": usage[0],
+        "eval_count": usage[1],
+    }
+
+
+def _ollama_chunks(
+    id: str, model: str, pieces: List[str], usage: Tuple[int, int], include_usage: bool
+) -> Iterator[Tuple[bytes, bool]]:
+    for piece in pieces:
+        chunk = {"model": model, "created_at": _iso(time.time()), "message": {"role": "assistant", "content": piece}}
+        yield (json.dumps({**chunk, "done": False}) + "\n").encode("utf-8"), True
+    yield (json.dumps(_ollama_response(id, model, "", usage)) + "\n").encode("utf-8"), False
+
+
+def _llama_response(id: str, model: str, text: str, usage: Tuple[int, int]) -> Dict[str, Any]:
+    return {
+        "id": f"cmpl-{id}",
+        "object": "text_completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "text": text, "finish_reason": "stop"}],
+        "usage": _openai_usage(usage),
+    }
+
+
+def _llama_chunks(
+    id: str, model: str, pieces: List[str], usage: Tuple[int, int], include_usage: bool
+) -> Iterator[Tuple[bytes, bool]]:
+    for piece in pieces:
+        chunk = {**_llama_response(id, model, piece, usage), "choices": [{"index": 0, "text": piece}]}
+        del chunk["usage"]
+        yield _sse(chunk), True
+    yield _sse(
+        {**_llama_response(id, model, "", usage), "choices": [{"index": 0, "text": "", "finish_reason": "stop"}]}
+    ), False
+    yield _sse("[DONE]"), False
+
+
+def _remote_response(id: str, model: str, text: str, usage: Tuple[int, int]) -> str:
+    # ai-server answers with the response text as a JSON string
+    return text
+
+
+_CHAT_FORMATS: Dict[str, Tuple[Callable, Optional[Callable]]] = {
+    "openai": (_openai_response, _openai_chunks),
+    "anthropic": (_anthropic_response, _anthropic_chunks),
+    "ollama": (_ollama_response, _ollama_chunks),
+    "llama": (_llama_response, _llama_chunks),
+    "remote": (_remote_response, None),
+}
+
+
+def start_server(
+    host: str = DEFAULT_HOST, port: int = 0, batch_seconds: float = 5.0, behaviour: ChatBehaviour = ChatBehaviour()
+) -> ThreadingHTTPServer:
+    """Starts the mock server in a daemon thread and returns it; server.server_port is the bound port.
+
+    Args:
+        host (str): Interface to bind to.
+        port (int): Port to listen on, or 0 for any free port.
+        batch_seconds (float): Seconds a batch job stays in progress before it ends.
+        behaviour (ChatBehaviour): Latency, token rate and failures of the chat endpoints.
+
+    Raises:
+        ValueError: If the latency distribution of behaviour is malformed.
+    """
+    handler = type("BoundMockProviderHandler", (MockProviderHandler,), {"state": MockState(batch_seconds, behaviour)})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="ai_feedback-mock-server", daemon=True).start()
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Runs the mock server until interrupted."""
+    parser = argparse.ArgumentParser(
+        prog="python -m ai_feedback.mock_server", description=__doc__.strip().split("\n\n")[0]
+    )
+    parser.add_argument("--host", type=str, default=DEFAULT_HOST, help="Interface to bind to.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on.")
+    parser.add_argument(
+        "--batch_seconds", type=float, default=5.0, help="Seconds a batch job stays in progress before it ends."
+    )
+    parser.add_argument(
+        "--latency",
+        type=str,
+        default="0",
+        help="Distribution of the seconds before the first token of a chat response: SECONDS, uniform:LOW,HIGH, "
+        "normal:MEAN,STDDEV, exponential:MEAN or lognormal:MEDIAN,P99.",
+    )
+    parser.add_argument(
+        "--tokens_per_second",
+        type=float,
+        default=0.0,
+        help="Speed at which response tokens are produced; 0 produces them instantly.",
+    )
+    parser.add_argument("--response_tokens", type=int, default=64, help="Tokens in every chat response.")
+    parser.add_argument(
+        "--error_rate", type=float, default=0.0, help="Share of chat requests that fail with a 500 error."
+    )
+    parser.add_argument(
+        "--rate_limit_rate",
+        type=float,
+        default=0.0,
+        help="Share of chat requests that are refused with a 429 error and a Retry-After header.",
+    )
+    parser.add_argument(
+        "--retry_after", type=float, default=1.0, help="Seconds of the Retry-After header of 429 errors."
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the latency and failure draws.")
+    args = parser.parse_args(argv)
+
+    behaviour = ChatBehaviour(
+        args.latency,
+        args.tokens_per_second,
+        args.response_tokens,
+        args.error_rate,
+        args.rate_limit_rate,
+        args.retry_after,
+        args.seed,
+    )
+    try:
+        server = start_server(args.host, args.port, args.batch_seconds, behaviour)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Mock provider server listening on http://{args.host}:{server.server_port}", file=sys.stderr, flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,24 +3,38 @@ from pathlib import Path
 from typing import Optional, Tuple
 
 import anthropic
-from dotenv import load_dotenv
 
+from ..helpers import client_pool
+from ..helpers.arg_options import Models
+from ..helpers.env import load_env
 from ..helpers.model_options_helpers import cast_to_type, claude_option_schema
+from ..helpers.provider_batch import batch_response
+from ..helpers.rate_limit import rate_limited
+from ..helpers.response_cache import cached_response
+from ..helpers.run_stats import record_token_usage
+from ..helpers.streaming import current_sink, stream_text
+from ..helpers.template_utils import split_prompt
 from .Model import Model
 
 # Load environment variables from .env file
-load_dotenv()
+load_env()
 
 
 class ClaudeModel(Model):
     def __init__(self) -> None:
         """
-        Initializes the ClaudeModel with the Anthropic client using an API key.
+        Initializes the ClaudeModel.
         """
         super().__init__()
-        self.client = anthropic.Anthropic(api_key=os.getenv("CLAUDE_API_KEY"))
 
-    def generate_response(
+    @property
+    def client(self) -> anthropic.AsyncAnthropic:
+        """The shared Anthropic client of the running event loop, authenticated with the API key."""
+        return client_pool.async_anthropic_client(os.getenv("CLAUDE_API_KEY"))
+
+    @cached_response
+    @rate_limited(Models.CLAUDE.value)
+    async def agenerate_response(
         self,
         prompt: str,
         submission_file: Path,
@@ -56,7 +70,15 @@ class ClaudeModel(Model):
         if question:
             request += f" Identify and generate a response for the mistakes **only** in question/task ${question}. "
 
-        request += prompt
+        prefix, rest = split_prompt(prompt)
+        if prefix:
+            # The shared prefix goes first, ending in a cache breakpoint, so it is read from the prompt cache
+            content = [
+                {"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}},
+                {"type": "text", "text": request + rest},
+            ]
+        else:
+            content = request + prompt
 
         model_options = cast_to_type(claude_option_schema, model_options)
 
@@ -64,14 +86,36 @@ class ClaudeModel(Model):
         request_kwargs = {
             "model": "claude-3-7-sonnet-20250219",
             "system": system_instructions,
-            "messages": [{"role": "user", "content": request}],
+            "messages": [{"role": "user", "content": content}],
             **model_options,
         }
 
-        response = self.client.messages.create(**request_kwargs)
+        batched = batch_response("anthropic", request_kwargs)
+        if batched is not None:
+            return prompt, batched
+
+        sink = current_sink()
+        if sink is not None:
+            sink.begin(prompt)
+            async with self.client.messages.stream(**request_kwargs) as stream:
+                text = await stream_text(stream.text_stream)
+                self._record_usage((await stream.get_final_message()).usage)
+            return prompt, text
+
+        response = await self.client.messages.create(**request_kwargs)
+        self._record_usage(getattr(response, "usage", None))
 
         if not response or not response.content:
             print("Error: Invalid or empty response from Claude.")
             return None
 
         return prompt, response.content[0].text
+
+    @staticmethod
+    def _record_usage(usage) -> None:
+        """Records the token usage of a response, including the input tokens read from and written to the prompt cache."""
+        if usage is None:
+            return
+        cache_read = usage.cache_read_input_tokens or 0
+        cache_write = usage.cache_creation_input_tokens or 0
+        record_token_usage(usage.input_tokens + cache_read + cache_write, usage.output_tokens, cache_read, cache_write)
@@ -1,10 +1,12 @@
-import json
 from pathlib import Path
 from typing import Optional, Tuple
 
-import ollama
-
+from ai_feedback.helpers import client_pool, template_registry
+from ai_feedback.helpers.arg_options import Models
 from ai_feedback.helpers.model_options_helpers import cast_to_type, ollama_option_schema
+from ai_feedback.helpers.rate_limit import rate_limited
+from ai_feedback.helpers.response_cache import cached_response
+from ai_feedback.helpers.streaming import current_sink, stream_text
 
 from .Model import Model
 
@@ -19,7 +21,9 @@ class CodeLlamaModel(Model):
             "model": "codellama:latest",
         }
 
-    def generate_response(
+    @cached_response
+    @rate_limited(Models.CODELLAMA.value)
+    async def agenerate_response(
         self,
         prompt: str,
         submission_file: Path,
@@ -56,22 +60,30 @@ class CodeLlamaModel(Model):
             schema_path = Path(json_schema)
             if not schema_path.exists():
                 raise FileNotFoundError(f"JSON schema file not found: {schema_path}")
-            with open(schema_path, "r", encoding="utf-8") as f:
-                schema = json.load(f)
+            schema = template_registry.load_json(schema_path)
         else:
             schema = None
 
         model_options = cast_to_type(ollama_option_schema, model_options)
 
-        response = ollama.chat(
-            model=self.model["model"],
-            messages=[
+        request_kwargs = {
+            "model": self.model["model"],
+            "messages": [
                 {"role": "system", "content": system_instructions},
                 {"role": "user", "content": prompt},
             ],
-            format=schema['schema'] if schema else None,
-            options=model_options if model_options else None,
-        )
+            "format": schema['schema'] if schema else None,
+            "options": model_options if model_options else None,
+        }
+
+        client = client_pool.async_ollama_client()
+        sink = current_sink()
+        if sink is not None:
+            sink.begin(prompt)
+            parts = await client.chat(**request_kwargs, stream=True)
+            return prompt, await stream_text(part["message"]["content"] async for part in parts)
+
+        response = await client.chat(**request_kwargs)
 
         if not response or "message" not in response or "content" not in response["message"]:
             print("Error: Invalid or empty response from Ollama.")
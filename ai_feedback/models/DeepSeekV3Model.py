@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 import subprocess
@@ -5,12 +6,17 @@ import sys
 from pathlib import Path
 from typing import Optional, Tuple
 
-import requests
-from dotenv import load_dotenv
+import httpx
 
+from ..helpers import client_pool, template_registry
+from ..helpers.arg_options import Models
+from ..helpers.env import load_env
+from ..helpers.rate_limit import rate_limited
+from ..helpers.response_cache import cached_response
+from ..helpers.streaming import current_sink, stream_text
 from .Model import Model
 
-load_dotenv()
+load_env()
 LLAMA_MODEL_PATH = os.getenv('LLAMA_MODEL_PATH', '')
 LLAMA_CLI_PATH = os.getenv('LLAMA_CLI_PATH', '')
 LLAMA_SERVER_URL = os.getenv('LLAMA_SERVER_URL', '').strip()
@@ -22,7 +28,9 @@ class DeepSeekV3Model(Model):
     def __init__(self):
         super().__init__()
 
-    def generate_response(
+    @cached_response
+    @rate_limited(Models.DEEPSEEKV3.value)
+    async def agenerate_response(
         self,
         prompt: str,
         submission_file: Path,
@@ -58,18 +66,17 @@ class DeepSeekV3Model(Model):
             schema_path = Path(json_schema)
             if not schema_path.exists():
                 raise FileNotFoundError(f"JSON schema file not found: {schema_path}")
-            with open(schema_path, "r", encoding="utf-8") as f:
-                schema = json.load(f)
+            schema = template_registry.load_json(schema_path)
         else:
             schema = None
 
         prompt = f"{system_instructions}\n{prompt}"
         if llama_mode == 'server':
             self._ensure_env_vars('LLAMA_SERVER_URL')
-            response = self._get_response_server(prompt, model_options, schema)
+            response = await self._get_response_server(prompt, model_options, schema)
         else:
             self._ensure_env_vars('LLAMA_MODEL_PATH', 'LLAMA_CLI_PATH')
-            response = self._get_response_cli(prompt, model_options, schema)
+            response = await self._get_response_cli(prompt, model_options, schema)
 
         response = response.strip()
 
@@ -95,7 +102,7 @@ class DeepSeekV3Model(Model):
         if missing:
             raise RuntimeError(f"Error: Environment variable(s) {', '.join(missing)} not set")
 
-    def _get_response_server(
+    async def _get_response_server(
         self, prompt: str, model_options: Optional[dict] = None, schema: Optional[dict] = None
     ) -> str:
         """
@@ -111,16 +118,24 @@ class DeepSeekV3Model(Model):
         """
         url = f"{LLAMA_SERVER_URL}/v1/completions"
 
-        payload = {"prompt": prompt, **model_options}
+        payload = {"prompt": prompt, **(model_options or {})}
 
         if schema:
             raw_schema = schema.get("schema", schema)
             payload["json_schema"] = raw_schema
 
+        sink = current_sink()
+        if sink is not None:
+            sink.begin(prompt)
+            try:
+                return await self._stream_response_server(url, payload)
+            except httpx.HTTPError as e:
+                raise RuntimeError(f"ERROR: Request to llama-server failed: {str(e)}")
+
         try:
-            response = requests.post(url, json=payload, timeout=3000)
+            response = await client_pool.async_http_client().post(url, json=payload, timeout=3000)
             response.raise_for_status()
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             raise RuntimeError(f"ERROR: Request to llama-server failed: {str(e)}")
 
         data = response.json()
@@ -133,7 +148,38 @@ class DeepSeekV3Model(Model):
 
         return model_output
 
-    def _get_response_cli(
+    async def _stream_response_server(self, url: str, payload: dict) -> str:
+        """
+        Generate a model response with llama-server, writing tokens to the current stream sink as they arrive.
+
+        Args:
+            url (str): The completions endpoint of llama-server.
+            payload (dict): The completion request.
+
+        Returns:
+            str: The complete model response.
+        """
+        async with client_pool.async_http_client().stream(
+            "POST", url, json={**payload, "stream": True}, timeout=3000
+        ) as response:
+            response.raise_for_status()
+
+            async def pieces():
+                # Server-sent events: one "data: {json}" line per chunk, ending with "data: [DONE]"
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:") :].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        yield json.loads(data)["choices"][0]["text"]
+                    except (ValueError, KeyError, IndexError):
+                        print("ERROR: Unexpected JSON format from llama-server:", data, file=sys.stderr, flush=True)
+
+            return await stream_text(pieces())
+
+    async def _get_response_cli(
         self, prompt: str, model_options: Optional[dict] = None, schema: Optional[dict] = None
     ) -> str:
         """
@@ -163,25 +209,29 @@ class DeepSeekV3Model(Model):
             raw_schema = schema["schema"] if "schema" in schema else schema
             cmd += ["--json-schema", json.dumps(raw_schema)]
 
-        for key, value in model_options.items():
-            cmd += ["--" + key, value]
+        for key, value in (model_options or {}).items():
+            cmd += ["--" + key, str(value)]
 
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
         try:
-            completed = subprocess.run(
-                cmd, input=prompt.encode(), check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=300
-            )
-        except subprocess.TimeoutExpired as e:
-            # If the process hangs for more than 5 minutes, print whatever has been captured so far
+            stdout, stderr = await asyncio.wait_for(process.communicate(prompt.encode()), timeout=300)
+        except asyncio.TimeoutError:
+            # If the process hangs for more than 5 minutes, kill it and report the timeout
+            process.kill()
+            await process.wait()
             print("ERROR: llama-cli timed out after 5 minutes.", file=sys.stdout, flush=True)
-            print("Partial stdout:", e.stdout, file=sys.stdout, flush=True)
-            print("Partial stderr:", e.stderr, file=sys.stdout, flush=True)
-            raise
-        except subprocess.CalledProcessError as e:
-            # If llama-cli returns a non-zero exit code, print its stdout/stderr and re-raise
+            raise subprocess.TimeoutExpired(cmd, 300)
+
+        if process.returncode != 0:
+            # If llama-cli returns a non-zero exit code, print its stdout/stderr and raise
             print("ERROR: llama-cli returned non-zero exit code.", file=sys.stdout, flush=True)
-            print("llama-cli stdout:", e.stdout, file=sys.stdout, flush=True)
-            print("llama-cli stderr:", e.stderr, file=sys.stdout, flush=True)
-            raise RuntimeError(f"llama.cpp failed (code {e.returncode}): {e.stderr.strip()}")
+            print("llama-cli stdout:", stdout, file=sys.stdout, flush=True)
+            print("llama-cli stderr:", stderr, file=sys.stdout, flush=True)
+            raise RuntimeError(
+                f"llama.cpp failed (code {process.returncode}): {stderr.decode(errors='replace').strip()}"
+            )
 
         # Decode with 'replace' so invalid UTF-8 bytes become U+FFFD
-        return completed.stdout.decode('utf-8', errors='replace')
+        return stdout.decode('utf-8', errors='replace')
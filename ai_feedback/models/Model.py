@@ -1,11 +1,16 @@
+import asyncio
 from typing import Any, Tuple
 
+from ..helpers.async_utils import run_sync
+
 """
 Parent Class for LLMs.
 
 This class serves as an abstract base for defining LLM model interfaces.
-Subclasses must implement the `generate_response` method to provide
-their own model-specific logic.
+Subclasses implement the `agenerate_response` coroutine to provide their own
+model-specific logic; `generate_response` is a synchronous wrapper around it.
+Subclasses that can only make blocking calls may implement `generate_response`
+instead, in which case `agenerate_response` runs it in a worker thread.
 """
 
 
@@ -16,15 +21,36 @@ class Model:
         """
         pass
 
-    def generate_response(self, prompt: str, **kwargs: Any) -> Tuple[str, str]:
+    def generate_response(self, *args: Any, **kwargs: Any) -> Tuple[str, str]:
         """
         Generate a response based on the provided prompt.
 
+        Runs `agenerate_response` to completion and returns its result.
+
+        Args:
+            *args (Any): Positional arguments, starting with the prompt.
+            **kwargs (Any): Additional keyword arguments.
+
+        Returns:
+            Tuple[str, str]:
+                A tuple containing:
+                - The full prompt that was used.
+                - The generated response.
+        """
+        if type(self).agenerate_response is Model.agenerate_response:
+            raise NotImplementedError("Subclasses must implement `agenerate_response` or `generate_response`.")
+        return run_sync(self.agenerate_response(*args, **kwargs))
+
+    async def agenerate_response(self, *args: Any, **kwargs: Any) -> Tuple[str, str]:
+        """
+        Generate a response based on the provided prompt without blocking the event loop.
+
         This is an abstract method that must be overridden by subclasses to implement
-        specific model inference logic.
+        specific model inference logic. Subclasses that only implement the synchronous
+        `generate_response` have it run in a worker thread.
 
         Args:
-            prompt (str): The input prompt used to generate the response.
+            *args (Any): Positional arguments, starting with the prompt.
             **kwargs (Any): Additional keyword arguments.
 
         Returns:
@@ -34,6 +60,8 @@ class Model:
                 - The generated response.
 
         Raises:
-            NotImplementedError: If the method is not implemented by the subclass.
+            NotImplementedError: If neither method is implemented by the subclass.
         """
-        raise NotImplementedError("Subclasses must implement the `generate_response` method.")
+        if type(self).generate_response is Model.generate_response:
+            raise NotImplementedError("Subclasses must implement `agenerate_response` or `generate_response`.")
+        return await asyncio.to_thread(self.generate_response, *args, **kwargs)
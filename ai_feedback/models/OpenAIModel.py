@@ -1,20 +1,28 @@
-import json
+import hashlib
 import os
 import re
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import AsyncIterator, Optional, Tuple
 
 import openai
-from dotenv import load_dotenv
 
+from ai_feedback.helpers import client_pool, template_registry
+from ai_feedback.helpers.arg_options import Models
+from ai_feedback.helpers.env import load_env
 from ai_feedback.helpers.model_options_helpers import (
     cast_to_type,
     openai_chat_option_schema,
 )
+from ai_feedback.helpers.provider_batch import batch_response
+from ai_feedback.helpers.rate_limit import rate_limited
+from ai_feedback.helpers.response_cache import cached_response
+from ai_feedback.helpers.run_stats import record_token_usage
+from ai_feedback.helpers.streaming import current_sink, stream_text
+from ai_feedback.helpers.template_utils import split_prompt
 
 from .Model import Model
 
-load_dotenv()
+load_env()
 
 
 class OpenAIModel(Model):
@@ -22,12 +30,18 @@ class OpenAIModel(Model):
         """
         Initialize an OpenAIModel instance.
 
-        Loads the OpenAI API key from environment variables and prepares the client.
+        Requests go through the shared client for the OpenAI API key from the environment.
         """
         super().__init__()
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-    def generate_response(
+    @property
+    def client(self) -> openai.AsyncOpenAI:
+        """The shared OpenAI client of the running event loop, authenticated with the API key."""
+        return client_pool.async_openai_client(os.getenv("OPENAI_API_KEY"))
+
+    @cached_response
+    @rate_limited(Models.OPENAI.value)
+    async def agenerate_response(
         self,
         prompt: str,
         submission_file: Path,
@@ -62,15 +76,17 @@ class OpenAIModel(Model):
             schema_path = Path(json_schema)
             if not schema_path.exists():
                 raise FileNotFoundError(f"JSON schema file not found: {schema_path}")
-            with open(schema_path, "r", encoding="utf-8") as f:
-                schema = json.load(f)
+            schema = template_registry.load_json(schema_path)
         else:
             schema = None
 
-        response = self._call_openai(prompt, system_instructions, model_options, schema)
+        sink = current_sink()
+        if sink is not None:
+            sink.begin(prompt)
+        response = await self._call_openai(prompt, system_instructions, model_options, schema)
         return prompt, response
 
-    def _call_openai(
+    async def _call_openai(
         self, prompt: str, system_instructions: str, model_options: Optional[dict] = None, schema: Optional[dict] = None
     ) -> str:
         """
@@ -90,14 +106,49 @@ class OpenAIModel(Model):
 
         model_options = cast_to_type(openai_chat_option_schema, model_options)
 
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
+        request_kwargs = {
+            "model": "gpt-4o-mini",
+            "messages": [
                 {"role": "system", "content": system_instructions},
                 {"role": "user", "content": prompt},
             ],
-            response_format=response_format,
+            "response_format": response_format,
             **model_options,
-        )
+        }
+        prefix, _ = split_prompt(prompt)
+        if prefix:
+            # OpenAI caches prompt prefixes automatically; the key routes requests sharing this prefix together
+            shared = f"{system_instructions}\0{prefix}".encode("utf-8")
+            request_kwargs.setdefault("prompt_cache_key", hashlib.sha256(shared).hexdigest()[:32])
+
+        batched = batch_response("openai", request_kwargs)
+        if batched is not None:
+            return batched
+
+        if current_sink() is not None:
+            chunks = await self.client.chat.completions.create(
+                **request_kwargs, stream=True, stream_options={"include_usage": True}
+            )
+            return await stream_text(self._stream_pieces(chunks))
+
+        response = await self.client.chat.completions.create(**request_kwargs)
+        self._record_usage(response.usage)
 
         return response.choices[0].message.content
+
+    async def _stream_pieces(self, chunks: AsyncIterator) -> AsyncIterator[Optional[str]]:
+        """Yields the text of streamed chunks, recording the usage sent with the last one."""
+        async for chunk in chunks:
+            if chunk.usage:
+                self._record_usage(chunk.usage)
+            if chunk.choices:
+                yield chunk.choices[0].delta.content
+
+    @staticmethod
+    def _record_usage(usage) -> None:
+        """Records the token usage of a response, including the prompt tokens served from OpenAI's prefix cache."""
+        if usage is None:
+            return
+        details = usage.prompt_tokens_details
+        cached = (details.cached_tokens or 0) if details is not None else 0
+        record_token_usage(usage.prompt_tokens, usage.completion_tokens, cached)
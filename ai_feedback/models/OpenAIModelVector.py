@@ -1,16 +1,18 @@
-import json
 import os
 from pathlib import Path
 from typing import List, Optional
 
 import openai
-from dotenv import load_dotenv
 
+from ..helpers import client_pool, template_registry
+from ..helpers.arg_options import Models
+from ..helpers.env import load_env
 from ..helpers.model_options_helpers import cast_to_type, openai_chat_option_schema
+from ..helpers.rate_limit import rate_limited
 from .Model import Model
 
 # Load environment variables from .env file
-load_dotenv()
+load_env()
 
 
 class OpenAIModelVector(Model):
@@ -22,19 +24,31 @@ class OpenAIModelVector(Model):
 
     def __init__(self) -> None:
         """
-        Creates a new OpenAI vector store and an assistant model that can use file search as a tool.
+        Sets up the OpenAI client. The vector store and assistant are created for every request.
         """
         super().__init__()
 
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = client_pool.openai_client(os.getenv("OPENAI_API_KEY"))
+        self.vector_store = None
+        self.model = None
+
+    def _create_resources(self, system_instructions: str) -> None:
+        """
+        Creates a new OpenAI vector store and an assistant model that can use file search as a tool.
+
+        Args:
+            system_instructions (str): instructions for the assistant
+        """
         self.vector_store = self.client.vector_stores.create(name="Markus LLM Vector Store")
         self.model = self.client.beta.assistants.create(
             name="Markus LLM model",
             model="gpt-4o-mini",
+            instructions=system_instructions,
             tools=[{"type": "file_search"}],
             tool_resources={"file_search": {"vector_store_ids": [self.vector_store.id]}},
         )
 
+    @rate_limited(Models.OPENAIVECTOR.value)
     def generate_response(
         self,
         prompt: str,
@@ -66,34 +80,30 @@ class OpenAIModelVector(Model):
         Returns:
             tuple[str, str]: A tuple containing the full system request and the model's text response.
         """
-        self.model = self.client.beta.assistants.update(assistant_id=self.model.id, instructions=system_instructions)
-        if not self.model:
-            raise RuntimeError("Model was not created successfully.")
-
         if json_schema:
             schema_path = Path(json_schema)
             if not schema_path.exists():
                 raise FileNotFoundError(f"JSON schema file not found: {schema_path}")
-            with open(schema_path, "r", encoding="utf-8") as f:
-                schema = json.load(f)
+            schema = template_registry.load_json(schema_path)
         else:
             schema = None
 
-        request = "Uploaded Files: "
-        file_ids: List[str] = []
-        assignment_files = [f for f in (submission_file, solution_file, test_output) if f]
-
-        for file_path in assignment_files:
-            base, ext = file_path.stem, file_path.suffix
-            file_id = self._upload_file(file_path)
-            file_ids.append(file_id)
-            request += base
-
         if question:
             prompt += f" Identify and generate a response for the mistakes **only** in task ${question}. "
 
-        response = self._call_openai(prompt, model_options, schema)
-        self._cleanup_resources(file_ids)
+        # Every attempt (the rate limiter retries failed ones) creates and deletes its own resources
+        self._create_resources(system_instructions)
+        if not self.model:
+            raise RuntimeError("Model was not created successfully.")
+
+        file_ids: List[str] = []
+        assignment_files = [f for f in (submission_file, solution_file, test_output) if f]
+        try:
+            for file_path in assignment_files:
+                file_ids.append(self._upload_file(file_path))
+            response = self._call_openai(prompt, model_options, schema)
+        finally:
+            self._cleanup_resources(file_ids)
 
         request = f"\n{system_instructions}\n{prompt}"
         return request, response
@@ -156,13 +166,21 @@ class OpenAIModelVector(Model):
 
     def _cleanup_resources(self, file_ids: List[str]) -> None:
         """
-        Clean up uploaded files and delete all created assistant models.
+        Clean up uploaded files, and delete the assistant model and vector store of this request.
+
+        Only resources created by this instance are deleted, since other submissions of a batch
+        may be using their own at the same time.
 
         Args:
             file_ids (List[str]): List of uploaded file IDs to delete.
         """
         self._cleanup_files(file_ids)
-        self._delete_all_models()
+        if self.model is not None:
+            self.client.beta.assistants.delete(self.model.id)
+            self.model = None
+        if self.vector_store is not None:
+            self.client.vector_stores.delete(self.vector_store.id)
+            self.vector_store = None
 
     def _cleanup_files(self, file_ids: List[str]) -> None:
         """
@@ -175,14 +193,6 @@ class OpenAIModelVector(Model):
             self.client.files.delete(file_id)
             self.client.vector_stores.files.delete(vector_store_id=self.vector_store.id, file_id=file_id)
 
-    def _delete_all_models(self) -> None:
-        """
-        Delete all assistant models created under this OpenAI account.
-        """
-        models = self.client.beta.assistants.list().data
-        for model in models:
-            self.client.beta.assistants.delete(model.id)
-
     def _delete_all_files(self) -> None:
         """
         Delete all files from OpenAI storage and the vector store.
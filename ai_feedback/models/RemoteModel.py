@@ -5,11 +5,15 @@ import sys
 from pathlib import Path
 from typing import Optional, Tuple
 
-import requests
-from dotenv import load_dotenv
-
+from ..helpers import client_pool, template_registry
+from ..helpers.arg_options import Models
+from ..helpers.env import load_env
+from ..helpers.rate_limit import RETRYABLE_STATUS_CODES, rate_limited
+from ..helpers.response_cache import cached_response
 from .Model import Model
 
+DEFAULT_REMOTE_URL = "http://polymouth.teach.cs.toronto.edu:5000/chat"
+
 
 class RemoteModel(Model):
     """A class representing a remote model for generating responses.
@@ -17,19 +21,24 @@ class RemoteModel(Model):
     Currently is tied to ai_server (https://github.com/MarkUsProject/ai-server).
     """
 
-    remote_url: str
+    remote_url: Optional[str]
     model_name: str
 
     def __init__(
         self,
-        remote_url: str = "http://polymouth.teach.cs.toronto.edu:5000/chat",
+        remote_url: Optional[str] = None,
         model_name: str = "deepseek-coder-v2:latest",
     ) -> None:
-        """Initializes the remote model with a remote URL and model name."""
+        """Initializes the remote model with a remote URL and model name.
+
+        Without a remote URL, the REMOTE_URL environment variable is used, or the ai-server on polymouth.
+        """
         self.remote_url = remote_url
         self.model_name = model_name
 
-    def generate_response(
+    @cached_response
+    @rate_limited(Models.REMOTE.value)
+    async def agenerate_response(
         self,
         prompt: str,
         submission_file: Path,
@@ -63,32 +72,41 @@ class RemoteModel(Model):
             Optional[Tuple[str, str]]: A tuple containing the prompt and the model's response,
                                        or None if the response was invalid.
         """
-        load_dotenv()
+        load_env()
 
-        headers = {"X-API-KEY": os.getenv("REMOTE_API_KEY")}
+        api_key = os.getenv("REMOTE_API_KEY")
+        # Without a key the header is left out, as requests did with None headers
+        headers = {"X-API-KEY": api_key} if api_key is not None else {}
         data = {
             "content": prompt,
             "model": self.model_name,
             "system_instructions": system_instructions,
-            "model_options": model_options,
         }
+        if model_options:
+            # Sent as earlier versions sent the dict with requests: one form field per option name
+            data["model_options"] = list(model_options)
         if json_schema:
             schema_path = Path(json_schema)
             if not schema_path.exists():
                 raise FileNotFoundError(f"JSON schema file not found: {schema_path}")
-            with open(schema_path, "r", encoding="utf-8") as f:
-                schema = json.load(f)
+            schema = template_registry.load_json(schema_path)
 
             data["json_schema"] = json.dumps(schema)
 
         if llama_mode:
             data["llama_mode"] = llama_mode
 
+        data = {key: value for key, value in data.items() if value is not None}
+
         files = {}
         if submission_image:
             filename = os.path.basename(submission_image)
-            files[filename] = (filename, open(submission_image, 'rb'))
+            files[filename] = (filename, Path(submission_image).read_bytes())
 
-        response = requests.post(self.remote_url, data=data, headers=headers, files=files)
+        url = self.remote_url or os.getenv("REMOTE_URL") or DEFAULT_REMOTE_URL
+        response = await client_pool.async_http_client().post(url, data=data, headers=headers, files=files or None)
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            # Let the rate limiter back off and retry; other errors are returned as the server reported them
+            response.raise_for_status()
 
         return prompt, response.json()
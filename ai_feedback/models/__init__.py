@@ -1,7 +1,31 @@
-from .ClaudeModel import ClaudeModel
-from .CodeLlamaModel import CodeLlamaModel
-from .DeepSeekModel import DeepSeekModel
-from .DeepSeekV3Model import DeepSeekV3Model
-from .OpenAIModel import OpenAIModel
-from .OpenAIModelVector import OpenAIModelVector
-from .RemoteModel import RemoteModel
+import importlib
+
+# Model classes are imported on first access, so that only the SDK of the selected provider is loaded.
+# Each class lives in the module of the same name.
+__all__ = [
+    "ClaudeModel",
+    "CodeLlamaModel",
+    "DeepSeekModel",
+    "DeepSeekV3Model",
+    "OpenAIModel",
+    "OpenAIModelVector",
+    "RemoteModel",
+]
+
+
+def load_model_class(name: str) -> type:
+    """Imports the model class called name from its module and returns it."""
+    model_class = getattr(importlib.import_module(f".{name}", __name__), name)
+    # Importing the submodule binds it to this package under the same name; replace it by the class
+    globals()[name] = model_class
+    return model_class
+
+
+def __getattr__(name: str):
+    if name in __all__:
+        return load_model_class(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
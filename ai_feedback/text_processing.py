@@ -3,7 +3,9 @@ from pathlib import Path
 from typing import Optional, Tuple
 
 from .helpers.arg_options import model_mapping
-from .helpers.template_utils import render_prompt_template
+from .helpers.metrics import measure, stage
+from .helpers.template_utils import render_prompt_template, resolve_diff_base
+from .helpers.token_budget import fit_prompt_for_model
 
 
 def process_text(
@@ -39,14 +41,26 @@ def process_text(
             raise FileNotFoundError(f"Solution file '{solution_file}' not found.")
 
     test_output = Path(args.test_output) if args.test_output else None
-    rendered_prompt = render_prompt_template(
-        prompt,
-        solution=solution_file,
-        submission=submission_file,
-        test_output=test_output,
-        question=args.question,
-        marking_instructions=marking_instructions,
-    )
+    diff_base = resolve_diff_base(args.submission_view, args.starter, solution_file)
+    with stage("render_prompt"):
+        rendered_prompt = render_prompt_template(
+            prompt,
+            solution=solution_file,
+            submission=submission_file,
+            test_output=test_output,
+            question=args.question,
+            marking_instructions=marking_instructions,
+            layout=args.prompt_layout,
+            max_file_bytes=args.max_file_bytes,
+            max_file_lines=args.max_file_lines,
+            line_ranges=getattr(args, "line_ranges", None),
+            diff_base=diff_base,
+            diff_context=args.diff_context,
+        )
+        rendered_prompt = fit_prompt_for_model(
+            rendered_prompt, system_instructions, args.model, args.model_options, args.context_policy
+        )
+    measure("prompt_bytes", len(rendered_prompt.encode("utf-8")))
 
     if args.model in model_mapping:
         model_class = model_mapping[args.model]
@@ -58,28 +72,29 @@ def process_text(
         print("Invalid model selected for text scope.")
         sys.exit(1)
 
-    if args.question:
-        request, response = model.generate_response(
-            prompt=rendered_prompt,
-            solution_file=solution_file,
-            submission_file=submission_file,
-            scope=args.scope,
-            question=args.question,
-            system_instructions=system_instructions,
-            llama_mode=args.llama_mode,
-            json_schema=args.json_schema,
-            model_options=args.model_options,
-        )
-    else:
-        request, response = model.generate_response(
-            prompt=rendered_prompt,
-            solution_file=solution_file,
-            submission_file=submission_file,
-            scope=args.scope,
-            system_instructions=system_instructions,
-            llama_mode=args.llama_mode,
-            json_schema=args.json_schema,
-            model_options=args.model_options,
-        )
+    with stage("model_call"):
+        if args.question:
+            request, response = model.generate_response(
+                prompt=rendered_prompt,
+                solution_file=solution_file,
+                submission_file=submission_file,
+                scope=args.scope,
+                question=args.question,
+                system_instructions=system_instructions,
+                llama_mode=args.llama_mode,
+                json_schema=args.json_schema,
+                model_options=args.model_options,
+            )
+        else:
+            request, response = model.generate_response(
+                prompt=rendered_prompt,
+                solution_file=solution_file,
+                submission_file=submission_file,
+                scope=args.scope,
+                system_instructions=system_instructions,
+                llama_mode=args.llama_mode,
+                json_schema=args.json_schema,
+                model_options=args.model_options,
+            )
 
     return request, response
@@ -0,0 +1,131 @@
+"""
+Per-call client overhead benchmark.
+
+Starts a local keep-alive HTTP server that answers like the Ollama, OpenAI and ai-server chat
+endpoints (instantly, so only client-side overhead is measured), then times sequential calls
+made the old way (a new SDK client or bare requests.post per call) and through the shared
+clients of ai_feedback.helpers.client_pool. The number of TCP connections the server accepted is
+reported for each, which is where pooling saves a handshake (and, against real providers, TLS).
+
+Usage:
+    python benchmarks/client_overhead.py [--calls N]
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ai_feedback.helpers import client_pool  # noqa: E402
+from ai_feedback.helpers.async_utils import run_sync  # noqa: E402
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this, delayed ACKs stall keep-alive responses
+    disable_nagle_algorithm = True
+    connections = 0
+
+    def setup(self) -> None:
+        super().setup()
+        type(self).connections += 1
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.endswith("/api/chat"):
+            payload = {
+                "model": "stub",
+                "created_at": "2024-01-01T00:00:00Z",
+                "message": {"role": "assistant", "content": "ok"},
+                "done": True,
+            }
+        elif self.path.endswith("/chat/completions"):
+            payload = {
+                "id": "stub",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "stub",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+            }
+        else:
+            payload = "ok"
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def _measure(name: str, calls: int, call) -> None:
+    """Times {calls} sequential calls and prints the median latency and connections opened."""
+    call()  # Warm up imports
+    _StubHandler.connections = 0
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    print(f"{name:<32} {statistics.median(timings) * 1000:8.2f} ms/call {_StubHandler.connections:6d} connections")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200, help="Sequential calls per scenario.")
+    args = parser.parse_args()
+
+    import ollama
+    import openai
+    import requests
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    messages = [{"role": "user", "content": "hello"}]
+
+    async def ollama_new_client():
+        await ollama.AsyncClient(host=base_url).chat(model="stub", messages=messages)
+
+    async def ollama_pooled():
+        await client_pool.async_ollama_client(base_url).chat(model="stub", messages=messages)
+
+    async def openai_new_client():
+        client = openai.AsyncOpenAI(api_key="stub", base_url=f"{base_url}/v1")
+        await client.chat.completions.create(model="stub", messages=messages)
+
+    async def openai_pooled():
+        client = client_pool.get_async_client(
+            ("benchmark-openai", base_url),
+            lambda: openai.AsyncOpenAI(
+                api_key="stub",
+                base_url=f"{base_url}/v1",
+                http_client=openai.DefaultAsyncHttpxClient(limits=client_pool.http_limits()),
+            ),
+        )
+        await client.chat.completions.create(model="stub", messages=messages)
+
+    async def remote_pooled():
+        await client_pool.async_http_client().post(f"{base_url}/chat", data={"content": "hello"})
+
+    print(f"{'scenario':<32} {'median':>14} {'opened':>18}")
+    _measure("ollama: new client per call", args.calls, lambda: run_sync(ollama_new_client()))
+    _measure("ollama: pooled client", args.calls, lambda: run_sync(ollama_pooled()))
+    _measure("openai: new client per call", args.calls, lambda: run_sync(openai_new_client()))
+    _measure("openai: pooled client", args.calls, lambda: run_sync(openai_pooled()))
+    _measure("remote: requests.post per call", args.calls, lambda: requests.post(f"{base_url}/chat", data={}))
+    _measure("remote: pooled client", args.calls, lambda: run_sync(remote_pooled()))
+    server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+Time and memory benchmark of rendering large files with (Line i) numbers.
+
+Generates code-like files of the given sizes (1 MB to 100 MB by default) and renders each one
+with the previous implementation (readlines() and string concatenation, kept here as the
+reference), with the streaming renderer of ai_feedback.helpers.template_utils, and with the
+streaming renderer and a --max_file_bytes limit. The output of the first two is checked to be
+identical. Times are the median of several runs, and the peak traced memory is taken from one
+more run.
+
+Usage:
+    python benchmarks/line_rendering.py [--sizes 1,10,100] [--repeat N] [--max_file_bytes BYTES]
+"""
+
+import argparse
+import gc
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ai_feedback.helpers import template_utils  # noqa: E402
+
+MB = 1024 * 1024
+
+
+def reference_render(file_path: Path, tag_name: str) -> str:
+    """The implementation the streaming renderer replaced."""
+    with open(file_path, "r", encoding="utf-8") as file:
+        lines = file.readlines()
+    content = f"<{tag_name} filename=\"{file_path.name}\">\n"
+    for i, line in enumerate(lines, start=1):
+        stripped_line = line.rstrip("\n")
+        if stripped_line.strip():
+            content += f"(Line {i}) {stripped_line}\n"
+        else:
+            content += f"(Line {i}) {line}"
+    content += f"</{tag_name}>\n\n"
+    return content
+
+
+def write_file(path: Path, megabytes: int) -> int:
+    """Writes a file of about {megabytes} MB of code-like lines and returns its number of lines."""
+    block = "".join(
+        f"    total_{i % 97} = compute(values[{i}], weight={i % 13}) + offset  # step {i}\n" if i % 9 else "\n"
+        for i in range(1000)
+    )
+    with open(path, "w", encoding="utf-8") as file:
+        for _ in range(max(1, megabytes * MB // len(block))):
+            file.write(block)
+    return path.read_bytes().count(b"\n")
+
+
+def measure(function: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Returns the median seconds of {repeat} calls and the peak traced memory of one more call."""
+    timings: List[float] = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": statistics.median(timings), "peak_bytes": peak}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--sizes", type=str, default="1,10,100", help="Comma-separated file sizes in MB.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs of every renderer.")
+    parser.add_argument(
+        "--max_file_bytes", type=int, default=256 * 1024, help="Limit of the bounded renderer (default 256 KiB)."
+    )
+    args = parser.parse_args()
+
+    print(f"{'file':>8}  {'lines':>9}  {'renderer':<22}  {'median':>9}  {'peak memory':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for megabytes in (int(size) for size in args.sizes.split(",")):
+            path = Path(directory, f"submission_{megabytes}mb.py")
+            lines = write_file(path, megabytes)
+            if reference_render(path, "submission") != template_utils._format_file_with_xml_tag(path, "submission"):
+                print(f"Error: the streaming renderer's output differs for the {megabytes} MB file.")
+                return 1
+
+            renderers = {
+                "reference": lambda: reference_render(path, "submission"),
+                "streaming": lambda: template_utils._format_file_with_xml_tag(path, "submission"),
+                "streaming, bounded": lambda: template_utils._format_file_with_xml_tag(
+                    path, "submission", max_bytes=args.max_file_bytes
+                ),
+            }
+            for name, render in renderers.items():
+                result = measure(render, args.repeat)
+                print(
+                    f"{megabytes:>5} MB  {lines:>9}  {name:<22}  {result['seconds']:>8.3f}s  "
+                    f"{result['peak_bytes'] / MB:>8.1f} MiB"
+                )
+            path.unlink()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""
+Load test of the grading pipeline against the local mock provider server.
+
+Starts ai_feedback.mock_server in this process (or uses a running one with --server), points
+every provider's base URL at it, generates --jobs distinct submissions and grades them through
+the real batch pipeline with --concurrency workers: prompt rendering, the rate limiter, retries,
+the shared clients and, with --stream, streaming. The throughput, the p50/p95/p99 latency of the
+jobs and the requests the server received (including the 429s and errors it injected) are
+reported.
+
+Options that are not the driver's own are passed on to `python -m ai_feedback batch`, so any
+model, scope, prompt or --rate_limit can be tested. The response cache is bypassed.
+
+Usage:
+    python benchmarks/load_test.py [--jobs N] [--concurrency N] [--latency SPEC]
+        [--tokens_per_second N] [--error_rate R] [--rate_limit_rate R] [--server URL]
+        [--output FILE] [batch options, e.g. --model claude-3.7-sonnet --stream]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from ai_feedback import mock_server  # noqa: E402
+
+# Batch options used unless they are given on the command line
+DEFAULT_BATCH_OPTIONS = ["--scope", "code", "--model", "openai", "--prompt", "code_lines"]
+
+SOLUTION = '''def fizzbuzz(n):
+    if n % 15 == 0:
+        return "FizzBuzz"
+    if n % 3 == 0:
+        return "Fizz"
+    if n % 5 == 0:
+        return "Buzz"
+    return str(n)
+'''
+
+
+def point_models_at(url: str) -> None:
+    """Points the base URL settings of every provider path at url."""
+    os.environ.update(
+        {
+            "OPENAI_BASE_URL": f"{url}/v1",
+            "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "mock"),
+            "ANTHROPIC_BASE_URL": url,
+            "CLAUDE_API_KEY": os.getenv("CLAUDE_API_KEY", "mock"),
+            "OLLAMA_HOST": url,
+            "LLAMA_SERVER_URL": url,
+            "REMOTE_URL": f"{url}/chat",
+            "REMOTE_API_KEY": os.getenv("REMOTE_API_KEY", "mock"),
+        }
+    )
+
+
+def write_submissions(directory: Path, jobs: int) -> None:
+    """Writes a solution and {jobs} distinct submissions, so that no two prompts are the same."""
+    (directory / "solution.py").write_text(SOLUTION, encoding="utf-8")
+    for job in range(jobs):
+        submission = directory / "submissions" / f"student_{job:05d}" / "submission.py"
+        submission.parent.mkdir(parents=True)
+        submission.write_text(SOLUTION.replace('"Buzz"', f'"Buzz{job}"'), encoding="utf-8")
+
+
+def percentile(values: List[float], quantile: float) -> float:
+    """Returns the quantile of sorted values, interpolating between the closest ranks."""
+    position = (len(values) - 1) * quantile
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def server_stats(url: str) -> Dict[str, int]:
+    with urllib.request.urlopen(f"{url}/mock/stats", timeout=10) as response:
+        return json.load(response)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--jobs", type=int, default=100, help="Submissions to grade.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Submissions graded at the same time.")
+    parser.add_argument("--server", type=str, default=None, help="URL of a running mock server to use instead.")
+    parser.add_argument("--latency", type=str, default="lognormal:0.5,2", help="See python -m ai_feedback.mock_server.")
+    parser.add_argument("--tokens_per_second", type=float, default=100.0)
+    parser.add_argument("--response_tokens", type=int, default=64)
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--rate_limit_rate", type=float, default=0.0)
+    parser.add_argument("--retry_after", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", type=str, default=None, help="Also write the report to this JSON file.")
+    args, batch_options = parser.parse_known_args(argv)
+
+    server = None
+    url = args.server.rstrip("/") if args.server else None
+    if url is None:
+        behaviour = mock_server.ChatBehaviour(
+            args.latency,
+            args.tokens_per_second,
+            args.response_tokens,
+            args.error_rate,
+            args.rate_limit_rate,
+            args.retry_after,
+            args.seed,
+        )
+        try:
+            server = mock_server.start_server(behaviour=behaviour)
+        except ValueError as e:
+            parser.error(str(e))
+        url = f"http://{mock_server.DEFAULT_HOST}:{server.server_port}"
+    # Set before the models are imported, since some read their settings at import time
+    point_models_at(url)
+
+    from ai_feedback import batch
+    from ai_feedback.helpers import rate_limit
+
+    with tempfile.TemporaryDirectory() as directory:
+        work = Path(directory)
+        write_submissions(work, args.jobs)
+        # Start from empty rate limit buckets rather than the host's shared ones
+        rate_limit.configure(directory=str(work / "rate_limits"))
+        batch_args = batch.build_parser().parse_args(
+            ["--submissions", str(work / "submissions"), "--output_dir", str(work / "feedback")]
+            + ["--solution", str(work / "solution.py"), "--workers", str(args.concurrency)]
+            + DEFAULT_BATCH_OPTIONS
+            + ["--cache", "bypass"]
+            + batch_options
+        )
+        batch_args.model_options = batch.cli.parse_model_options(batch_args.model_options)
+        entries = batch.collect_submissions(batch_args.submissions, batch_args.pattern)
+        batch.assign_output_paths(entries, batch_args.output_dir)
+
+        stats_before = server_stats(url)
+        started_at = time.perf_counter()
+        results = batch.run_batch(batch_args, entries, batch_args.workers)
+        wall = time.perf_counter() - started_at
+        stats_after = server_stats(url)
+
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+
+    latencies = sorted(result.seconds for result in results)
+    errors = [result for result in results if result.status != "ok"]
+    requests = {name: count - stats_before.get(name, 0) for name, count in stats_after.items()}
+    report = {
+        "model": batch_args.model,
+        "scope": batch_args.scope,
+        "stream": batch_args.stream,
+        "jobs": len(results),
+        "concurrency": args.concurrency,
+        "failed": len(errors),
+        "seconds": round(wall, 3),
+        "jobs_per_second": round(len(results) / wall, 3),
+        "latency": {f"p{round(q * 100)}": round(percentile(latencies, q), 4) for q in (0.5, 0.95, 0.99)},
+        "max_latency": round(latencies[-1], 4),
+        "server_requests": requests,
+    }
+
+    print(f"{report['jobs']} jobs of --model {report['model']} with {args.concurrency} workers in {wall:.2f}s")
+    print(f"throughput: {report['jobs_per_second']:.2f} jobs/s")
+    print("latency:    " + "  ".join(f"{name} {value:.3f}s" for name, value in report["latency"].items()))
+    print(f"            max {report['max_latency']:.3f}s")
+    print("server:     " + ", ".join(f"{name} {count}" for name, count in sorted(requests.items())))
+    if errors:
+        print(f"failed:     {len(errors)}, e.g. {errors[0].error}")
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
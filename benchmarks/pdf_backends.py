@@ -0,0 +1,79 @@
+"""
+Benchmark of the PDF text extraction backends, in one process and with a process pool.
+
+Generates PDFs with four-level outlines of the given page counts (10, 100 and 500 by default)
+and extracts their page text with every backend of ai_feedback.helpers.pdf_text, first in this
+process and then with a pool of --workers processes (including the time to start them). Every
+result is checked against PyPDF2 in one process: the lines of the text must be the same under
+normalize_text(), so that --question finds the same sections. Times are the median of several
+runs.
+
+Usage:
+    python benchmarks/pdf_backends.py [--pages 10,100,500] [--repeat N] [--workers N]
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from preprocessing import _write_pdf  # noqa: E402
+
+from ai_feedback.helpers import pdf_text  # noqa: E402
+from ai_feedback.helpers.template_utils import normalize_text  # noqa: E402
+
+
+def normalized_lines(pages: List[str]) -> List[str]:
+    return [normalize_text(line) for line in "".join(page + "\n" for page in pages).strip().split("\n")]
+
+
+def median_seconds(function: Callable[[], List[str]], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--pages", type=str, default="10,100,500", help="Comma-separated page counts.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs of every backend.")
+    parser.add_argument("--workers", type=int, default=4, help="Processes of the pool.")
+    args = parser.parse_args()
+
+    # Use the pool for every page count rather than only long PDFs
+    pdf_text.PARALLEL_PAGES = dict.fromkeys(pdf_text.PARALLEL_PAGES, 0)
+    pdf_text.PAGES_PER_TASK = 10
+    print(f"{'pages':>6}  {'backend':<8}  {'one process':>12}  {f'{args.workers} processes':>12}  equivalent")
+    with tempfile.TemporaryDirectory() as directory:
+        for page_count in (int(pages) for pages in args.pages.split(",")):
+            path = str(Path(directory, f"handout_{page_count}.pdf"))
+            _write_pdf(Path(path), page_count)
+            expected = normalized_lines(pdf_text._pypdf2_pages(path, 0, page_count))
+
+            for backend, extract in pdf_text._EXTRACTORS.items():
+                pdf_text.configure(backend=backend, workers=args.workers)
+                serial = extract(path, 0, page_count)
+                parallel = pdf_text.extract_pages(path, page_count)[1]
+                equivalent = normalized_lines(serial) == expected and parallel == serial
+                serial_seconds = median_seconds(lambda: extract(path, 0, page_count), args.repeat)
+                parallel_seconds = median_seconds(lambda: pdf_text.extract_pages(path, page_count), args.repeat)
+                print(
+                    f"{page_count:>6}  {backend:<8}  {serial_seconds:>11.3f}s  {parallel_seconds:>11.3f}s  "
+                    f"{'yes' if equivalent else 'NO'}"
+                )
+                if not equivalent:
+                    return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+"""
+Time and memory benchmarks of the preprocessing steps that run before a prompt is sent.
+
+Generates synthetic inputs in three sizes. The largest are 100k-line submissions, 300-page PDFs
+with four-level tables of contents, and notebooks with hundreds of embedded PNGs. Each step runs
+on every size: the fastest and median of several timed runs are recorded, and then the peak
+traced memory of one more run. Tracing is kept out of the timed runs.
+
+Results are written as JSON. Store the results of a release and pass them as --baseline to a later
+run: it fails if a step became slower or needs more memory than the allowed factors.
+
+Usage:
+    python benchmarks/preprocessing.py [--sizes tiny,medium,large] [--only NAME,...] [--repeat N]
+        [--output FILE] [--baseline FILE] [--max_slowdown 1.5] [--max_memory_growth 1.25]
+"""
+
+import argparse
+import base64
+import json
+import platform
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from ai_feedback.helpers import (  # noqa: E402
+    file_converter,
+    image_extractor,
+    pdf_cache,
+    pdf_index,
+    template_utils,
+)
+
+# Input sizes: submission lines, PDF pages, notebook images, qmd chunks and annotations
+SIZES: Dict[str, Dict[str, int]] = {
+    "tiny": {"lines": 100, "pages": 3, "images": 2, "chunks": 3, "annotations": 10},
+    "medium": {"lines": 10_000, "pages": 30, "images": 30, "chunks": 30, "annotations": 300},
+    "large": {"lines": 100_000, "pages": 300, "images": 300, "chunks": 300, "annotations": 3000},
+}
+# Differences below these are noise, whatever the ratio
+MIN_SLOWDOWN_SECONDS = 0.005
+MIN_MEMORY_GROWTH_BYTES = 1024 * 1024
+
+
+def _png(seed: int, size: int = 96) -> bytes:
+    """Returns a noisy RGB PNG, which compresses about as badly as a real plot."""
+    rows = []
+    state = seed * 2654435761 % 2**32 or 1
+    for _ in range(size):
+        row = bytearray(b"\x00")
+        for _ in range(size * 3):
+            state = (state * 1103515245 + 12345) % 2**31
+            row.append(state >> 23)
+        rows.append(bytes(row))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(b"".join(rows)))
+        + chunk(b"IEND", b"")
+    )
+
+
+def _write_submission(path: Path, lines: int) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(lines // 4):
+            f.write(f"def function_{i}(values):\n    total = sum(v * {i} for v in values)\n\n    return total\n")
+
+
+def _write_markdown(path: Path, lines: int) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(max(1, lines // 20)):
+            f.write(f"## Question {i}\n\n")
+            f.write("".join(f"Answer line {j} of question {i}, with some *markdown* text.\n" for j in range(17)))
+            f.write("\n")
+
+
+def _write_pdf(path: Path, pages: int) -> None:
+    """Writes a PDF whose outline has chapters, sections, subsections and paragraphs."""
+    import pymupdf
+
+    doc = pymupdf.open()
+    toc = []
+    for page_number in range(1, pages + 1):
+        page = doc.new_page()
+        titles = []
+        if page_number % 30 == 1:
+            titles.append((1, f"Chapter {page_number // 30 + 1}"))
+        if page_number % 5 == 1:
+            titles.append((2, f"Section {page_number // 5 + 1}"))
+        titles.append((3, f"Subsection {page_number}"))
+        titles.append((4, f"Paragraph {page_number}"))
+        y = 60
+        for level, title in titles:
+            toc.append([level, title, page_number])
+            page.insert_text((50, y), title, fontsize=14)
+            y += 22
+            for line in range(6):
+                page.insert_text(
+                    (50, y), f"Body text line {line} of {title.lower()} on page {page_number}.", fontsize=10
+                )
+                y += 14
+    doc.set_toc(toc)
+    doc.save(str(path))
+    doc.close()
+
+
+def _write_notebook(path: Path, images: int) -> None:
+    cells = []
+    for i in range(images):
+        png = base64.b64encode(_png(i)).decode("ascii")
+        cells.append(
+            {"cell_type": "markdown", "id": f"m{i}", "metadata": {}, "source": [f"Plot the data for part {i}."]}
+        )
+        cells.append(
+            {
+                "cell_type": "code",
+                "id": f"c{i}",
+                "execution_count": i + 1,
+                "metadata": {},
+                "source": [f"# Question {i}\n", "import matplotlib.pyplot as plt\n", f"plt.plot(range({i}))"],
+                "outputs": [{"output_type": "display_data", "metadata": {}, "data": {"image/png": png}}],
+            }
+        )
+    notebook = {"cells": cells, "metadata": {}, "nbformat": 4, "nbformat_minor": 5}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(notebook, f)
+
+
+def _write_qmd(path: Path, chunks: int) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("---\ntitle: Assignment\n---\n\n")
+        for i in range(chunks):
+            if i % 10 == 0:
+                f.write(f"# Part {i // 10}\n\n")
+            f.write(f"## Question {i}\n\nSome prose about question {i}.\n\n")
+            f.write(f"```{{python}}\nvalues = list(range({i}))\nprint(sum(values))\n```\n\n")
+
+
+def _benchmarks(directory: Path, size: Dict[str, int]) -> Dict[str, Callable[[], Any]]:
+    """Generates the inputs of one size and returns a callable per benchmarked step."""
+    submission = directory / "submission.py"
+    solution = directory / "solution.py"
+    test_output = directory / "test_output.txt"
+    markdown = directory / "submission.md"
+    pdf = directory / "submission.pdf"
+    notebook = directory / "submission.ipynb"
+    qmd = directory / "submission.qmd"
+    _write_submission(submission, size["lines"])
+    _write_submission(solution, size["lines"] // 2)
+    test_output.write_text("".join(f"test_{i} ... ok\n" for i in range(size["lines"] // 10)), encoding="utf-8")
+    _write_markdown(markdown, size["lines"])
+    _write_pdf(pdf, size["pages"])
+    _write_notebook(notebook, size["images"])
+    _write_qmd(qmd, size["chunks"])
+
+    template = (ROOT / "ai_feedback" / "data" / "prompts" / "user" / "code_table.md").read_text(encoding="utf-8")
+    with open(submission, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    middle_question = f"Question {max(1, size['lines'] // 20) // 2}"
+    middle_heading = f"Subsection {size['pages'] // 2 + 1}"
+    image_directory = directory / "images"
+
+    benchmarks: Dict[str, Callable[[], Any]] = {
+        "render_prompt_template": lambda: template_utils.render_prompt_template(
+            template, submission=submission, solution=solution, test_output=test_output
+        ),
+        "_wrap_lines_with_xml": lambda: template_utils._wrap_lines_with_xml(lines, "submission", submission.name),
+        "gather_xml_file_contents": lambda: template_utils.gather_xml_file_contents(submission, solution, test_output),
+        "extract_question_from_txt": lambda: template_utils.extract_question_from_txt(markdown, middle_question),
+        "extract_question_from_pdf": lambda: template_utils.extract_question_from_pdf(pdf, middle_heading),
+        "flatten_toc": lambda: template_utils.flatten_toc(pdf),
+        # The two above reuse the index of the PDF after their first call; this is the parse itself
+        "PdfDocumentIndex.build": lambda: pdf_index.PdfDocumentIndex.build(pdf),
+        "convert_ipynb_to_txt": lambda: file_converter.convert_ipynb_to_txt(
+            str(notebook), str(directory / "submission.txt")
+        ),
+        "extract_images": lambda: image_extractor.extract_images(notebook, image_directory, "submission"),
+        "extract_qmd_python_chunks_with_context": lambda: image_extractor.extract_qmd_python_chunks_with_context(
+            str(qmd)
+        ),
+    }
+
+    try:
+        sys.path.insert(0, str(ROOT / "markus_test_scripts" / "python_tester"))
+        from llm_helpers import add_annotation_columns
+    except ImportError as e:
+        print(f"Skipping add_annotation_columns: {e}", file=sys.stderr)
+    else:
+        count = size["lines"] // 4
+        annotations = [
+            {
+                "filename": submission.name,
+                "content": "Sum of an empty list.",
+                "line_start": (i * 4) % count + 1,
+                "line_end": (i * 4) % count + 2,
+            }
+            for i in range(size["annotations"])
+        ]
+        module = SimpleNamespace(__file__=str(submission))
+        benchmarks["add_annotation_columns"] = lambda: add_annotation_columns(annotations, module)
+    return benchmarks
+
+
+def measure(function: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Returns the fastest and median time of repeat calls, and the peak traced memory of one more."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds_min": min(timings), "seconds_median": statistics.median(timings), "peak_bytes": peak}
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    max_slowdown: float,
+    max_memory_growth: float,
+) -> List[str]:
+    """Returns a description of every benchmark that regressed against the baseline."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        slower = result["seconds_min"] - before["seconds_min"]
+        if result["seconds_min"] > before["seconds_min"] * max_slowdown and slower > MIN_SLOWDOWN_SECONDS:
+            regressions.append(f"{name}: {before['seconds_min']:.4f}s -> {result['seconds_min']:.4f}s")
+        grown = result["peak_bytes"] - before["peak_bytes"]
+        if result["peak_bytes"] > before["peak_bytes"] * max_memory_growth and grown > MIN_MEMORY_GROWTH_BYTES:
+            regressions.append(
+                f"{name}: peak {before['peak_bytes'] / 2**20:.1f} MiB -> {result['peak_bytes'] / 2**20:.1f} MiB"
+            )
+    return regressions
+
+
+def _commit() -> str:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        )
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(SIZES), help="Comma-separated input sizes to run.")
+    parser.add_argument("--only", default="", help="Comma-separated benchmark names to run (default: all).")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark.")
+    parser.add_argument("--output", default="", help="JSON file for the results (default: benchmarks/results/).")
+    parser.add_argument("--baseline", default="", help="Results of an earlier run to compare with.")
+    parser.add_argument("--max_slowdown", type=float, default=1.5, help="Allowed ratio of the fastest times.")
+    parser.add_argument("--max_memory_growth", type=float, default=1.25, help="Allowed ratio of the peak memory.")
+    args = parser.parse_args()
+
+    # Generated PDFs would only fill the user's cache of parsed PDFs
+    pdf_cache.configure(enabled=False)
+    only = {name for name in args.only.split(",") if name}
+    results: Dict[str, Dict[str, float]] = {}
+    print(f"{'benchmark':<52} {'min':>10} {'median':>10} {'peak':>10}")
+    for size_name in args.sizes.split(","):
+        with tempfile.TemporaryDirectory() as directory:
+            for name, function in _benchmarks(Path(directory), SIZES[size_name]).items():
+                if only and name not in only:
+                    continue
+                key = f"{name}[{size_name}]"
+                result = measure(function, args.repeat)
+                results[key] = result
+                print(
+                    f"{key:<52} {result['seconds_min']:>9.4f}s {result['seconds_median']:>9.4f}s "
+                    f"{result['peak_bytes'] / 2**20:>6.1f} MiB",
+                    flush=True,
+                )
+
+    commit = _commit()
+    output = args.output or str(ROOT / "benchmarks" / "results" / f"preprocessing-{commit}.json")
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "machine": platform.node(),
+        "python": platform.python_version(),
+        "results": results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.max_slowdown, args.max_memory_growth)
+        if regressions:
+            print(f"Regressions against {args.baseline} (commit {baseline.get('commit')}):")
+            print("\n".join(f"  {regression}" for regression in regressions))
+            print("FAIL")
+            return 1
+        print(f"No regressions against {args.baseline}.")
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
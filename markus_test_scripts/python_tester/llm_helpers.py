@@ -152,6 +152,10 @@ def run_llm(
 
     Returns:
         The output from the LLM feedback generator as a string, or an error message.
+
+    If the AI_FEEDBACK_DAEMON_URL environment variable is set, the request is sent to a running
+    `python -m ai_feedback serve` daemon instead of starting a new process, falling back to a
+    subprocess if the daemon cannot be reached.
     """
     load_dotenv()
     llm_command = [
@@ -182,7 +186,7 @@ def run_llm(
     if submission_type:
         llm_command += ["--submission_type", submission_type]
 
-    llm_result = subprocess.run(llm_command, capture_output=True, text=True)
+    llm_result = _run_feedback_command(llm_command)
     try:
         llm_result.check_returncode()
     except subprocess.CalledProcessError:
@@ -192,6 +196,27 @@ def run_llm(
     return llm_result.stdout.strip()
 
 
+def _run_feedback_command(llm_command: List[str]) -> subprocess.CompletedProcess:
+    """
+    Runs an ai_feedback command through the feedback daemon if one is configured, otherwise as a subprocess.
+
+    Args:
+        llm_command: The full command, starting with the python executable, "-m" and "ai_feedback".
+
+    Returns:
+        The completed process, with text stdout and stderr.
+    """
+    daemon_url = os.getenv("AI_FEEDBACK_DAEMON_URL")
+    if daemon_url:
+        try:
+            from ai_feedback.daemon import run_via_daemon
+
+            return run_via_daemon(llm_command[3:], daemon_url, os.getenv("AI_FEEDBACK_DAEMON_TOKEN"))
+        except (ImportError, OSError) as e:
+            print(f"Feedback daemon unavailable ({e}), falling back to a subprocess.")
+    return subprocess.run(llm_command, capture_output=True, text=True)
+
+
 def safe_eval_dict(match: str):
     try:
         return json.loads(match)  # Try strict JSON first
@@ -0,0 +1,12 @@
+import pytest
+
+from ai_feedback.helpers import rate_limit, response_cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(monkeypatch, tmp_path_factory):
+    """Keeps tests from reading or writing the user's response cache and shared rate limit state."""
+    monkeypatch.setitem(response_cache._settings, "mode", "bypass")
+    monkeypatch.setattr(response_cache, "_store", None)
+    monkeypatch.setitem(rate_limit._settings, "directory", str(tmp_path_factory.mktemp("rate_limits")))
+    monkeypatch.setattr(rate_limit, "_limiters", {})
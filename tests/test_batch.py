@@ -0,0 +1,100 @@
+import json
+import os
+
+import pytest
+
+from ai_feedback import batch
+
+
+def test_collect_submissions_from_directory_keeps_known_types(tmp_path):
+    (tmp_path / "alice").mkdir()
+    (tmp_path / "alice" / "submission.py").write_text("")
+    (tmp_path / "bob.ipynb").write_text("")
+    (tmp_path / "notes.xyz").write_text("")
+
+    entries = batch.collect_submissions(str(tmp_path))
+
+    assert entries == [
+        {"submission": str(tmp_path / "alice" / "submission.py")},
+        {"submission": str(tmp_path / "bob.ipynb")},
+    ]
+
+
+def test_collect_submissions_from_manifest_keeps_overrides(tmp_path):
+    manifest = tmp_path / "manifest.jsonl"
+    lines = [{"submission": "a.py", "question": "1", "unknown": True}, {"submission": "b.py"}]
+    manifest.write_text("\n".join(json.dumps(line) for line in lines) + "\n\n")
+
+    entries = batch.collect_submissions(str(manifest))
+
+    assert entries == [{"submission": "a.py", "question": "1"}, {"submission": "b.py"}]
+
+
+def test_collect_submissions_rejects_manifest_lines_without_submission(tmp_path):
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text('{"question": "1"}\n')
+
+    with pytest.raises(ValueError):
+        batch.collect_submissions(str(manifest))
+
+
+def test_collect_submissions_without_matches_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        batch.collect_submissions(str(tmp_path / "*.py"))
+
+
+def test_assign_output_paths_mirrors_submission_folders(tmp_path):
+    entries = [
+        {"submission": str(tmp_path / "alice" / "submission.py")},
+        {"submission": str(tmp_path / "bob" / "submission.py")},
+        {"submission": str(tmp_path / "carol" / "submission.py"), "output": "chosen.md"},
+    ]
+
+    batch.assign_output_paths(entries, "feedback")
+
+    assert entries[0]["output"] == os.path.join("feedback", "alice", "submission.md")
+    assert entries[1]["output"] == os.path.join("feedback", "bob", "submission.md")
+    assert entries[2]["output"] == "chosen.md"
+
+
+def test_assign_output_paths_for_a_single_submission(tmp_path):
+    entries = [{"submission": str(tmp_path / "submission.py")}]
+
+    batch.assign_output_paths(entries, "feedback")
+
+    assert entries[0]["output"] == os.path.join("feedback", "submission.md")
+
+
+def _run_main(monkeypatch, tmp_path, results):
+    (tmp_path / "submission.py").write_text("")
+    monkeypatch.setattr(batch, "run_batch", lambda args, entries, workers: results)
+    argv = ["--submissions", str(tmp_path), "--output_dir", str(tmp_path / "out"), "--scope", "code"]
+    return batch.main(argv + ["--model", "openai", "--prompt", "code_lines"])
+
+
+def test_main_reports_deferred_submissions_apart_from_failures(monkeypatch, tmp_path, capsys):
+    results = [
+        batch.BatchResult("a.py", "a.md", "ok", None, 1.0),
+        batch.BatchResult("b.py", "b.md", "deferred", None, 0.1, "batch_123"),
+    ]
+
+    assert _run_main(monkeypatch, tmp_path, results) == 0
+
+    captured = capsys.readouterr()
+    assert "[deferred] b.py (batch id batch_123)" in captured.out
+    assert "Graded 1/2 submissions" in captured.out
+    assert "1 deferred" in captured.out
+    assert "[error]" not in captured.err
+
+
+def test_main_fails_when_a_submission_fails(monkeypatch, tmp_path, capsys):
+    results = [
+        batch.BatchResult("a.py", "a.md", "deferred", None, 0.1),
+        batch.BatchResult("b.py", "b.md", "error", "Solution file missing", 0.1),
+    ]
+
+    assert _run_main(monkeypatch, tmp_path, results) == 1
+
+    captured = capsys.readouterr()
+    assert "[deferred] a.py\n" in captured.out
+    assert "[error] b.py: Solution file missing" in captured.err
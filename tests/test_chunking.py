@@ -0,0 +1,55 @@
+from ai_feedback.helpers import chunking
+from ai_feedback.helpers.chunking import Chunk
+
+
+def _python_file(path):
+    functions = [f"def task_{n}():\n" + "".join(f"    x = {i}\n" for i in range(4)) + "\n" for n in range(1, 4)]
+    path.write_text("import math\n\n" + "".join(functions))
+    return path
+
+
+def test_split_file_packs_definitions_into_chunks(tmp_path):
+    path = _python_file(tmp_path / "submission.py")
+
+    chunks = chunking.split_file(path, max_lines=8)
+
+    assert chunks == [Chunk(1, 8, ("task_1",)), Chunk(9, 14, ("task_2",)), Chunk(15, 20, ("task_3",))]
+
+
+def test_split_file_cuts_long_sections(tmp_path):
+    path = tmp_path / "submission.py"
+    path.write_text("def long():\n" + "".join(f"    x = {i}\n" for i in range(9)))
+
+    chunks = chunking.split_file(path, max_lines=4)
+
+    assert [(chunk.first, chunk.last) for chunk in chunks] == [(1, 4), (5, 8), (9, 10)]
+    assert all(chunk.titles == ("long",) for chunk in chunks)
+
+
+def test_split_file_of_unparsable_python_falls_back_to_definitions(tmp_path):
+    path = tmp_path / "submission.py"
+    path.write_text("def first(:\n    pass\n@decorator\ndef second():\n    pass\n")
+
+    assert chunking.split_file(path, max_lines=3) == [Chunk(1, 2, ("first",)), Chunk(3, 5, ("second",))]
+
+
+def test_section_spans_and_matching_lines_of_markdown(tmp_path):
+    path = tmp_path / "solution.txt"
+    path.write_text("# Lab\n## Task 1\na\nb\n## Task 2\nc\n")
+
+    spans = chunking.section_spans(path)
+
+    assert spans == {"lab": (1, 1), "task 1": (2, 4), "task 2": (5, 6)}
+    assert chunking.matching_lines(spans, ("task 1", "task 2")) == (2, 6)
+    assert chunking.matching_lines(spans, ("task 3",)) is None
+
+
+def test_merge_prompt_escapes_responses():
+    chunks = [Chunk(1, 10, ()), Chunk(11, 20, ())]
+
+    prompt = chunking.merge_prompt("Review {file_contents}.", "a.py", chunks, ["use {x}\n", "fine"])
+
+    assert prompt.startswith("Review [a.py was reviewed in parts, see below.].")
+    assert '<part lines="1-10">\nuse {{x}}\n</part>' in prompt
+    assert '<part lines="11-20">\nfine\n</part>' in prompt
+    assert prompt.format().count("{x}") == 1
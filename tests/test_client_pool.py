@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+import pytest
+
+from ai_feedback.helpers import client_pool
+from ai_feedback.helpers.async_utils import run_sync
+
+
+class FakeAsyncClient:
+    def __init__(self):
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def pool_settings(monkeypatch):
+    """Restores the pool sizes that tests change."""
+    for name, value in client_pool._settings.items():
+        monkeypatch.setitem(client_pool._settings, name, value)
+
+
+async def _pooled_client():
+    return client_pool.get_async_client(("fake",), FakeAsyncClient)
+
+
+def test_configure_closes_async_clients_on_their_loop():
+    client = run_sync(_pooled_client())
+
+    client_pool.configure(max_connections=client_pool._settings["max_connections"] + 1)
+
+    deadline = time.monotonic() + 5
+    while not client.closed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert client.closed
+    assert run_sync(_pooled_client()) is not client
+
+
+def test_run_sync_inside_an_event_loop_closes_the_clients_of_its_loop():
+    async def caller():
+        return run_sync(_pooled_client())
+
+    client = asyncio.run(caller())
+
+    assert client.closed
@@ -0,0 +1,127 @@
+import argparse
+import json
+
+import pytest
+
+from ai_feedback import code_processing
+from ai_feedback.__main__ import (
+    QUESTION_SEPARATOR,
+    add_common_arguments,
+    generate_feedback,
+    parse_model_options,
+)
+
+
+class EchoModel:
+    """Stands in for a provider model, answering every request with its prompt."""
+
+    def generate_response(self, prompt, **kwargs):
+        return prompt, "feedback"
+
+
+def _notebook(path, *sources):
+    """Writes a notebook with a cell per source, a markdown cell for sources starting with a heading."""
+    cells = []
+    for number, source in enumerate(sources):
+        cell = {"id": f"cell-{number}", "metadata": {}, "source": source}
+        if source.startswith("#"):
+            cell["cell_type"] = "markdown"
+        else:
+            cell.update(cell_type="code", outputs=[], execution_count=None)
+        cells.append(cell)
+    notebook = {"cells": cells, "metadata": {}, "nbformat": 4, "nbformat_minor": 5}
+    path.write_text(json.dumps(notebook))
+    return str(path)
+
+
+def _parse(*argv):
+    parser = argparse.ArgumentParser()
+    add_common_arguments(parser)
+    parser.add_argument("--submission", type=str, required=True)
+    args = parser.parse_args(["--model", "openai", "--scope", "code", "--prompt", "code_lines", *argv])
+    args.model_options = parse_model_options(args.model_options)
+    return args
+
+
+@pytest.fixture
+def echo_model(monkeypatch):
+    monkeypatch.setattr(code_processing, "model_mapping", {"openai": EchoModel})
+
+
+@pytest.fixture
+def notebooks(tmp_path):
+    starter = _notebook(tmp_path / "starter.ipynb", "def add(a, b):\n    pass", "print(add(1, 2))")
+    submission = _notebook(tmp_path / "submission.ipynb", "def add(a, b):\n    return a + b", "print(add(1, 2))")
+    return starter, submission
+
+
+def test_full_view_with_starter_renders_whole_notebook(echo_model, notebooks, tmp_path):
+    starter, submission = notebooks
+    args = _parse("--submission_type", "jupyter", "--submission", submission, "--starter", starter)
+
+    request, response = code_processing.process_code(args, "{file_contents}", "")
+
+    assert response == "feedback"
+    assert "(Line 2) def add(a, b):" in request
+    assert "Compared with" not in request
+    # The starter notebook is only converted for the diff view
+    assert not (tmp_path / "starter.txt").exists()
+
+
+def test_diff_view_compares_with_converted_starter(echo_model, notebooks):
+    starter, submission = notebooks
+    args = _parse(
+        "--submission_type", "jupyter", "--submission", submission, "--starter", starter, "--submission_view", "diff"
+    )
+
+    request, _ = code_processing.process_code(args, "{file_contents}", "")
+
+    assert "[Compared with starter.txt" in request
+    assert "(Line 3) +     return a + b" in request
+    assert "-     pass" in request
+
+
+def test_diff_view_without_starter_or_solution_exits(echo_model, tmp_path):
+    submission = tmp_path / "submission.py"
+    submission.write_text("print(1)\n")
+    args = _parse("--submission_type", "python", "--submission", str(submission), "--submission_view", "diff")
+
+    with pytest.raises(SystemExit):
+        code_processing.process_code(args, "{file_contents}", "")
+
+
+def test_question_renders_only_its_section(echo_model, tmp_path):
+    submission = _notebook(
+        tmp_path / "submission.ipynb", "## Task 1", "x = 1", "## Task 2", "y = 2", "## Task 3", "z = 3"
+    )
+    args = _parse("--submission_type", "jupyter", "--submission", submission, "--question", "Task 2")
+
+    request, _ = code_processing.process_code(args, "{file_contents}", "")
+
+    assert "y = 2" in request
+    assert "x = 1" not in request
+    assert "z = 3" not in request
+
+
+def test_several_questions_prompt_once_per_section(echo_model, tmp_path):
+    submission = _notebook(
+        tmp_path / "submission.ipynb", "## Task 1", "x = 1", "## Task 2", "y = 2", "## Task 3", "z = 3"
+    )
+    args = _parse("--submission_type", "jupyter", "--submission", submission, "--question", "all")
+
+    request, response = generate_feedback(args, "{file_contents}", "")
+
+    first, second, third = request.split(QUESTION_SEPARATOR)
+    assert "x = 1" in first and "y = 2" not in first
+    assert "y = 2" in second and "z = 3" not in second
+    assert "z = 3" in third and "x = 1" not in third
+    assert response.count("feedback") == 3
+
+
+def test_several_questions_of_a_python_file_exit(echo_model, tmp_path):
+    submission = tmp_path / "submission.py"
+    submission.write_text("print(1)\n")
+    args = _parse("--submission_type", "python", "--submission", str(submission), "--question", "1,2")
+
+    with pytest.raises(SystemExit):
+        generate_feedback(args, "{file_contents}", "")
@@ -0,0 +1,149 @@
+import argparse
+import contextlib
+import contextvars
+import os
+import stat
+import sys
+import threading
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from ai_feedback import __main__ as cli
+from ai_feedback import daemon
+from ai_feedback.helpers.async_utils import run_sync
+from ai_feedback.helpers.streaming import ContextOutput, output_stream, redirect_output
+
+
+@contextlib.contextmanager
+def context_output():
+    """Installs ContextOutput in place of sys.stdout and sys.stderr, as serve() does.
+
+    Pytest swaps its own streams back in after fixtures are set up, so tests enter this themselves.
+    """
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = ContextOutput(stdout), ContextOutput(stderr, error=True)
+    try:
+        yield
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+
+
+@pytest.fixture
+def fixed_options(monkeypatch):
+    """Applies the default process-wide options, as a daemon started without options does."""
+    monkeypatch.setattr(cli, "_fixed_options", None)
+    monkeypatch.setattr(cli, "configure_caches", lambda args: None)
+    options = argparse.ArgumentParser()
+    cli.add_process_arguments(options)
+    cli.fix_process_options(options.parse_args([]))
+
+
+def _print_from_everywhere(argv):
+    """Stands in for cli.main, printing from the caller, a worker thread and the shared event loop."""
+
+    async def from_loop():
+        print(f"{argv[0]} from the event loop")
+
+    print(f"{argv[0]} from the request thread")
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(contextvars.copy_context().run, print, f"{argv[0]} from a worker").result()
+    run_sync(from_loop())
+    print(f"{argv[0]} failed", file=sys.stderr)
+    return 3
+
+
+def test_run_argv_captures_output_of_every_thread_of_the_request(monkeypatch):
+    monkeypatch.setattr(cli, "main", _print_from_everywhere)
+
+    with context_output(), ThreadPoolExecutor(max_workers=2) as executor:
+        first, second = executor.map(daemon._run_argv, [["first"], ["second"]])
+
+    for name, result in (("first", first), ("second", second)):
+        assert result["returncode"] == 3
+        assert result["stdout"] == (
+            f"{name} from the request thread\n{name} from a worker\n{name} from the event loop\n"
+        )
+        assert result["stderr"] == f"{name} failed\n"
+
+
+def test_context_output_writes_to_the_original_stream_outside_of_a_request(capsys):
+    with context_output():
+        print("outside")
+        with redirect_output(sys.__stdout__, sys.__stderr__):
+            assert output_stream() is sys.__stdout__
+        assert output_stream() is sys.stdout
+
+    assert capsys.readouterr().out == "outside\n"
+
+
+def test_conflicting_process_options_only_outside_of_a_daemon(monkeypatch):
+    monkeypatch.setattr(cli, "_fixed_options", None)
+
+    assert cli.conflicting_process_options(["--cache", "refresh"]) == []
+
+
+def test_conflicting_process_options_are_those_set_to_other_values(fixed_options):
+    argv = ["--model", "openai", "--cache", "use", "--cache_ttl", "1", "--max_connections", "4"]
+
+    assert cli.conflicting_process_options(argv) == ["--cache_ttl", "--max_connections"]
+
+
+def test_run_argv_rejects_requests_that_change_process_options(monkeypatch, fixed_options):
+    monkeypatch.setattr(cli, "main", lambda argv: pytest.fail("the request should not run"))
+
+    with context_output():
+        rejected = daemon._run_argv(["batch", "--submissions", "a", "--cache", "refresh"])
+        rate_limited = daemon._run_argv(["--rate_limit", "requests_per_minute=10"])
+
+    assert rejected["returncode"] == 1
+    assert "--cache must be set when the daemon is started" in rejected["stderr"]
+    assert rate_limited["returncode"] == 1
+    assert "--rate_limit cannot be used with the daemon" in rate_limited["stderr"]
+
+
+@pytest.fixture
+def daemon_url(monkeypatch):
+    """Serves requests with the token "secret", answering them without running ai_feedback."""
+    monkeypatch.delenv("AI_FEEDBACK_DAEMON_TOKEN", raising=False)
+    monkeypatch.setattr(daemon, "_run_argv", lambda argv: {"returncode": 0, "stdout": " ".join(argv), "stderr": ""})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), daemon._make_handler("secret"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_daemon_rejects_requests_without_its_token(daemon_url, monkeypatch, tmp_path):
+    monkeypatch.setenv("AI_FEEDBACK_DAEMON_TOKEN_FILE", str(tmp_path / "missing"))
+
+    for token in (None, "guess"):
+        with pytest.raises(urllib.error.HTTPError) as error:
+            daemon.run_via_daemon(["--scope", "code"], daemon_url, token)
+        assert error.value.code == 403
+
+    result = daemon.run_via_daemon(["--scope", "code"], daemon_url, "secret")
+    assert result.returncode == 0
+    assert result.stdout.startswith("--scope code")
+
+
+def test_clients_read_the_token_file_of_the_daemon(daemon_url, monkeypatch, tmp_path):
+    path = tmp_path / "token"
+    monkeypatch.setenv("AI_FEEDBACK_DAEMON_TOKEN_FILE", str(path))
+    token = daemon._write_token(daemon.token_file())
+
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert daemon.read_token() == token
+    monkeypatch.setenv("AI_FEEDBACK_DAEMON_TOKEN", "secret")
+    assert daemon.read_token() == "secret"
+    assert daemon.run_via_daemon(["--scope", "code"], daemon_url).returncode == 0
+
+
+def test_run_via_daemon_times_out(daemon_url, monkeypatch):
+    monkeypatch.setattr(daemon, "_run_argv", lambda argv: time.sleep(2) or {})
+
+    with pytest.raises(OSError):
+        daemon.run_via_daemon(["--scope", "code"], daemon_url, "secret", timeout=0.2)
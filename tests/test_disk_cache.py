@@ -0,0 +1,94 @@
+import os
+import time
+
+from ai_feedback.helpers import disk_cache
+from ai_feedback.helpers.disk_cache import DiskCache
+
+
+def test_set_and_get(tmp_path):
+    cache = DiskCache(tmp_path, max_bytes=1024)
+
+    cache.set("ab12", b"response")
+
+    assert cache.get("ab12") == b"response"
+    assert cache.get("cd34") is None
+
+
+def test_expired_entries_are_missing(tmp_path, monkeypatch):
+    cache = DiskCache(tmp_path, max_bytes=1024, ttl=60)
+    cache.set("ab12", b"response")
+
+    later = time.time() + 61
+    monkeypatch.setattr(disk_cache.time, "time", lambda: later)
+
+    assert cache.get("ab12") is None
+    assert not (tmp_path / "ab" / "ab12").exists()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    entry_size = disk_cache._HEADER.size + 100
+    cache = DiskCache(tmp_path, max_bytes=2 * entry_size)
+    cache.set("aa01", b"x" * 100)
+    cache.set("bb02", b"x" * 100)
+    # Reading an entry makes it the most recently used
+    os.utime(tmp_path / "aa" / "aa01", (time.time() - 20, time.time() - 20))
+    os.utime(tmp_path / "bb" / "bb02", (time.time() - 10, time.time() - 10))
+    cache.get("aa01")
+
+    cache.set("cc03", b"x" * 100)
+
+    assert cache.get("aa01") is not None
+    assert cache.get("bb02") is None
+    assert cache.get("cc03") is not None
+
+
+def test_writes_under_the_size_limit_do_not_scan(tmp_path, monkeypatch):
+    cache = DiskCache(tmp_path, max_bytes=1024 * 1024)
+    scans = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, "evict", lambda: scans.append(1) or evict())
+
+    for number in range(20):
+        cache.set(f"{number:04x}", b"x" * 100)
+        cache.set(f"{number:04x}", b"y" * 100)
+
+    # Only the first write scans the directory
+    assert len(scans) == 1
+
+
+def test_writes_scan_every_scan_interval(tmp_path, monkeypatch):
+    monkeypatch.setattr(disk_cache, "SCAN_INTERVAL", 5)
+    cache = DiskCache(tmp_path, max_bytes=1024 * 1024)
+    scans = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, "evict", lambda: scans.append(1) or evict())
+
+    for number in range(10):
+        cache.set(f"{number:04x}", b"x")
+
+    assert len(scans) == 3
+
+
+def test_other_processes_entries_are_counted_when_scanning(tmp_path, monkeypatch):
+    monkeypatch.setattr(disk_cache, "SCAN_INTERVAL", 2)
+    entry_size = disk_cache._HEADER.size + 100
+    writer = DiskCache(tmp_path, max_bytes=3 * entry_size)
+    other = DiskCache(tmp_path, max_bytes=3 * entry_size)
+    writer.set("aa01", b"x" * 100)
+    other.set("bb02", b"x" * 100)
+    other.set("cc03", b"x" * 100)
+
+    # The writer only knows of its own entries until its next periodic scan
+    writer.set("dd04", b"x" * 100)
+
+    remaining = [name for name in ("aa01", "bb02", "cc03", "dd04") if writer.get(name) is not None]
+    assert len(remaining) == 3
+
+
+def test_clear(tmp_path):
+    cache = DiskCache(tmp_path, max_bytes=1024)
+    cache.set("ab12", b"response")
+
+    cache.clear()
+
+    assert cache.get("ab12") is None
@@ -0,0 +1,42 @@
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+# Median seconds `python -m ai_feedback --help` may take
+HELP_BUDGET_SECONDS = 0.75
+# Modules that must not be imported just to parse arguments, since only some runs need them
+HEAVY_MODULES = ["anthropic", "openai", "ollama", "requests", "PIL", "pymupdf", "PyPDF2", "nbformat", "matplotlib"]
+
+LOADED_MODULES_SCRIPT = f"""
+import json, runpy, sys
+sys.argv = ["ai_feedback", "--help"]
+try:
+    runpy.run_module("ai_feedback", run_name="__main__")
+except SystemExit:
+    pass
+print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]), file=sys.stderr)
+"""
+
+
+def test_help_imports_no_provider_sdk_or_file_format_library():
+    result = subprocess.run(
+        [sys.executable, "-c", LOADED_MODULES_SCRIPT],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+
+    assert json.loads(result.stderr.strip().splitlines()[-1]) == []
+
+
+def test_help_starts_within_budget():
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-m", "ai_feedback", "--help"], stdout=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+
+    assert statistics.median(timings) < HELP_BUDGET_SECONDS
@@ -0,0 +1,35 @@
+import os
+
+from ai_feedback.helpers import markdown_index
+from ai_feedback.helpers.markdown_index import MarkdownSectionIndex
+
+LINES = ["# Lab\n", "intro\n", "## Task 1\n", "a\n", "### Task 1a\n", "b\n", "## Task 2\n", "c\n"]
+
+
+def test_section_runs_to_the_next_heading_at_its_level_or_above():
+    index = MarkdownSectionIndex(LINES)
+
+    assert index.section("Task 1") == ("## Task 1\na\n### Task 1a\nb\n", True)
+    assert index.section("  task   1A ") == ("### Task 1a\nb\n", True)
+    assert index.section("Lab") == ("".join(LINES), True)
+    assert index.section("Task 3") == ("", False)
+
+
+def test_sections_of_several_questions():
+    index = MarkdownSectionIndex(LINES)
+
+    assert index.sections(["Task 2", "Task 3"]) == {"Task 2": ("## Task 2\nc\n", True), "Task 3": ("", False)}
+
+
+def test_load_markdown_index_rereads_only_changed_files(tmp_path):
+    path = tmp_path / "solution.txt"
+    path.write_text("## Task 1\na\n")
+    first = markdown_index.load_markdown_index(path)
+
+    assert markdown_index.load_markdown_index(path) is first
+
+    path.write_text("## Task 2\nb\n")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    assert markdown_index.load_markdown_index(path).section("Task 2") == ("## Task 2\nb\n", True)
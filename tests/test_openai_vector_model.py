@@ -0,0 +1,104 @@
+import importlib
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+from ai_feedback.helpers import client_pool, rate_limit
+
+# ai_feedback.models exports the class under the name of its module
+vector_module = importlib.import_module("ai_feedback.models.OpenAIModelVector")
+
+
+class FakeOpenAI:
+    """Records the resources created and deleted through the OpenAI API calls the model makes."""
+
+    def __init__(self, fail_runs=0):
+        self.ids = itertools.count(1)
+        self.assistants = set()
+        self.vector_stores = set()
+        self.files = set()
+        self.deleted_assistants = []
+        self.fail_runs = fail_runs
+        self.vector_stores_api = SimpleNamespace(
+            create=lambda **kwargs: self._create(self.vector_stores, "vs"),
+            delete=lambda id: self.vector_stores.remove(id),
+            files=SimpleNamespace(create=lambda **kwargs: None, delete=lambda **kwargs: None),
+        )
+        self.beta = SimpleNamespace(
+            assistants=SimpleNamespace(
+                create=lambda **kwargs: self._create(self.assistants, "asst"), delete=self._delete
+            ),
+            threads=SimpleNamespace(
+                create=lambda: SimpleNamespace(id="thread"),
+                messages=SimpleNamespace(
+                    create=lambda **kwargs: None,
+                    list=lambda **kwargs: SimpleNamespace(
+                        data=[SimpleNamespace(content=[SimpleNamespace(text=SimpleNamespace(value="feedback"))])]
+                    ),
+                ),
+                runs=SimpleNamespace(create=self._run, retrieve=None),
+            ),
+        )
+        self.files_api = SimpleNamespace(
+            create=lambda **kwargs: self._create(self.files, "file"), delete=lambda id: self.files.remove(id)
+        )
+
+    def _create(self, pool, prefix):
+        resource = SimpleNamespace(id=f"{prefix}-{next(self.ids)}")
+        pool.add(resource.id)
+        return resource
+
+    def _delete(self, id):
+        self.assistants.remove(id)
+        self.deleted_assistants.append(id)
+
+    def _run(self, **kwargs):
+        if self.fail_runs:
+            self.fail_runs -= 1
+            raise ConnectionError("connection reset")
+        return SimpleNamespace(status="completed")
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    def install(**kwargs):
+        fake = FakeOpenAI(**kwargs)
+        client = SimpleNamespace(vector_stores=fake.vector_stores_api, beta=fake.beta, files=fake.files_api)
+        monkeypatch.setattr(client_pool, "openai_client", lambda api_key=None: client)
+        return fake
+
+    return install
+
+
+def test_only_the_requests_own_resources_are_deleted(fake_openai, tmp_path):
+    fake = fake_openai()
+    fake.assistants.add("asst-of-another-worker")
+    submission = tmp_path / "submission.py"
+    submission.write_text("print(1)\n")
+
+    request, response = vector_module.OpenAIModelVector().generate_response(
+        "prompt", submission, "instructions", model_options={}
+    )
+
+    assert response == "feedback"
+    assert fake.assistants == {"asst-of-another-worker"}
+    assert fake.vector_stores == set()
+    assert fake.files == set()
+
+
+def test_retried_requests_clean_up_every_attempt(fake_openai, tmp_path, monkeypatch):
+    fake = fake_openai(fail_runs=1)
+    monkeypatch.setattr(rate_limit.random, "uniform", lambda low, high: 0)
+    submission = tmp_path / "submission.py"
+    submission.write_text("print(1)\n")
+
+    _, response = vector_module.OpenAIModelVector().generate_response(
+        "prompt", submission, "instructions", model_options={}
+    )
+
+    assert response == "feedback"
+    assert len(fake.deleted_assistants) == 2
+    assert fake.assistants == set()
+    assert fake.vector_stores == set()
+    assert fake.files == set()
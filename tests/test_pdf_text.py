@@ -0,0 +1,34 @@
+import pytest
+
+from ai_feedback.helpers import pdf_text
+
+
+@pytest.fixture(autouse=True)
+def pdf_settings(monkeypatch):
+    monkeypatch.setitem(pdf_text._settings, "backend", "auto")
+
+
+def test_auto_backend_is_pymupdf_when_installed(monkeypatch):
+    monkeypatch.setattr(pdf_text, "_pymupdf_installed", lambda: True)
+    assert pdf_text.resolve_backend() == "pymupdf"
+
+    monkeypatch.setattr(pdf_text, "_pymupdf_installed", lambda: False)
+    assert pdf_text.resolve_backend() == "pypdf2"
+
+
+def test_configured_backend_is_used_as_is(monkeypatch):
+    monkeypatch.setattr(pdf_text, "_pymupdf_installed", lambda: True)
+    pdf_text.configure(backend="pypdf2")
+
+    assert pdf_text.resolve_backend() == "pypdf2"
+    with pytest.raises(ValueError):
+        pdf_text.configure(backend="fastest")
+
+
+def test_extract_pages_reports_the_auto_backend(monkeypatch, tmp_path):
+    monkeypatch.setattr(pdf_text, "_pymupdf_installed", lambda: True)
+    monkeypatch.setitem(
+        pdf_text._EXTRACTORS, "pymupdf", lambda path, start, stop: [f"page {n}" for n in range(start, stop)]
+    )
+
+    assert pdf_text.extract_pages(tmp_path / "a.pdf", 3) == ("pymupdf", ["page 0", "page 1", "page 2"])
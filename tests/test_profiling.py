@@ -0,0 +1,39 @@
+import os
+import pstats
+import subprocess
+import sys
+import textwrap
+
+# Run in a fresh interpreter, so that the shared event loop's thread starts while the run is profiled
+PROFILED_RUN = textwrap.dedent(
+    """
+    import asyncio
+    import sys
+
+    from ai_feedback.helpers.async_utils import run_sync
+    from ai_feedback.helpers.profiling import profile_run
+
+
+    async def respond():
+        await asyncio.sleep(0.01)
+        return "response"
+
+
+    with profile_run(sys.argv[1]) as prefix:
+        assert run_sync(respond()) == "response"
+    print(prefix)
+    """
+)
+
+
+def test_profile_run_profiles_the_event_loop_thread(tmp_path):
+    result = subprocess.run(
+        [sys.executable, "-c", PROFILED_RUN, str(tmp_path)], capture_output=True, text=True, timeout=60
+    )
+
+    assert result.returncode == 0, result.stderr
+    prefix = result.stdout.strip()
+    functions = {function for _, _, function in pstats.Stats(f"{prefix}.pstats").stats}
+    assert "respond" in functions
+    assert os.path.exists(f"{prefix}.collapsed")
+    assert open(f"{prefix}.memory.txt", encoding="utf-8").read().startswith("Peak traced memory of the run")
@@ -0,0 +1,139 @@
+import asyncio
+import fcntl
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from ai_feedback.helpers import rate_limit
+from ai_feedback.helpers.rate_limit import RateLimit, RateLimiter
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": headers or {}})()
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    """Records the waits of the limiter and moves a fake clock forward instead of sleeping."""
+    waits = []
+    clock = [time.time()]
+
+    def sleep(seconds):
+        waits.append(seconds)
+        clock[0] += seconds
+
+    fake_time = SimpleNamespace(time=lambda: clock[0], sleep=sleep, perf_counter=time.perf_counter)
+    monkeypatch.setattr(rate_limit, "time", fake_time)
+    monkeypatch.setattr(rate_limit.random, "uniform", lambda low, high: high)
+    return waits
+
+
+def _flaky(errors, result="done"):
+    """Returns a call raising each of errors in turn, then returning result."""
+    remaining = list(errors)
+    calls = []
+
+    def call():
+        calls.append(1)
+        if remaining:
+            raise remaining.pop(0)
+        return result
+
+    return call, calls
+
+
+def test_buckets_wait_for_a_request_once_the_minute_is_used(tmp_path):
+    limiter = RateLimiter("openai", RateLimit(requests_per_minute=2), str(tmp_path))
+
+    assert limiter.buckets.reserve(0) == 0
+    assert limiter.buckets.reserve(0) == 0
+    assert limiter.buckets.reserve(0) == pytest.approx(30, abs=1)
+
+
+def test_buckets_are_shared_through_the_state_file(tmp_path):
+    first = RateLimiter("claude", RateLimit(tokens_per_minute=1000), str(tmp_path))
+    second = RateLimiter("claude", RateLimit(tokens_per_minute=1000), str(tmp_path))
+
+    assert first.buckets.reserve(800) == 0
+    assert second.buckets.reserve(800) > 0
+    assert (tmp_path / "claude.json").exists()
+
+
+def test_run_retries_transient_errors_with_backoff(tmp_path, no_sleep):
+    limiter = RateLimiter("openai", RateLimit(base_delay=1.0), str(tmp_path))
+    call, calls = _flaky([StatusError(503), ConnectionError("reset")])
+
+    assert limiter.run(call) == "done"
+    assert len(calls) == 3
+    assert no_sleep == [1.0, 2.0]
+
+
+def test_run_waits_as_long_as_retry_after_and_halves_concurrency(tmp_path, no_sleep):
+    limiter = RateLimiter("openai", RateLimit(max_concurrency=8, base_delay=1.0), str(tmp_path))
+    call, _ = _flaky([StatusError(429, {"retry-after": "5"})])
+
+    assert limiter.run(call) == "done"
+    assert no_sleep == [6.0]
+    assert limiter.gate.limit < 8
+
+
+def test_run_does_not_retry_rejected_requests(tmp_path, no_sleep):
+    limiter = RateLimiter("openai", RateLimit(), str(tmp_path))
+    call, calls = _flaky([StatusError(400)])
+
+    with pytest.raises(StatusError):
+        limiter.run(call)
+    assert len(calls) == 1
+
+
+def test_run_gives_up_after_max_retries(tmp_path, no_sleep):
+    limiter = RateLimiter("openai", RateLimit(max_retries=2), str(tmp_path))
+    call, calls = _flaky([StatusError(500)] * 3)
+
+    with pytest.raises(StatusError):
+        limiter.run(call)
+    assert len(calls) == 3
+
+
+def test_configure_overrides_the_limits_of_a_model(monkeypatch):
+    monkeypatch.setattr(rate_limit, "_overrides", {})
+
+    rate_limit.configure("openai", requests_per_minute=10)
+
+    assert rate_limit.get_limiter("openai").limit.requests_per_minute == 10
+    with pytest.raises(ValueError):
+        rate_limit.configure("openai", requests_per_hour=10)
+
+
+def test_arun_waits_for_the_shared_file_lock_off_the_event_loop(tmp_path):
+    limiter = RateLimiter("openai", RateLimit(requests_per_minute=60), str(tmp_path))
+    # Another process holding the lock, released after a second in any case
+    holder = open(limiter.buckets.path, "a+")
+    fcntl.flock(holder, fcntl.LOCK_EX)
+    release = threading.Timer(1.0, holder.close)
+    release.start()
+
+    async def respond():
+        return "done"
+
+    async def scenario():
+        request = asyncio.create_task(limiter.arun(respond))
+        started = time.perf_counter()
+        await asyncio.sleep(0.05)
+        loop_delay = time.perf_counter() - started
+        waiting = not request.done()
+        fcntl.flock(holder, fcntl.LOCK_UN)
+        return loop_delay, waiting, await request
+
+    loop_delay, waiting, result = asyncio.run(scenario())
+    release.cancel()
+    holder.close()
+
+    assert loop_delay < 0.5
+    assert waiting
+    assert result == "done"
@@ -0,0 +1,53 @@
+import urllib.parse
+
+import httpx
+import pytest
+
+from ai_feedback.helpers import client_pool
+from ai_feedback.models.RemoteModel import RemoteModel
+
+
+@pytest.fixture
+def sent_forms(monkeypatch):
+    """Answers every request of the remote model, recording the form fields it sent."""
+    forms = []
+
+    def handler(request):
+        form = urllib.parse.parse_qs(request.content.decode())
+        form["X-API-KEY"] = request.headers.get_list("X-API-KEY")
+        forms.append(form)
+        return httpx.Response(200, json={"response": "feedback"})
+
+    monkeypatch.setattr(
+        client_pool, "async_http_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+    return forms
+
+
+def test_model_options_are_sent_as_one_field_per_option_name(sent_forms, tmp_path):
+    RemoteModel(remote_url="http://ai-server/chat").generate_response(
+        "prompt", tmp_path / "submission.py", "instructions", model_options={"temperature": "0.2", "top_p": "0.9"}
+    )
+
+    assert sent_forms[0]["model_options"] == ["temperature", "top_p"]
+
+
+@pytest.mark.parametrize("model_options", [None, {}])
+def test_model_options_are_left_out_without_options(sent_forms, tmp_path, model_options):
+    prompt, response = RemoteModel(remote_url="http://ai-server/chat").generate_response(
+        "prompt", tmp_path / "submission.py", "instructions", model_options=model_options
+    )
+
+    assert "model_options" not in sent_forms[0]
+    assert sent_forms[0]["content"] == ["prompt"]
+    assert response == {"response": "feedback"}
+
+
+def test_api_key_header_is_sent_only_when_set(sent_forms, tmp_path, monkeypatch):
+    model = RemoteModel(remote_url="http://ai-server/chat")
+    monkeypatch.setenv("REMOTE_API_KEY", "secret")
+    model.generate_response("prompt", tmp_path / "submission.py", "instructions")
+    monkeypatch.delenv("REMOTE_API_KEY")
+    model.generate_response("prompt", tmp_path / "submission.py", "instructions")
+
+    assert [form["X-API-KEY"] for form in sent_forms] == [["secret"], []]
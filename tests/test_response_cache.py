@@ -0,0 +1,100 @@
+import asyncio
+import threading
+
+from ai_feedback.helpers import response_cache
+from ai_feedback.helpers.disk_cache import DiskCache
+from ai_feedback.helpers.run_stats import start_run
+
+
+class CountingModel:
+    model_name = "counting"
+
+    def __init__(self):
+        self.calls = 0
+
+    @response_cache.cached_response
+    def generate_response(self, prompt, submission_file=None, system_instructions="", model_options=None):
+        self.calls += 1
+        return prompt, f"response {self.calls}"
+
+
+class AsyncCountingModel:
+    model_name = "counting"
+
+    def __init__(self):
+        self.calls = 0
+
+    @response_cache.cached_response
+    async def generate_response(self, prompt, system_instructions="", model_options=None):
+        self.calls += 1
+        return prompt, f"response {self.calls}"
+
+
+def test_make_key_ignores_dict_order_and_hashes_bytes():
+    first = response_cache.make_key(prompt="p", model_options={"a": 1, "b": 2}, image=b"png")
+    second = response_cache.make_key(model_options={"b": 2, "a": 1}, image=b"png", prompt="p")
+
+    assert first == second
+    assert response_cache.make_key(prompt="p", model_options={"a": 1, "b": 2}, image=b"jpg") != first
+
+
+def test_cached_response_serves_identical_requests(monkeypatch, tmp_path):
+    monkeypatch.setitem(response_cache._settings, "mode", "use")
+    monkeypatch.setitem(response_cache._settings, "directory", str(tmp_path))
+    model = CountingModel()
+
+    first = model.generate_response("prompt", submission_file=tmp_path / "a.py")
+    # Paths are left out of the key, since their contents are part of the prompt
+    second = model.generate_response("prompt", submission_file=tmp_path / "b.py")
+    third = model.generate_response("prompt", model_options={"temperature": "0"})
+
+    assert first == second == ("prompt", "response 1")
+    assert third == ("prompt", "response 2")
+    assert model.calls == 2
+
+
+def test_refresh_replaces_cached_responses(monkeypatch, tmp_path):
+    monkeypatch.setitem(response_cache._settings, "mode", "use")
+    monkeypatch.setitem(response_cache._settings, "directory", str(tmp_path))
+    model = CountingModel()
+    model.generate_response("prompt")
+
+    monkeypatch.setitem(response_cache._settings, "mode", "refresh")
+    assert model.generate_response("prompt") == ("prompt", "response 2")
+    monkeypatch.setitem(response_cache._settings, "mode", "use")
+    assert model.generate_response("prompt") == ("prompt", "response 2")
+
+
+def test_bypass_always_calls_the_model():
+    model = CountingModel()
+
+    model.generate_response("prompt")
+    model.generate_response("prompt")
+
+    assert model.calls == 2
+
+
+def test_async_requests_use_the_cache_off_the_event_loop(monkeypatch, tmp_path):
+    monkeypatch.setitem(response_cache._settings, "mode", "use")
+    monkeypatch.setitem(response_cache._settings, "directory", str(tmp_path))
+    threads = []
+
+    def recording(method):
+        def record(self, *args):
+            threads.append(threading.current_thread())
+            return method(self, *args)
+
+        return record
+
+    monkeypatch.setattr(DiskCache, "get", recording(DiskCache.get))
+    monkeypatch.setattr(DiskCache, "set", recording(DiskCache.set))
+    model = AsyncCountingModel()
+    stats = start_run()
+
+    async def respond_twice():
+        return await model.generate_response("prompt"), await model.generate_response("prompt")
+
+    assert asyncio.run(respond_twice()) == (("prompt", "response 1"), ("prompt", "response 1"))
+    assert model.calls == 1
+    assert stats.get("cache_hits") == 1
+    assert threads and threading.main_thread() not in threads
@@ -0,0 +1,49 @@
+import os
+
+from ai_feedback.helpers import template_registry
+
+
+def test_bundled_files_are_indexed_by_kind_and_name():
+    registered = template_registry.bundled("user", "code_lines")
+
+    assert registered is not None
+    assert "file_contents" in registered.placeholders
+    assert "code_lines" in template_registry.bundled_names("user")
+    assert template_registry.bundled("user", "no_such_prompt") is None
+
+
+def test_load_file_rereads_only_changed_files(tmp_path):
+    path = tmp_path / "prompt.md"
+    path.write_text("Review {file_contents}")
+    first = template_registry.load_file(path)
+
+    assert template_registry.load_file(path) is first
+    assert first.placeholders == frozenset({"file_contents"})
+
+    path.write_text("Review {file_references} carefully")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, first.mtime_ns + 1))
+    second = template_registry.load_file(path)
+
+    assert second is not first
+    assert second.placeholders == frozenset({"file_references"})
+
+
+def test_load_file_keeps_unparsable_templates(tmp_path):
+    path = tmp_path / "prompt.md"
+    path.write_text("A stray { brace")
+
+    registered = template_registry.load_file(path)
+
+    assert registered.content == "A stray { brace"
+    assert registered.segments is None
+
+
+def test_load_json_returns_a_copy(tmp_path):
+    path = tmp_path / "schema.json"
+    path.write_text('{"type": "object", "required": ["score"]}')
+
+    schema = template_registry.load_json(path)
+    schema["required"].append("comment")
+
+    assert template_registry.load_json(path) == {"type": "object", "required": ["score"]}
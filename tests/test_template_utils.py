@@ -0,0 +1,85 @@
+from pathlib import Path
+
+import pytest
+
+from ai_feedback.helpers import template_utils
+
+
+def test_parse_template_names_placeholders_once_per_template():
+    template = "Review {file_contents} with {file_references[0]} and {{literal}} {metadata.model}"
+
+    first = template_utils.parse_template(template)
+
+    assert first[1] == frozenset({"file_contents", "file_references", "metadata"})
+    assert template_utils.parse_template(template) is first
+
+
+def test_format_template_matches_str_format():
+    template = "{name!r:>10} has {count:{width}d} lines {{kept}}"
+    values = {"name": "a.py", "count": 7, "width": 4}
+
+    assert template_utils.format_template(template, values) == template.format(**values)
+    with pytest.raises(KeyError):
+        template_utils.format_template("{missing}", {})
+
+
+def test_iter_numbered_lines_keeps_head_and_tail_within_limits():
+    lines = [f"print({i})\n" for i in range(1, 101)]
+
+    rendered = "".join(template_utils.iter_numbered_lines(lines, "submission", "a.py", max_lines=10))
+
+    assert rendered.startswith('<submission filename="a.py">\n(Line 1) print(1)\n')
+    assert "(Line 5) print(5)" in rendered
+    assert "[... lines 6-95 omitted to stay within the file size limit ...]" in rendered
+    assert rendered.endswith("(Line 100) print(100)\n</submission>\n\n")
+    assert rendered.count("(Line ") == 10
+
+
+def test_format_file_numbers_the_selected_lines_as_in_the_whole_file(tmp_path):
+    path = tmp_path / "a.py"
+    path.write_text("".join(f"print({i})\n" for i in range(1, 21)))
+
+    rendered = template_utils._format_file_with_xml_tag(path, "submission", max_lines=4, line_range=(5, 14))
+
+    assert rendered == (
+        '<submission filename="a.py">\n(Line 5) print(5)\n(Line 6) print(6)\n'
+        "[... lines 7-12 omitted to stay within the file size limit ...]\n"
+        "(Line 13) print(13)\n(Line 14) print(14)\n</submission>\n\n"
+    )
+
+
+def test_diff_marks_changed_lines_and_collapses_unchanged_ones(tmp_path):
+    base = tmp_path / "starter.py"
+    base.write_text("".join(f"line_{i} = {i}\n" for i in range(1, 21)))
+    submission = tmp_path / "submission.py"
+    submission.write_text(base.read_text().replace("line_10 = 10", "line_10 = 100"))
+
+    rendered = template_utils._format_diff_with_xml_tag(submission, "submission", base, context=1)
+
+    assert "[... lines 1-8 unchanged from starter.py ...]" in rendered
+    assert "(Line 9)   line_9 = 9" in rendered
+    assert "- line_10 = 10" in rendered
+    assert "(Line 10) + line_10 = 100" in rendered
+    assert "[... lines 12-20 unchanged from starter.py ...]" in rendered
+
+
+def test_resolve_diff_base_prefers_the_starter(tmp_path):
+    starter = tmp_path / "starter.py"
+    starter.write_text("")
+    solution = tmp_path / "solution.py"
+
+    assert template_utils.resolve_diff_base("full", str(starter), solution) is None
+    assert template_utils.resolve_diff_base("diff", str(starter), solution) == starter
+    assert template_utils.resolve_diff_base("diff", None, solution) == solution
+    with pytest.raises(FileNotFoundError):
+        template_utils.resolve_diff_base("diff", str(tmp_path / "missing.py"), solution)
+
+
+def test_resolve_questions_expands_lists_and_all(tmp_path):
+    solution = tmp_path / "solution.txt"
+    solution.write_text("# Lab 1\n## Task 1\na\n### Task 1a\nb\n## Task 2, part one\nc\n## Notes\n")
+
+    assert template_utils.resolve_questions("Task 1", [solution]) is None
+    assert template_utils.resolve_questions("Task 1, Task 3, Task 1", [solution]) == ["Task 1", "Task 3"]
+    assert template_utils.resolve_questions("task 2, part one", [solution]) is None
+    assert template_utils.resolve_questions("all", [None, Path(solution)]) == ["Task 1", "Task 2, part one"]
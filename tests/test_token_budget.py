@@ -0,0 +1,92 @@
+import pytest
+
+from ai_feedback.helpers.run_stats import start_run
+from ai_feedback.helpers.token_budget import (
+    PromptTooLargeError,
+    TokenBudget,
+    estimate_tokens,
+    fit_prompt,
+    prompt_limit,
+)
+
+
+def _block(tag, filename, lines):
+    return f'<{tag} filename="{filename}">\n' + "\n".join(lines) + f"\n</{tag}>\n\n"
+
+
+def _prompt(submission_lines=40, solution_lines=40, test_lines=200):
+    submission = [f"(Line {i}) value_{i} = compute(value_{i - 1}, {i})" for i in range(1, submission_lines + 1)]
+    solution = [f"(Line {i}) expected_{i} = compute(expected_{i - 1})" for i in range(1, solution_lines + 1)]
+    test_output = [f"test_case_{i} passed in 0.{i:03d}s" for i in range(test_lines)]
+    test_output += ['File "submission.py", line 30, in test_case', "AssertionError: values differ"]
+    return (
+        "Review the submission.\n\n"
+        + _block("submission", "submission.py", submission)
+        + _block("solution", "solution.py", solution)
+        + _block("test_output", "test_output.txt", test_output)
+    )
+
+
+@pytest.fixture
+def run_stats():
+    return start_run()
+
+
+def test_estimate_tokens_counts_words_digits_and_punctuation():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("hello world") == 2
+    assert estimate_tokens("123456") == 2
+    assert estimate_tokens("a.b") == 3
+    assert estimate_tokens("line\nline") == 3
+    assert estimate_tokens("hello world", token_factor=1.5) == 3
+
+
+def test_prompt_limit_follows_model_options():
+    budget = TokenBudget(8192, output_reserve=1024)
+
+    assert prompt_limit(budget) == 7168
+    assert prompt_limit(budget, {"num_ctx": "4096", "max_tokens": 96}) == 4000
+    assert prompt_limit(TokenBudget(None)) is None
+
+
+def test_fit_prompt_leaves_prompts_that_fit(run_stats):
+    prompt = _prompt()
+
+    assert fit_prompt(prompt, "", TokenBudget(None)) == prompt
+    assert fit_prompt(prompt, "", TokenBudget(100_000)) == prompt
+    assert run_stats.get("estimated_prompt_tokens") == estimate_tokens(prompt) + 12
+
+
+def test_fit_prompt_truncates_test_output_first(run_stats):
+    prompt = _prompt()
+    limit = estimate_tokens(prompt) - 1500
+
+    shrunk = fit_prompt(prompt, "", TokenBudget(limit, output_reserve=0))
+
+    assert "AssertionError: values differ" in shrunk
+    assert "test_case_0 passed" in shrunk
+    assert "test_case_100 passed" not in shrunk
+    assert "(Line 40) expected_40" in shrunk
+    assert run_stats.get("prompt_shrunk") == "test output truncated"
+
+
+def test_fit_prompt_then_omits_solution_and_trims_submission(run_stats):
+    prompt = _prompt(submission_lines=400)
+    limit = estimate_tokens(prompt) // 3
+
+    shrunk = fit_prompt(prompt, "", TokenBudget(limit, output_reserve=0))
+
+    assert "[Omitted to fit the model's context window.]" in shrunk
+    assert "expected_1 " not in shrunk
+    # The lines the traceback refers to are kept, with their numbers
+    assert "(Line 30) value_30" in shrunk
+    assert "(Line 200) value_200" not in shrunk
+    assert run_stats.get("prompt_shrunk") == "test output truncated, solution omitted, submission trimmed"
+
+
+def test_fit_prompt_with_error_policy_raises():
+    prompt = _prompt()
+
+    with pytest.raises(PromptTooLargeError):
+        fit_prompt(prompt, "", TokenBudget(100, output_reserve=0), policy="error")
+    assert fit_prompt(prompt, "", TokenBudget(100, output_reserve=0), policy="off") == prompt